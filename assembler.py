@@ -1,8 +1,17 @@
-import struct
+import os
 import sys
 import re
+import shutil
+import hashlib
+import argparse
+import numpy as np
 from typing import Dict, List, Tuple
 
+# print every line as it is assembled (--verbose)
+VERBOSE = False
+# assembled binaries keyed by source hash (--cache), ASM_CACHE_DIR overrides
+CACHE_DIR = os.environ.get("ASM_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "tc-kernels", "asm"))
+
 opcode_map = {
     "add.i": 0x33, "sub.i": 0x33, "xor.i": 0x33, "or.i": 0x33, "and.i": 0x33,
     "sll.i": 0x33, "srl.i": 0x33, "sra.i": 0x33, "slt.i": 0x33, "sltu.i": 0x33, "mul.i": 0x33, "mov.i": 0x33,
@@ -10,7 +19,9 @@ opcode_map = {
     "slli.i": 0x13, "srli.i": 0x13, "srai.i": 0x13, "slti.i": 0x13, "sltui.i": 0x13,
     "lw.i": 0x03, "sw.i": 0x23, "beq.i": 0x63, "bne.i": 0x63, "blt.i": 0x63, "bge.i": 0x63,
     "jal": 0x6F, "jalr": 0x67, "lui.i": 0x37,
-    "ld.m": 0x43, "st.m": 0x53, "gemm.m": 0x73 #based on the remaining opcodes after riscv-i
+    "ld.m": 0x47, "st.m": 0x57, "gemm.m": 0x77, # isa.md, custom opcodes after riscv-i
+    "dma.ld": 0x0B, "dma.st": 0x0B, "dma.wait": 0x0B, "dma.poll": 0x0B, # riscv custom-0
+    "barrier": 0x73, "core.id": 0x73, "core.count": 0x73, # riscv system
 }
 
 register_map = {
@@ -24,19 +35,25 @@ register_map = {
 }
 
 def parse_file(filename):
-    instructions = []
     with open(filename, 'r') as file:
-        for line in file:
-            #Removing comments and empty lines
-            line = line.split('//')[0].strip()
-            if not line:
-                continue
-            instructions.append(line)
+        return parse_source(file.read())
+
+def parse_source(text):
+    instructions = []
+    for line in text.splitlines():
+        #Removing comments and empty lines
+        line = line.split('//')[0].strip()
+        if not line:
+            continue
+        instructions.append(line)
     return instructions
 
 #helper
 def get_register_binary(reg):
-    return register_map.get(reg, -1)
+    try:
+        return register_map[reg]
+    except KeyError:
+        raise ValueError(f"unknown register '{reg}'") from None
 
 #R-type
 def encode_r_type(opcode, funct3, funct7, rd, rs1, rs2):
@@ -74,9 +91,6 @@ def encode_b_type(opcode, funct3, rs1, rs2, imm):
     
     imm_bin = imm & 0x1FFF  # Immediate- 13 bits
 
-    if imm < 0:
-        imm = (1 << 13) + imm
-
     imm_12 = (imm_bin >> 12) & 0x1
     imm_10_5 = (imm_bin >> 5) & 0x3F
     imm_4_1 = (imm_bin >> 1) & 0xF
@@ -93,7 +107,7 @@ def encode_u_type(opcode, rd, imm):
 
 def encode_uj_type(opcode, rd, imm):
     rd_bin = get_register_binary(rd)
-    imm_bin = imm & 0xFFFFF  # Immediate-20 bits (signed)
+    imm_bin = imm & 0x1FFFFF  # Immediate-21 bits (signed)
 
     imm_20 = (imm_bin >> 20) & 0x1
     imm_10_1 = (imm_bin >> 1) & 0x3FF
@@ -103,9 +117,14 @@ def encode_uj_type(opcode, rd, imm):
     machine_code = (imm_20 << 31) | (imm_19_12 << 12) | (imm_11 << 20) | (imm_10_1 << 21) | (rd_bin << 7) | opcode
     return machine_code
 
-def encode_m_type(opcode, rd, rs1, rs2, imm):
+# M-type: md, base rs1, row stride register, 11 bit signed byte offset
+def encode_m_type(opcode, rd, rs1, stride, imm):
+    rd_bin = get_register_binary(rd)
+    rs1_bin = get_register_binary(rs1)
+    stride_bin = get_register_binary(stride)
+    imm_bin = imm & 0x7FF  # Immediate- 11 bits
 
-    machine_code = encode_i_type("addi.i", 0, 0, 0, 0)
+    machine_code = (rd_bin << 28) | (rs1_bin << 23) | (stride_bin << 18) | (imm_bin << 7) | opcode
     return machine_code
 
 def encode_mm_type(opcode, rd, ra, rb, rc):
@@ -117,187 +136,487 @@ def encode_mm_type(opcode, rd, ra, rb, rc):
     machine_code = (rd_bin << 28) | (ra_bin << 24) | (rb_bin << 20) | (rc_bin << 16) | opcode
     return machine_code
 
+# D-type: md / base / stride registers where M-type has them, 4 bit tag, funct2, scalar rd
+def encode_d_type(opcode, funct2, tag, md="m0", rs1="x0", stride="x0", rd="x0"):
+    md_bin = get_register_binary(md)
+    rs1_bin = get_register_binary(rs1)
+    stride_bin = get_register_binary(stride)
+    rd_bin = get_register_binary(rd)
+
+    machine_code = (md_bin << 28) | (rs1_bin << 23) | (stride_bin << 18) | (tag << 14) | (funct2 << 12) | (rd_bin << 7) | opcode
+    return machine_code
+
+# tokenizer: mnemonic and operands split on commas and whitespace, memory operands
+# are `imm(xN)` for words and `imm[xN]` for matrices
+MEM_OPERAND = re.compile(r'(?P<imm>[-+]?\w+)(?:\((?P<word>x\d+)\)|\[(?P<tile>x\d+)\])$')
+
+def tokenize(instruction: str) -> List[str]:
+    return instruction.replace(',', ' ').split()
+
+def expect(tokens, count, syntax):
+    if len(tokens) != count + 1:
+        raise ValueError(f"'{' '.join(tokens)}' takes {count} operands: {tokens[0]} {syntax}")
+
+# I / S immediates are sign extended 12 bit values, shift amounts 5 bits
+def immediate(tokens, imm: int, lo: int = -2048, hi: int = 2047) -> int:
+    if not lo <= imm <= hi:
+        raise ValueError(f"immediate {imm} out of range [{lo}, {hi}] in '{' '.join(tokens)}'")
+    return imm
+
+# imm(xN) / imm[xN] -> (rs1, imm)
+def memory_operand(tokens, operand: str, bracket: str):
+    match = MEM_OPERAND.match(operand)
+    if not match or not match.group(bracket):
+        form = "IMM(xBASE)" if bracket == "word" else "IMM[xBASE]"
+        raise ValueError(f"malformed memory operand '{operand}' in '{' '.join(tokens)}', expected {form}")
+    return match.group(bracket), int(match.group('imm'), 0)
+
+# funct fields per mnemonic
+r_funct = {
+    "add.i": (0x0, 0x00), "sub.i": (0x0, 0x20), "xor.i": (0x4, 0x00), "or.i": (0x6, 0x00),
+    "and.i": (0x7, 0x00), "sll.i": (0x1, 0x00), "srl.i": (0x5, 0x00), "sra.i": (0x5, 0x20),
+    "slt.i": (0x2, 0x00), "sltu.i": (0x3, 0x00), "mul.i": (0x0, 0x01),
+}
+i_funct = {
+    "addi.i": 0x0, "xori.i": 0x4, "ori.i": 0x6, "andi.i": 0x7, "slli.i": 0x1,
+    "srli.i": 0x5, "srai.i": 0x5, "slti.i": 0x2, "sltui.i": 0x3, "jalr": 0x0,
+}
+b_funct = {"beq.i": 0x0, "bne.i": 0x1, "blt.i": 0x4, "bge.i": 0x5}
+d_funct = {"dma.ld": 0x0, "dma.st": 0x1, "dma.wait": 0x2, "dma.poll": 0x3}
+sys_funct = {"barrier": 0x0, "core.id": 0x1, "core.count": 0x2}
+
+# per-format encoders: (tokens, label_map, current_address) -> machine code
+def asm_r(t, labels, index):
+    expect(t, 3, "rd, rs1, rs2")
+    funct3, funct7 = r_funct[t[0]]
+    return encode_r_type(opcode_map[t[0]], funct3, funct7, t[1], t[2], t[3])
+
+# shifts by an immediate: imm[4:0] is the amount, imm[11:5] = 0x20 selects srai
+shift_funct7 = {"slli.i": 0x00, "srli.i": 0x00, "srai.i": 0x20}
+
+def asm_i(t, labels, index):
+    expect(t, 3, "rd, rs1, imm")
+    if t[0] in shift_funct7:
+        imm = immediate(t, int(t[3], 0), 0, 31) | shift_funct7[t[0]] << 5
+    else:
+        imm = immediate(t, int(t[3], 0))
+    return encode_i_type(opcode_map[t[0]], i_funct[t[0]], t[1], t[2], imm)
+
+def asm_lw(t, labels, index):
+    expect(t, 2, "rd, imm(rs1)")
+    rs1, imm = memory_operand(t, t[2], 'word')
+    return encode_i_type(opcode_map[t[0]], 0x2, t[1], rs1, immediate(t, imm))
+
+def asm_sw(t, labels, index):
+    expect(t, 2, "rs2, imm(rs1)")
+    rs1, imm = memory_operand(t, t[2], 'word')
+    return encode_s_type(opcode_map[t[0]], 0x2, rs1, t[1], immediate(t, imm))
+
+def asm_b(t, labels, index):
+    expect(t, 3, "rs1, rs2, label")
+    imm = calculate_offset(labels, t[3], index) if t[3] in labels else int(t[3], 0)
+    imm = immediate(t, imm, -4096, 4094)
+    return encode_b_type(opcode_map[t[0]], b_funct[t[0]], t[1], t[2], imm)
+
+def asm_lui(t, labels, index):
+    expect(t, 2, "rd, imm")
+    return encode_u_type(opcode_map[t[0]], t[1], immediate(t, int(t[2], 0), 0, 0xFFFFF))
+
+def asm_jal(t, labels, index):
+    expect(t, 2, "rd, label")
+    imm = calculate_offset(labels, t[2], index) if t[2] in labels else int(t[2], 0)
+    imm = immediate(t, imm, -(1 << 20), (1 << 20) - 2)
+    return encode_uj_type(opcode_map[t[0]], t[1], imm)
+
+# ld.m md, x_stride, imm[x_base]: row r of the tile is at base + imm + r * stride
+def asm_m(t, labels, index):
+    expect(t, 3, "mN, xSTRIDE, IMM[xBASE]")
+    rs1, imm = memory_operand(t, t[3], 'tile')
+    return encode_m_type(opcode_map[t[0]], t[1], rs1, t[2], immediate(t, imm, -1024, 1023))
+
+def asm_gemm(t, labels, index):
+    expect(t, 4, "md, ma, mb, mc")
+    return encode_mm_type(opcode_map[t[0]], t[1], t[2], t[3], t[4])
+
+# dma.ld md, x_stride, x_base, tag: queue a tile transfer, rows as in ld.m
+def asm_dma(t, labels, index):
+    expect(t, 4, "mN, xSTRIDE, xBASE, TAG")
+    return encode_d_type(opcode_map[t[0]], d_funct[t[0]], immediate(t, int(t[4], 0), 0, 15), t[1], t[3], t[2])
+
+def asm_dma_wait(t, labels, index):
+    expect(t, 1, "TAG")
+    return encode_d_type(opcode_map[t[0]], d_funct[t[0]], immediate(t, int(t[1], 0), 0, 15))
+
+def asm_dma_poll(t, labels, index):
+    expect(t, 2, "rd, TAG")
+    return encode_d_type(opcode_map[t[0]], d_funct[t[0]], immediate(t, int(t[2], 0), 0, 15), rd=t[1])
+
+def asm_barrier(t, labels, index):
+    expect(t, 0, "")
+    return encode_i_type(opcode_map[t[0]], sys_funct[t[0]], "x0", "x0", 0)
+
+# core.id rd / core.count rd
+def asm_core(t, labels, index):
+    expect(t, 1, "rd")
+    return encode_i_type(opcode_map[t[0]], sys_funct[t[0]], t[1], "x0", 0)
+
+def asm_halt(t, labels, index):
+    return 0xFFFFFFFF
+
+dispatch = {
+    **{mnemonic: asm_r for mnemonic in r_funct},
+    **{mnemonic: asm_i for mnemonic in i_funct},
+    **{mnemonic: asm_b for mnemonic in b_funct},
+    "lw.i": asm_lw, "sw.i": asm_sw, "lui.i": asm_lui, "jal": asm_jal,
+    "ld.m": asm_m, "st.m": asm_m, "gemm.m": asm_gemm, "halt": asm_halt,
+    "dma.ld": asm_dma, "dma.st": asm_dma, "dma.wait": asm_dma_wait, "dma.poll": asm_dma_poll,
+    "barrier": asm_barrier, "core.id": asm_core, "core.count": asm_core,
+}
+
+def assemble_tokens(tokens, label_map, current_address) -> int:
+    handler = dispatch.get(tokens[0])
+    if handler is None:
+        raise ValueError(f"unknown instruction '{tokens[0]}'")
+    return handler(tokens, label_map, current_address)
+
 def handle_instruction(instruction, label_map, current_address):
-    parts = instruction.split()
-    if not parts:  # Skip empty or invalid instructions
+    tokens = tokenize(instruction)
+    if not tokens:  # Skip empty or invalid instructions
         return []
-    instr = parts[0]
-    print("assembling instruction: ", instruction)
-    if instr in ["halt"]:
-        return [0xFFFFFFFF]
-    #pseudo instr
-    if instr in ["push, pop, li, nop, mov.i"] :
-        pseudo_expansion = handle_pseudo_instruction(instruction)
-        if len(pseudo_expansion) == 1 and isinstance(pseudo_expansion[0], int):
-            return [pseudo_expansion[0]]
-
-        elif len(pseudo_expansion) > 1 or pseudo_expansion[0] != instruction:
-        # If it was expanded, handle each real instruction from the expansion
-            machine_codes = []
-            for instr in pseudo_expansion:
-                machine_codes.extend(handle_instruction(instr, label_map, current_address))
-                current_address += 1
-            return machine_codes
-        
-    if instr in ["add.i", "sub.i", "xor.i", "or.i", "and.i", "sll.i", "srl.i", "sra.i", "slt.i", "sltu.i", "mul.i", "mov.i"]:
-        rd, rs1, rs2 = parts[1].strip(','), parts[2].strip(','), parts[3]
-        funct3, funct7 = 0, 0 
-        if instr == "add.i": funct3, funct7 = 0x0, 0x00
-        elif instr == "sub.i": funct3, funct7 = 0x0, 0x20
-        elif instr == "xor.i": funct3, funct7 = 0x4, 0x00
-        elif instr == "or.i": funct3, funct7 = 0x6, 0x00
-        elif instr == "and.i": funct3, funct7 = 0x7, 0x00
-        elif instr == "sll.i": funct3, funct7 = 0x1, 0x00
-        elif instr == "srl.i": funct3, funct7 = 0x5, 0x00
-        elif instr == "sra.i": funct3, funct7 = 0x5, 0x20
-        elif instr == "slt.i": funct3, funct7 = 0x2, 0x00
-        elif instr == "sltu.i": funct3, funct7 = 0x3, 0x00
-        elif instr == "mul.i": funct3, funct7 = 0x0, 0x01
-        elif instr == "mov.i": funct3, funct7 = 0x0, 0x00
-        return [encode_r_type(opcode_map[instr], funct3, funct7, rd, rs1, rs2)]
-
-    elif instr in ["addi.i", "xori.i", "ori.i", "andi.i", "slli.i", "srli.i", "srai.i", "slti.i", "sltui.i", "jalr"]:
-        rd, rs1, imm = parts[1].strip(','), parts[2].strip(','), int(parts[3], 0)
-        funct3 = 0 
-        if instr == "addi.i": funct3 = 0x0
-        elif instr == "xori.i": funct3 = 0x4
-        elif instr == "ori.i": funct3 = 0x6
-        elif instr == "andi.i": funct3 = 0x7
-        elif instr == "slli.i": funct3 = 0x1
-        elif instr == "srli.i": funct3 = 0x5
-        elif instr == "srai.i": funct3 = 0x5
-        elif instr == "slti.i": funct3 = 0x2
-        elif instr == "sltui.i": funct3 = 0x3
-        elif instr == "jalr": funct3 = 0x0
-        return [encode_i_type(opcode_map[instr], funct3, rd, rs1, imm)]
-
-    elif instr == "sw.i":
-        match = re.search(r'sw.i\s+x(?P<rs2>\d+),\s*(?P<imm>[-]?\d+)\(x(?P<rs1>\d+)\)', instruction)
-        if match:
-            rs2 = f"x{match.group('rs2')}"
-            rs1 = f"x{match.group('rs1')}"
-            imm = int(match.group('imm'), 0)
-        funct3 = 0x2
-        return [encode_s_type(opcode_map[instr], funct3, rs1, rs2, imm)]
-    
-    elif instr == "lw.i":
-        match = re.search(r'lw.i\s+x(?P<rd>\d+),\s*(?P<imm>[-]?\d+)\(x(?P<rs1>\d+)\)', instruction)
-        if match:
-            rd = f"x{match.group('rd')}"
-            rs1 = f"x{match.group('rs1')}"
-            imm = int(match.group('imm'), 0)
-        funct3 = 0x2
-        return [encode_i_type(opcode_map[instr], funct3, rd, rs1, imm)]
-
-    elif instr in ["beq.i", "bne.i", "blt.i", "bge.i"]:
-        rs1, rs2, label = parts[1].strip(','), parts[2].strip(','), parts[3]
-        imm = calculate_offset(label_map, label, current_address)
-        funct3 = 0
-        if instr == "beq.i": funct3 = 0x0
-        elif instr == "bne.i": funct3 = 0x1
-        elif instr == "blt.i": funct3 = 0x4
-        elif instr == "bge.i": funct3 = 0x5
-        return [encode_b_type(opcode_map[instr], funct3, rs1, rs2, imm)]
-
-    elif instr == "lui.i":
-        rd, imm = parts[1].strip(','), int(parts[2], 0)
-        return [encode_u_type(opcode_map[instr], rd, imm)]
-
-    elif instr == "jal":
-        rd, imm = parts[1].strip(','), int(parts[2])
-        return [encode_uj_type(opcode_map[instr], rd, imm)]
-
-    elif instr in {"ld.m", "st.m"}:
-        match = re.search(r'm(P?<rd>\d+), x(P?<rs1>\d+), (P?<imm>\d+)\[x(P?<rs2>\d+)\]', instruction)
-        encode_m_type(opcode_map[instr], match.groups(rd), match.groups(rs1), match.groups(rs2), match.groups(imm))
-
-    elif instr in ["ld.m", "st.m", "gemm.m"]:
-        rd, ra, rb, rc = parts[1].strip(','), parts[2].strip(','), parts[3].strip(','), parts[4]
-        return [encode_mm_type(opcode_map[instr], rd, ra, rb, rc)]
-
-    return [0]
-
-def create_label_map(instructions: List[str]) -> Tuple[List[str], Dict[str, int]]:
-    label_map = {}
-    mem_mapped_instructions = []
-    current_address = 0
-
-    for instruction in instructions:
-        if ':' in instruction:
-            # Label found
-            label, *rest = instruction.split(':')
-            label_map[label.strip()] = current_address
-            if rest and rest[0].strip():
-                instruction = rest[0].strip()
-                mem_mapped_instructions.append(instruction)
-                current_address += 1
-        elif instruction.strip():  # add non-empty instructions
-            mem_mapped_instructions.append(instruction.strip())
-            current_address += 1
-
-    return mem_mapped_instructions, label_map
+    if VERBOSE: print("assembling instruction: ", instruction)
+    return [assemble_tokens(tokens, label_map, current_address)]
 
+# pc-relative byte offset, label_map holds byte addresses and current_address is an instruction index
 def calculate_offset(label_map: Dict[str, int], label: str, current_address: int) -> int:
     if label in label_map:
-        return label_map[label] - current_address - 1
+        return label_map[label] - current_address * 4
     else:
         raise ValueError(f"Label '{label}' not found in label map.")
 
-def handle_pseudo_instruction(instr: str) -> List[int]:
-    parts = instr.split()
-    pseudo = parts[0]
-
-    if pseudo == "li":
-        rd, imm = parts[1].strip(','), int(parts[2], 0)
-        if -2048 <= imm <= 2047:
-            return [f"addi.i {rd}, x0, {imm}"]
-        else:
-            upper = (imm + (1 << 11)) >> 12
-            lower = imm & 0xFFF
-            return [f"lui.i {rd}, {upper}", f"addi.i {rd}, {rd}, {lower}"]
-
+# (upper, lower) halves for lui + addi, the sign extended lower half is in
+# [-2048, 2047] and the upper half rounds up to make up for it
+def split_imm(value: int) -> Tuple[int, int]:
+    value &= 0xFFFFFFFF
+    lower = ((value & 0xFFF) ^ 0x800) - 0x800
+    return ((value - lower) >> 12) & 0xFFFFF, lower
+
+# pseudo instruction expanders: operands -> real instructions
+def expand_li(ops):
+    rd = ops[0]
+    upper, lower = split_imm(int(ops[1], 0))
+    if not upper:
+        return [f"addi.i {rd}, x0, {lower}"]
+    elif not lower:
+        return [f"lui.i {rd}, {upper}"]
+    else:
+        return [f"lui.i {rd}, {upper}", f"addi.i {rd}, {rd}, {lower}"]
+
+pseudo_ops = {
+    "li":    expand_li,
+    "li.i":  expand_li,
+    "la":    expand_li,
+    "mv":    lambda ops: [f"addi.i {ops[0]}, {ops[1]}, 0"],
+    "mv.i":  lambda ops: [f"addi.i {ops[0]}, {ops[1]}, 0"],
+    "mov.i": lambda ops: [f"addi.i {ops[0]}, {ops[1]}, 0"],
+    "ret":   lambda ops: ["jalr x0, x1, 0"],
+    "nop":   lambda ops: ["addi.i x0, x0, 0"],
+    **{b: (lambda b: lambda ops: [f"{b}.i {ops[0]}, {ops[1]}, {ops[2]}"])(b) for b in ["beq", "bne", "blt", "bge"]},
     # x2 should be allocated as sp
-    elif pseudo == "push":
-        rd = parts[1]
-        return [f"addi.i x2, x2, -4", f"sw.i {rd}, 0(x2)"]
-
-    elif pseudo == "pop":
-        rd = parts[1]
-        return [f"lw.i {rd}, 0(x2)", f"addi.i x2, x2, 4"]
+    "push":  lambda ops: ["addi.i x2, x2, -4", f"sw.i {ops[0]}, 0(x2)"],
+    "pop":   lambda ops: [f"lw.i {ops[0]}, 0(x2)", "addi.i x2, x2, 4"],
+}
 
-    return [instr]
+def handle_pseudo_instruction(instr: str) -> List[str]:
+    tokens = tokenize(instr)
+    expand = pseudo_ops.get(tokens[0].lower())
+    return expand(tokens[1:]) if expand is not None else [instr]
+
+# mnemonics whose encoding depends on label addresses, patched once all labels are known,
+# with the relocation kind used when the label is in another object
+# - `li rd, label` / `la rd, label` always take lui + addi, the address is only known at the end
+label_ops = {**{b: "branch" for b in b_funct}, "jal": "jal", "li": "li"}
+address_ops = {"li", "li.i", "la"}
+
+def is_number(token: str) -> bool:
+    try:
+        int(token, 0)
+        return True
+    except ValueError:
+        return False
+
+def align(n: int, alignment: int) -> int:
+    return -(-n // alignment) * alignment
+
+# lui rd, upper; addi rd, rd, lower
+def encode_address(rd: str, address: int) -> List[int]:
+    upper, lower = split_imm(address)
+    return [encode_u_type(opcode_map["lui.i"], rd, upper),
+            encode_i_type(opcode_map["addi.i"], i_funct["addi.i"], rd, rd, lower)]
+
+# data directives: (operands, source directory) -> bytes
+# - .incbin copies a file as it is, or the array of a .npy (stored little endian)
+def include_path(ops: str, source_dir: str) -> str:
+    return os.path.join(source_dir, ops.strip().strip('"'))
+
+def incbin(ops: str, source_dir: str):
+    path = include_path(ops, source_dir)
+    if not path.endswith(".npy"):
+        with open(path, 'rb') as f:
+            return f.read()
+    array = np.load(path, mmap_mode='r')
+    array = array.astype(array.dtype.newbyteorder('<'), copy=False)
+    return memoryview(np.ascontiguousarray(array)).cast('B')
+
+data_directives = {
+    ".word":   lambda ops, d: np.array([int(v, 0) & 0xFFFFFFFF for v in tokenize(ops)], dtype='<u4').tobytes(),
+    ".half":   lambda ops, d: np.array([int(v, 0) & 0xFFFF for v in tokenize(ops)], dtype='<u2').tobytes(),
+    ".fp16":   lambda ops, d: np.array([float(v) for v in tokenize(ops)], dtype='<f2').tobytes(),
+    ".incbin": incbin,
+}
 
-def assemble_instructions(instructions, label_map: Dict[int, str]):
-    machine_codes = []
-    for i,instr in enumerate(instructions):
-        try:
-            codes = handle_instruction(instr, label_map, i)
+INCBIN = re.compile(r'(?:[A-Za-z_.$][\w.$]*\s*:\s*)?\.incbin\s+(.+)$')
+
+# files pulled in by .incbin, they are part of the cache key
+def included_files(instructions: List[str], source_dir: str) -> List[str]:
+    return [include_path(m.group(1), source_dir) for m in map(INCBIN.match, instructions) if m]
+
+# one assembled source
+# - text: instruction words, data: the .data section
+# - symbols: label -> (section, byte offset in the section)
+# - relocations: (word index, kind, label) for linker.py
+# - the flat image is the text followed by the data, which starts at the strictest
+#   .align used in it (at least a word)
+class Assembly:
+    def __init__(self):
+        self.text = []
+        self.data = bytearray()
+        self.data_align = 4
+        self.symbols = {}
+        self.relocations = []
+
+    def data_base(self) -> int:
+        return align(4 * len(self.text), self.data_align)
+
+    # label -> byte offset from the start of the image
+    def labels(self) -> Dict[str, int]:
+        data = self.data_base()
+        return {label: offset + (data if section == "data" else 0) for label, (section, offset) in self.symbols.items()}
+
+    def image(self) -> bytes:
+        text = np.array(self.text, dtype='<u4').tobytes()
+        return b"".join([text, bytes(self.data_base() - len(text)), self.data])
+
+LABEL = re.compile(r'\s*([A-Za-z_.$][\w.$]*)\s*:(.*)$')
+
+# one pass over source lines -> Assembly
+# - lines without label references are encoded once per distinct text, unrolled
+#   kernels repeat the same instruction many times
+# - branches, jumps and label addresses get placeholders and are patched at the end,
+#   label addresses are absolute for an image loaded at `base`
+# - relocatable leaves references to labels not defined here, and all label
+#   addresses, to the linker with a zero placeholder instead of failing
+# - .text / .data switch sections, .word and .align (.align n is 2^n bytes, nops in
+#   .text) work in both, .half / .fp16 / .incbin only in .data
+def assemble_lines(instructions: List[str], relocatable: bool = False, base: int = 0, source_dir: str = ".") -> Assembly:
+    asm = Assembly()
+    machine_codes, data = asm.text, asm.data
+    section = "text"
+    fixups = [] # (index, tokens, source line)
+    memo = {}
+    for line, instruction in enumerate(instructions):
+        if ':' in instruction:
+            match = LABEL.match(instruction)
+            if match:
+                # Label found
+                asm.symbols[match.group(1)] = (section, 4 * len(machine_codes) if section == "text" else len(data))
+                instruction = match.group(2).strip()
+                if not instruction: continue
+        if instruction[0] == '.':
+            try:
+                directive, ops = (instruction.split(None, 1) + [""])[:2]
+                if directive in (".text", ".data"):
+                    section = directive[1:]
+                elif directive == ".align":
+                    alignment = 1 << int(ops, 0)
+                    if section == "text":
+                        machine_codes.extend([encode_i_type(opcode_map["addi.i"], 0, "x0", "x0", 0)] * (align(4 * len(machine_codes), alignment) // 4 - len(machine_codes)))
+                    else:
+                        data.extend(bytes(align(len(data), alignment) - len(data)))
+                        asm.data_align = max(asm.data_align, alignment)
+                elif directive not in data_directives:
+                    raise ValueError(f"unknown directive '{directive}'")
+                elif section == "data":
+                    data += data_directives[directive](ops, source_dir)
+                elif directive == ".word":
+                    machine_codes.extend(np.frombuffer(data_directives[directive](ops, source_dir), dtype='<u4').tolist())
+                else:
+                    raise ValueError(f"'{directive}' is only allowed in .data")
+            except Exception as e:
+                print(f"\033[91mException on line {line}:\033[0m")
+                raise e
+            continue
+        codes = memo.get(instruction)
+        if codes is not None:
             machine_codes.extend(codes)
+            continue
+        tokens = tokenize(instruction)
+        if tokens[0].lower() in address_ops and len(tokens) == 3 and not is_number(tokens[2]):
+            fixups.append((len(machine_codes), ["li", tokens[1], tokens[2]], line))
+            machine_codes.extend([0, 0])
+            continue
+        expand = pseudo_ops.get(tokens[0].lower())
+        expansion = [tokenize(i) for i in expand(tokens[1:])] if expand is not None else [tokens]
+        codes, cacheable = [], True
+        for t in expansion:
+            if VERBOSE: print("assembling instruction: ", " ".join(t))
+            if t[0] in label_ops:
+                fixups.append((len(machine_codes) + len(codes), t, line))
+                codes.append(0)
+                cacheable = False
+            else:
+                try:
+                    codes.append(assemble_tokens(t, {}, 0))
+                except Exception as e:
+                    print(f"\033[91mException on line {line}:\033[0m")
+                    raise e
+        if cacheable: memo[instruction] = codes
+        machine_codes.extend(codes)
+
+    label_map = asm.labels()
+    for index, t, line in fixups:
+        kind, label = label_ops[t[0]], t[-1]
+        if relocatable and not is_number(label) and (kind == "li" or label not in label_map):
+            asm.relocations.append((index, kind, label))
+            t = t[:-1] + ["0"]
+        try:
+            if kind == "li":
+                address = int(label, 0) if is_number(label) else base + calculate_offset(label_map, label, 0)
+                machine_codes[index: index + 2] = encode_address(t[1], address)
+            else:
+                machine_codes[index] = assemble_tokens(t, label_map, index)
         except Exception as e:
-            print(f"\033[91mException on line {i}:\033[0m")
+            print(f"\033[91mException on line {line}:\033[0m")
             raise e
-            
-    return machine_codes
-
-def write_machine_code(filename, machine_codes):
+    return asm
+
+# `address label` per line, byte addresses in hex relative to the start of the binary
+def write_symbols(filename, label_map: Dict[str, int]):
+    with open(filename, 'w') as f:
+        for label, address in sorted(label_map.items(), key=lambda kv: kv[1]):
+            f.write(f"{address:08x} {label}\n")
+
+# relocatable objects: text, data, every label as a symbol and the references left
+# to the linker, stored as one .npz (linker.py combines them)
+def write_object(filename, asm: Assembly):
+    names = sorted(asm.symbols, key=lambda n: (asm.symbols[n][0] != "text", asm.symbols[n][1]))
     with open(filename, 'wb') as f:
-        for code in machine_codes:
-            f.write(struct.pack('<I', code)) #because it needs to be raw bytes and not integers
-
-def assemble_file(input_file, output_file):
-    instructions = parse_file(input_file)
-    # clean out aesthetic lines
-    # instructions = [i for i in instructions if any(i.find(op) >= 0 for op in opcode_map) or ":" in i]
-    # instructions = [i[:i.find("//")] if i.find("//") >= 0 else i for i in instructions]
+        np.savez(f,
+                 words=np.array(asm.text, dtype='<u4'),
+                 data=np.frombuffer(asm.data, dtype=np.uint8),
+                 data_align=np.array(asm.data_align, dtype=np.int64),
+                 symbols=np.array(names, dtype=str),
+                 sections=np.array([asm.symbols[n][0] for n in names], dtype=str),
+                 addresses=np.array([asm.symbols[n][1] for n in names], dtype=np.int64),
+                 reloc_index=np.array([r[0] for r in asm.relocations], dtype=np.int64),
+                 reloc_kind=np.array([r[1] for r in asm.relocations], dtype=str),
+                 reloc_symbol=np.array([r[2] for r in asm.relocations], dtype=str))
+
+def read_object(filename) -> Assembly:
+    asm = Assembly()
+    with np.load(filename) as obj:
+        asm.text = obj['words'].tolist()
+        asm.data = bytearray(obj['data'].tobytes())
+        asm.data_align = int(obj['data_align'])
+        asm.symbols = {str(n): (str(s), int(a)) for n, s, a in zip(obj['symbols'], obj['sections'], obj['addresses'])}
+        asm.relocations = [(int(i), str(k), str(s)) for i, k, s in zip(obj['reloc_index'], obj['reloc_kind'], obj['reloc_symbol'])]
+    return asm
+
+# cache key: the source, the files it includes, the load address and the assembler
+# itself, so encoder changes invalidate old binaries (read once per process, it is
+# the code that is running)
+SELF = None
+
+def source_digest(source: bytes, included: List[str] = (), base: int = 0) -> str:
+    global SELF
+    if SELF is None:
+        with open(__file__, 'rb') as f:
+            SELF = f.read()
+    digest = hashlib.sha1(SELF + b"\0" + source + f"\0{base:#x}".encode())
+    for path in included:
+        with open(path, 'rb') as f:
+            digest.update(b"\0" + f.read())
+    return digest.hexdigest()
+
+# in-process assembly of source text into a binary image loaded at `base`, no files
+# written; .incbin paths are relative to source_dir
+def assemble(source: str, base: int = 0, source_dir: str = ".") -> bytes:
+    return assemble_lines(parse_source(source), base=base, source_dir=source_dir).image()
+
+def read_source(input_file):
+    with open(input_file, 'rb') as f:
+        source = f.read()
+    instructions = parse_source(source.decode())
+    source_dir = os.path.dirname(os.path.abspath(input_file))
+    return source, instructions, source_dir
+
+# Assembly of one source file with relocations for the linker, cached as an object
+def assemble_object(input_file, cache=False) -> Assembly:
+    source, instructions, source_dir = read_source(input_file)
+    if cache:
+        key = os.path.join(CACHE_DIR, source_digest(source, included_files(instructions, source_dir))) + ".o"
+        if os.path.exists(key): return read_object(key)
+    asm = assemble_lines(instructions, relocatable=True, source_dir=source_dir)
+    if cache:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f"{key}.{os.getpid()}"
+        write_object(tmp, asm)
+        os.replace(tmp, key)
+    return asm
+
+# quiet: no status lines, for tools assembling many kernels
+def assemble_file(input_file, output_file, symbol_file=None, cache=False, base=0, quiet=False):
+    source, instructions, source_dir = read_source(input_file)
+    if cache:
+        key = os.path.join(CACHE_DIR, source_digest(source, included_files(instructions, source_dir), base))
+        if os.path.exists(key + ".bin") and os.path.exists(key + ".sym"):
+            shutil.copyfile(key + ".bin", output_file)
+            if symbol_file: shutil.copyfile(key + ".sym", symbol_file)
+            if not quiet: print(f"Machine code written to {output_file} (cached).")
+            return
 
     # assemble instructions
-    mem_mapped_instr, label_map = create_label_map(instructions)
-    machine_codes = assemble_instructions(mem_mapped_instr, label_map)
-    write_machine_code(output_file, machine_codes)
-    print(f"Machine code written to {output_file}.")
+    asm = assemble_lines(instructions, base=base, source_dir=source_dir)
+    with open(output_file, 'wb') as f:
+        f.write(asm.image())
+    if not quiet: print(f"Machine code written to {output_file}.")
+    label_map = asm.labels()
+    if symbol_file:
+        write_symbols(symbol_file, label_map)
+        if not quiet: print(f"Symbols written to {symbol_file}.")
+
+    if cache:
+        # write then rename, parallel runs may be filling the same entry
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        for ext, write in ((".bin", lambda p: shutil.copyfile(output_file, p)),
+                           (".sym", lambda p: write_symbols(p, label_map))):
+            tmp = f"{key}.{os.getpid()}{ext}"
+            write(tmp)
+            os.replace(tmp, key + ext)
 
 if __name__ == "__main__":
-    input_file = sys.argv[1]
-    output_file = sys.argv[2]
-
-    assemble_file(input_file, output_file)
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input_file', type=str)
+    parser.add_argument('output_file', type=str)
+    parser.add_argument('--symbols', type=str, default=None, help="write the label map to this file")
+    parser.add_argument('--verbose', action='store_true', help="print every line as it is assembled")
+    parser.add_argument('--cache', action='store_true', help=f"reuse binaries of unchanged sources from {CACHE_DIR}")
+    parser.add_argument('--object', action='store_true', help="write a relocatable object for linker.py instead of a binary")
+    parser.add_argument('--base', type=lambda x: int(x, 0), default=0, help="load address of the image, for label addresses in li / la")
+    args = parser.parse_args()
+    VERBOSE = args.verbose
+
+    if args.object:
+        write_object(args.output_file, assemble_object(args.input_file, args.cache))
+        print(f"Object written to {args.output_file}.")
+    else:
+        assemble_file(args.input_file, args.output_file, args.symbols, args.cache, args.base)
@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, "softsim"))
+import assembler
+import gemmgen
+from main import Core, ControlRegister
+from multicore import Cluster
+
+# Simulator benchmarks
+# - every benchmark is assembled (without the cache) and run in-process through
+#   assembler.py and softsim/main.py's Core, once per execution mode
+# - reports assembly seconds, host seconds for load + run, retired instructions
+#   and simulated instructions per second, best of --repeat runs
+# - `run` appends a record to a JSON history, `compare` checks the newest record
+#   against the baseline (the last record run with --baseline, else the first)
+#   and fails when instructions per second drop, or assembly time grows, by more
+#   than the threshold; timings under MIN_SECONDS in the baseline are noise and
+#   never flagged
+# - `check` runs everything once and only verifies the results (make test)
+# - `scale` splits tiledmatmul over 1, 2, 4, ... cores (kernels/tiledmatmul_mc.S on a
+#   multicore.Cluster) and reports modelled cycles and host time per core count
+
+HISTORY = os.environ.get("BENCH_HISTORY", os.path.join(os.path.expanduser("~"), ".cache", "tc-kernels", "bench", "history.json"))
+KERNELS = os.path.join(ROOT, "kernels")
+MODES = ("interp", "block")
+GEMM_SIZES = [(2, 2, 2), (4, 8, 4), (8, 8, 8), (16, 16, 16)]
+MIN_SECONDS = 0.002
+
+# name -> (source lines, start address, setup(core), check(core) -> bool)
+def fib(count=1900):
+    def setup(core):
+        core.memory.write(0, np.array([0, 1], dtype='<u4').tobytes())
+        core.memwrite(0x1f00, count)
+    def check(core):
+        seq = core.memory.read(0, 4 * (count + 2)).view('<u4')
+        return bool(np.array_equal(seq[2:], (seq[:-2] + seq[1:-1]).astype(np.uint32)))
+    return assembler.parse_file(os.path.join(KERNELS, "fib.S")), 0x10000, setup, check
+
+def loop():
+    return assembler.parse_file(os.path.join(KERNELS, "test.S")), 0, lambda core: None, lambda core: int(core.scalar_regs[2]) == 3
+
+W_ADDR = 0x100000
+
+def tiledmatmul(n, k, m, source=None, label="tiledmatmul"):
+    rng = np.random.default_rng(0)
+    W = rng.standard_normal((4 * n, 4 * k)).astype(np.float16)
+    I = rng.standard_normal((4 * k, 4 * m)).astype(np.float16)
+    Y = rng.standard_normal((4 * n, 4 * m)).astype(np.float16)
+    I_ADDR = W_ADDR + assembler.align(W.nbytes, 4096)
+    Y_ADDR = I_ADDR + assembler.align(I.nbytes, 4096)
+    driver = [f"li.i x10, {W_ADDR}", f"li.i x11, {I_ADDR}", f"li.i x12, {Y_ADDR}",
+              f"li.i x13, {n}", f"li.i x14, {k}", f"li.i x15, {m}", f"jal x1, {label}", "halt"]
+    def setup(core):
+        for addr, x in ((W_ADDR, W), (I_ADDR, I), (Y_ADDR, Y)): core.memory.write(addr, x.tobytes())
+    def check(core):
+        got = core.memory.read(Y_ADDR, Y.nbytes).view(np.float16).astype(np.float32)
+        ref = W.astype(np.float32) @ I.astype(np.float32) + Y.astype(np.float32)
+        return bool(np.allclose(got.reshape(Y.shape), ref, rtol=2e-2, atol=0.25))
+    kernel = assembler.parse_source(source) if source else assembler.parse_file(os.path.join(KERNELS, "tiledmatmul.S"))
+    return driver + kernel, 0, setup, check
+
+def benchmarks() -> dict:
+    suite = {"fib": fib(), "test": loop()}
+    for n, k, m in GEMM_SIZES:
+        suite[f"tiledmatmul_{n}x{k}x{m}"] = tiledmatmul(n, k, m)
+    # double buffered variant, dma.ld / dma.st instead of ld.m / st.m
+    with open(os.path.join(KERNELS, "tiledmatmul_db.S")) as f:
+        db = f.read()
+    for n, k, m in GEMM_SIZES:
+        suite[f"tiledmatmul_db_{n}x{k}x{m}"] = tiledmatmul(n, k, m, db, "tiledmatmul_db")
+    # straight-line heavy kernel from gemmgen.py, mostly there for assembly time
+    n, k, m = GEMM_SIZES[-1]
+    suite[f"gemmgen_{n}x{k}x{m}"] = tiledmatmul(n, k, m, gemmgen.generate(n, k, m, gemmgen.Schedule("nmk", 3, 3, 16)), "gemm")
+    return suite
+
+# tiledmatmul_mc on `cores` cores sharing W, I and Y -> (Cluster.summary(), correct)
+def multicore(n, k, m, cores, tmp, mode="block", timing=True):
+    with open(os.path.join(KERNELS, "tiledmatmul_mc.S")) as f, open(os.path.join(KERNELS, "tiledmatmul.S")) as g:
+        source = f.read() + g.read()
+    lines, start, setup, check = tiledmatmul(n, k, m, source, "tiledmatmul_mc")
+    path = os.path.join(tmp, "multicore.bin")
+    image = assembler.assemble_lines(lines, base=start).image()
+    with open(path, "wb") as f:
+        f.write(image)
+    # W, I and Y each padded to 4 KiB, as laid out by tiledmatmul()
+    window = sum(assembler.align(32 * a * b, 4096) for a, b in ((n, k), (k, m), (n, m)))
+    cluster = Cluster(path, [ControlRegister(start, 0x80000 - c * 0x1000) for c in range(cores)], (W_ADDR, window))
+    try:
+        setup(cluster)
+        cluster.run(mode, timing)
+        return cluster.summary(), check(cluster)
+    finally:
+        cluster.close()
+
+def scale(n, k, m, core_counts, mode="block"):
+    with tempfile.TemporaryDirectory() as tmp:
+        base = None
+        for cores in core_counts:
+            s, ok = multicore(n, k, m, cores, tmp, mode)
+            assert ok, f"tiledmatmul_mc on {cores} cores: wrong result"
+            base = base or s["cycles"]
+            print(f"{cores:>3} cores  cycles {s['cycles']:>9}  speedup {base / s['cycles']:5.2f}x  "
+                  f"slowest core {s['max_retired']:>8} instrs  host {s['seconds']:7.3f} s")
+
+# one benchmark in one mode -> (asm seconds, run seconds, instructions, correct)
+def measure(lines, start, setup, check, mode, tmp):
+    path = os.path.join(tmp, "bench.bin")
+    t0 = time.perf_counter()
+    image = assembler.assemble_lines(lines, base=start).image()
+    t1 = time.perf_counter()
+    with open(path, "wb") as f:
+        f.write(image)
+    t2 = time.perf_counter()
+    core = Core(path, ControlRegister(start, 0x80000))
+    core.verbose = False
+    setup(core)
+    core.run(mode, 100_000_000)
+    t3 = time.perf_counter()
+    return t1 - t0, t3 - t2, core.retired, check(core)
+
+def run_suite(repeat: int = 3, names=None) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, (lines, start, setup, check) in benchmarks().items():
+            if names and name not in names: continue
+            for mode in MODES:
+                runs = [measure(lines, start, setup, check, mode, tmp) for _ in range(repeat)]
+                asm, secs = min(r[0] for r in runs), min(r[1] for r in runs)
+                instructions = runs[0][2]
+                assert all(r[3] for r in runs), f"{name} ({mode}): wrong result"
+                results[f"{name}/{mode}"] = {"asm_seconds": asm, "seconds": secs, "instructions": instructions,
+                                             "ips": instructions / secs}
+                print(f"{name + '/' + mode:<32} asm {1e3 * asm:8.2f} ms  run {secs:8.4f} s  "
+                      f"{instructions:>9} instrs  {instructions / secs:>12,.0f} instrs/s")
+    return results
+
+def git_revision():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def load_history(path: str) -> list:
+    if not os.path.exists(path): return []
+    with open(path) as f:
+        return json.load(f)
+
+def save_history(path: str, history: list):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(history, f, indent=1)
+    os.replace(tmp, path)
+
+# record index, label or commit -> record
+def find(history: list, ref: str) -> dict:
+    for i, record in reversed(list(enumerate(history))):
+        if ref in (str(i), str(i - len(history)), record.get("label"), record.get("commit")): return record
+    raise SystemExit(f"no benchmark record '{ref}'")
+
+def baseline_of(history: list) -> dict:
+    marked = [r for r in history if r.get("baseline")]
+    return marked[-1] if marked else history[0]
+
+# benchmark -> (old, new, change) of instructions per second / assembly time, regressed
+def compare(old: dict, new: dict, threshold: float):
+    rows, regressed = [], False
+    for name, b in new["results"].items():
+        a = old["results"].get(name)
+        if a is None: continue
+        speed = b["ips"] / a["ips"] - 1
+        asm = b["asm_seconds"] / a["asm_seconds"] - 1 if a["asm_seconds"] else 0.0
+        bad = (speed < -threshold and a["seconds"] >= MIN_SECONDS) or (asm > threshold and a["asm_seconds"] >= MIN_SECONDS)
+        regressed |= bad
+        rows.append((name, a["ips"], b["ips"], speed, asm, bad))
+    return rows, regressed
+
+def describe(record: dict) -> str:
+    return f"{record.get('label') or record.get('commit') or '?'} ({record['time']})"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--history', type=str, default=HISTORY, help="JSON history file (BENCH_HISTORY overrides the default)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="run the suite and append the results to the history")
+    run.add_argument('--repeat', type=int, default=5, help="runs per benchmark, the fastest counts")
+    run.add_argument('--label', type=str, default=None)
+    run.add_argument('--baseline', action='store_true', help="compare later records against this one")
+    run.add_argument('--only', nargs='+', default=None, help="benchmark names to run")
+    cmp = commands.add_parser("compare", help="compare two records, exit 1 on a regression")
+    cmp.add_argument('--baseline', type=str, default=None, help="record index, label or commit, default the marked baseline")
+    cmp.add_argument('--against', type=str, default="-1", help="record index, label or commit, default the newest")
+    cmp.add_argument('--threshold', type=float, default=0.10, help="allowed relative slowdown")
+    commands.add_parser("check", help="run every benchmark once and verify its results")
+    sc = commands.add_parser("scale", help="split tiledmatmul over several cores, report cycles per core count")
+    sc.add_argument('--size', nargs=3, type=int, default=[16, 16, 16], metavar=('N', 'K', 'M'), help="in 4x4 tiles")
+    sc.add_argument('--cores', nargs='+', type=int, default=[1, 2, 4, 8])
+    sc.add_argument('--mode', choices=['interp', 'block'], default='block')
+    args = parser.parse_args()
+
+    if args.command == "check":
+        run_suite(repeat=1)
+        with tempfile.TemporaryDirectory() as tmp:
+            for mode in MODES:
+                assert multicore(5, 4, 3, 3, tmp, mode)[1], f"tiledmatmul_mc ({mode}): wrong result"
+        print("all benchmarks produced correct results.")
+    elif args.command == "scale":
+        scale(*args.size, args.cores, args.mode)
+    elif args.command == "run":
+        record = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": git_revision(), "label": args.label,
+                  "baseline": args.baseline, "python": platform.python_version(), "machine": platform.machine(),
+                  "results": run_suite(args.repeat, args.only)}
+        history = load_history(args.history)
+        history.append(record)
+        save_history(args.history, history)
+        print(f"Results appended to {args.history}.")
+    else:
+        history = load_history(args.history)
+        if not history: raise SystemExit(f"no benchmark records in {args.history}")
+        old = find(history, args.baseline) if args.baseline else baseline_of(history)
+        new = find(history, args.against)
+        rows, regressed = compare(old, new, args.threshold)
+        print(f"baseline {describe(old)} vs {describe(new)}")
+        for name, a, b, speed, asm, bad in rows:
+            print(f"{name:<32} {a:>12,.0f} -> {b:>12,.0f} instrs/s  {100 * speed:+6.1f}%  asm {100 * asm:+6.1f}%"
+                  + ("  REGRESSION" if bad else ""))
+        if regressed:
+            print(f"regressions beyond {100 * args.threshold:.0f}%")
+            sys.exit(1)
@@ -0,0 +1,337 @@
+import os
+import sys
+import argparse
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "softsim"))
+import assembler
+from isa import ARRAY_DIM
+from main import Core, ControlRegister
+from perf import Counters
+from timing import TimingModel, TimingConfig
+
+# Tiled GEMM generator and autotuner
+# - emits Y = W x I + Y for fixed n, k, m (dim x dim tiles, 4x4 by default, row major
+#   FP16, same calling convention as kernels/tiledmatmul.S: W, I, Y addresses in
+#   x10-x12, x13-x15 unused); `--order nkm` is tiledmatmul.S's loop nest for any dim
+# - loop order:
+#   nmk / mnk: output stationary, a bn x bm block of Y tiles stays in matrix registers
+#              over the whole k loop, row blocks (nmk) or column blocks (mnk) outermost
+#   nkm:       weight stationary like tiledmatmul.S, bn weight tiles stay loaded over
+#              the column loop and partial sums go through memory on every term
+# - register blocking: bn x bm accumulators + bn weight + bm input tiles in m1-m15
+# - unroll: copies of the innermost loop body (k for nmk / mnk, column blocks for nkm)
+# - the autotuner runs every candidate in softsim with perf counters and the timing
+#   model, checks the result against numpy and ranks by tile loads / stores or cycles
+# - sweep tunes one problem (in elements) for several array dimensions to compare
+#   instructions, memory traffic and cycles per FLOP
+
+MATRIX_REGS = 15 # m1-m15, m0 is the zero matrix
+ORDERS = ("nmk", "mnk", "nkm")
+
+class Schedule:
+    def __init__(self, order="nmk", bn=1, bm=1, unroll=1):
+        assert order in ORDERS, f"loop order must be one of {', '.join(ORDERS)}"
+        assert bn * bm + bn + bm <= MATRIX_REGS, f"{bn}x{bm} block needs {bn * bm + bn + bm} matrix registers"
+        self.order, self.bn, self.bm, self.unroll = order, bn, bm, unroll
+
+    def __str__(self):
+        return f"{self.order} {self.bn}x{self.bm} u{self.unroll}"
+
+class Generator:
+    def __init__(self, n: int, k: int, m: int, schedule: Schedule, name: str = "gemm", dim: int = ARRAY_DIM):
+        self.n, self.k, self.m, self.s, self.name = n, k, m, schedule, name
+        # bytes in one tile row (the next tile to the right), and in dim rows of
+        # one tile column (the next tile down, times the matrix width in tiles)
+        self.dim, self.rb, self.tb = dim, 2 * dim, 2 * dim * dim
+        self.lines = []
+        self.labels = 0
+        # x10-x12 are the W, I, Y pointers, everything else but ra / sp is scratch
+        self.pool = [f"x{r}" for r in [5, 6, 7, 8, 9, *range(13, 32), 3, 4]]
+        self.tmp, self.sw, self.si = (self.reg() for _ in range(3))
+
+    def reg(self) -> str:
+        assert self.pool, f"{self.s}: out of scalar registers"
+        return self.pool.pop(0)
+
+    def release(self, *regs):
+        self.pool[:0] = regs
+
+    def emit(self, line: str):
+        self.lines.append(line)
+
+    def label(self) -> str:
+        self.labels += 1
+        label = f"{self.name}_{self.labels}"
+        self.emit(f"{label}:")
+        return label
+
+    # rd = rs + value, addi while the immediate is small
+    def add(self, rd: str, rs: str, value: int):
+        if value == 0:
+            if rd != rs: self.emit(f"mv.i {rd}, {rs}")
+        elif -2048 <= value < 2048:
+            self.emit(f"addi.i {rd}, {rs}, {value}")
+        else:
+            self.emit(f"li.i {self.tmp}, {value}")
+            self.emit(f"add.i {rd}, {rs}, {self.tmp}")
+
+    def tile(self, op: str, mreg: int, stride: str, offset: int, base: str):
+        assert -1024 <= offset < 1024, f"{self.s}: tile offset {offset} does not fit in 11 bits"
+        self.emit(f"{op} m{mreg}, {stride}, {offset}[{base}]")
+
+    # count iterations of body(s), s-th copy in a group of `unroll`, advance(g) moves
+    # the pointers past g iterations; the leftover iterations follow the loop
+    def repeat(self, count: int, unroll: int, body, advance):
+        groups, rest = divmod(count, unroll)
+        if groups > 1:
+            counter = self.reg()
+            self.emit(f"li.i {counter}, {groups}")
+            top = self.label()
+        if groups:
+            for s in range(unroll): body(s)
+            advance(unroll)
+        if groups > 1:
+            self.emit(f"addi.i {counter}, {counter}, -1")
+            self.emit(f"bne {counter}, x0, {top}")
+            self.release(counter)
+        for s in range(rest): body(s)
+        if rest: advance(rest)
+
+    # full blocks in a loop, then the partial one
+    def blocks(self, count: int, size: int, body, advance):
+        self.repeat(count // size, 1, lambda s: body(size), advance)
+        if count % size: body(count % size)
+
+    def generate(self) -> str:
+        n, k, m, s = self.n, self.k, self.m, self.s
+        self.emit(f"{self.name}:        // Y = W x I + Y, {n} x {k} x {m} tiles of {self.dim}x{self.dim}, {s}")
+        self.emit(f"li.i {self.sw}, {self.rb * k}")
+        self.emit(f"li.i {self.si}, {self.rb * m}")
+        if s.order == "nmk":
+            self.blocks(n, s.bn, self.row_blocks, lambda g: (self.add("x10", "x10", self.tb * k * s.bn * g), self.add("x12", "x12", self.tb * m * s.bn * g)))
+        elif s.order == "mnk":
+            self.blocks(m, s.bm, self.column_blocks, lambda g: (self.add("x11", "x11", self.rb * s.bm * g), self.add("x12", "x12", self.rb * s.bm * g)))
+        else:
+            self.blocks(n, s.bn, self.weight_stationary, lambda g: (self.add("x10", "x10", self.tb * k * s.bn * g), self.add("x12", "x12", self.tb * m * s.bn * g)))
+        self.emit("ret")
+        return "\n".join(self.lines) + "\n"
+
+    # nmk: one row of blocks, W / Y at x10 / x12
+    def row_blocks(self, bn: int):
+        ib, yb = self.reg(), self.reg()
+        self.add(ib, "x11", 0)
+        self.add(yb, "x12", 0)
+        self.blocks(self.m, self.s.bm, lambda bm: self.output_block(bn, bm, "x10", ib, yb),
+                    lambda g: (self.add(ib, ib, self.rb * self.s.bm * g), self.add(yb, yb, self.rb * self.s.bm * g)))
+        self.release(ib, yb)
+
+    # mnk: one column of blocks, I / Y at x11 / x12
+    def column_blocks(self, bm: int):
+        wb, yb = self.reg(), self.reg()
+        self.add(wb, "x10", 0)
+        self.add(yb, "x12", 0)
+        self.blocks(self.n, self.s.bn, lambda bn: self.output_block(bn, bm, wb, "x11", yb),
+                    lambda g: (self.add(wb, wb, self.tb * self.k * self.s.bn * g), self.add(yb, yb, self.tb * self.m * self.s.bn * g)))
+        self.release(wb, yb)
+
+    # bn x bm accumulators loaded once, k terms, stored once
+    def output_block(self, bn: int, bm: int, wb: str, ib: str, yb: str):
+        k, m = self.k, self.m
+        acc = lambda a, b: 1 + a * bm + b
+        w = lambda a: 1 + bn * bm + a
+        x = lambda b: 1 + bn * bm + bn + b
+        yrow = [self.reg() for _ in range(bn)]
+        for a in range(bn):
+            self.add(yrow[a], yb, self.tb * m * a)
+            for b in range(bm): self.tile("ld.m", acc(a, b), self.si, self.rb * b, yrow[a])
+        wrow, ip = [self.reg() for _ in range(bn)], self.reg()
+        for a in range(bn): self.add(wrow[a], wb, self.tb * k * a)
+        self.add(ip, ib, 0)
+        # I rows of a group by offset when they fit in the immediate, else step per term
+        by_offset = self.tb * m * (self.s.unroll - 1) + self.rb * (bm - 1) < 1024
+
+        def term(s):
+            for a in range(bn): self.tile("ld.m", w(a), self.sw, self.rb * s, wrow[a])
+            for b in range(bm):
+                self.tile("ld.m", x(b), self.si, (self.tb * m * s if by_offset else 0) + self.rb * b, ip)
+            for a in range(bn):
+                for b in range(bm): self.emit(f"gemm.m m{acc(a, b)}, m{w(a)}, m{x(b)}, m{acc(a, b)}")
+            if not by_offset: self.add(ip, ip, self.tb * m)
+
+        def advance(g):
+            for a in range(bn): self.add(wrow[a], wrow[a], self.rb * g)
+            if by_offset: self.add(ip, ip, self.tb * m * g)
+
+        self.repeat(k, self.s.unroll, term, advance)
+        for a in range(bn):
+            for b in range(bm): self.tile("st.m", acc(a, b), self.si, self.rb * b, yrow[a])
+        self.release(*yrow, *wrow, ip)
+
+    # nkm: bn weight tiles per term, partial sums loaded and stored per column block
+    def weight_stationary(self, bn: int):
+        k, m, bm = self.k, self.m, self.s.bm
+        wrow, ip = [self.reg() for _ in range(bn)], self.reg()
+        for a in range(bn): self.add(wrow[a], "x10", self.tb * k * a)
+        self.add(ip, "x11", 0)
+
+        def term(_):
+            for a in range(bn): self.tile("ld.m", 1 + a, self.sw, 0, wrow[a])
+            yrow, icol = [self.reg() for _ in range(bn)], self.reg()
+            for a in range(bn): self.add(yrow[a], "x12", self.tb * m * a)
+            self.add(icol, ip, 0)
+
+            def columns(bm_, s=0):
+                off = self.rb * bm * s
+                acc = lambda a, b: 1 + bn + bm + a * bm_ + b
+                for b in range(bm_): self.tile("ld.m", 1 + bn + b, self.si, off + self.rb * b, icol)
+                for a in range(bn):
+                    for b in range(bm_):
+                        self.tile("ld.m", acc(a, b), self.si, off + self.rb * b, yrow[a])
+                        self.emit(f"gemm.m m{acc(a, b)}, m{1 + a}, m{1 + bn + b}, m{acc(a, b)}")
+                        self.tile("st.m", acc(a, b), self.si, off + self.rb * b, yrow[a])
+
+            def advance(g):
+                for r in yrow + [icol]: self.add(r, r, self.rb * bm * g)
+
+            self.repeat(m // bm, self.s.unroll, lambda s: columns(bm, s), advance)
+            if m % bm: columns(m % bm)
+            self.release(*yrow, icol)
+
+        def next_term(g):
+            for a in range(bn): self.add(wrow[a], wrow[a], self.rb * g)
+            self.add(ip, ip, self.tb * m * g)
+
+        self.repeat(k, 1, term, next_term)
+        self.release(*wrow, ip)
+
+def generate(n: int, k: int, m: int, schedule: Schedule, name: str = "gemm", dim: int = ARRAY_DIM) -> str:
+    return Generator(n, k, m, schedule, name, dim).generate()
+
+# every schedule that fits the register file, unrolling only where it repeats
+def candidates(n: int, k: int, m: int, unrolls=(1, 2, 4)):
+    for order in ORDERS:
+        for bn in range(1, n + 1):
+            for bm in range(1, m + 1):
+                if bn * bm + bn + bm > MATRIX_REGS: continue
+                inner = k if order != "nkm" else m // bm
+                for u in unrolls:
+                    if u == 1 or u <= inner:
+                        try: yield Schedule(order, bn, bm, u)
+                        except AssertionError: pass
+
+W_ADDR = 0x100000
+
+# run one kernel source (entry `label`) on random matrices -> metrics
+def measure(n: int, k: int, m: int, source: str, label: str = "gemm", seed: int = 0, dim: int = ARRAY_DIM) -> dict:
+    d = dim
+    rng = np.random.default_rng(seed)
+    W = rng.standard_normal((d * n, d * k)).astype(np.float16)
+    I = rng.standard_normal((d * k, d * m)).astype(np.float16)
+    Y = rng.standard_normal((d * n, d * m)).astype(np.float16)
+    I_ADDR = W_ADDR + assembler.align(W.nbytes, 4096)
+    Y_ADDR = I_ADDR + assembler.align(I.nbytes, 4096)
+    driver = [f"li.i x10, {W_ADDR}", f"li.i x11, {I_ADDR}", f"li.i x12, {Y_ADDR}",
+              f"li.i x13, {n}", f"li.i x14, {k}", f"li.i x15, {m}", f"jal x1, {label}", "halt"]
+    with tempfile.TemporaryDirectory() as tmp:
+        image = assembler.assemble_lines(driver + assembler.parse_source(source)).image()
+        path = os.path.join(tmp, "gemm.bin")
+        with open(path, "wb") as f:
+            f.write(image)
+        core = Core(path, ControlRegister(0, 0x80000, dim))
+        core.verbose = False
+        for addr, x in ((W_ADDR, W), (I_ADDR, I), (Y_ADDR, Y)): core.memory.write(addr, x.tobytes())
+        core.perf, core.timing = Counters(), TimingModel(TimingConfig(dim=dim))
+        core.run("block", 100 * n * k * m + 10000)
+        got = core.memory.read(Y_ADDR, Y.nbytes).view(np.float16).reshape(Y.shape)
+    # same accumulation order as the array: one d x d product per tile and term
+    for t in range(k):
+        Wt = W[:, d * t: d * t + d].reshape(n, 1, d, d)
+        It = I[d * t: d * t + d].reshape(d, m, d).transpose(1, 0, 2)[None]
+        Y = (np.matmul(Wt, It) + Y.reshape(n, d, m, d).transpose(0, 2, 1, 3)).transpose(0, 2, 1, 3).reshape(Y.shape)
+    perf = core.perf.summary(core)
+    tile = core.matrix_regs[0].nbytes
+    return {"memops": (perf["ldm_bytes"] + perf["stm_bytes"]) // tile, "cycles": core.timing.total_cycles(),
+            "instructions": perf["retired"], "gemm": perf["gemm"], "size": len(image),
+            "bytes": perf["ldm_bytes"] + perf["stm_bytes"], "flops": 2 * d ** 3 * n * k * m,
+            "correct": bool(np.array_equal(got.view(np.uint16), Y.view(np.uint16)))}
+
+def measure_schedule(args):
+    n, k, m, schedule, dim = args
+    return measure(n, k, m, generate(n, k, m, schedule, dim=dim), dim=dim)
+
+def tune(n: int, k: int, m: int, objective: str = "memops", workers: int = None, unrolls=(1, 2, 4), dim: int = ARRAY_DIM):
+    schedules = list(candidates(n, k, m, unrolls))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(measure_schedule, [(n, k, m, s, dim) for s in schedules]))
+    bad = [str(s) for s, r in zip(schedules, results) if not r["correct"]]
+    assert not bad, f"wrong results from {', '.join(bad)}"
+    other = "cycles" if objective == "memops" else "memops"
+    return sorted(zip(schedules, results), key=lambda sr: (sr[1][objective], sr[1][other], sr[1]["size"]))
+
+def report(ranked, baseline=None, top=10):
+    print(f"{'schedule':<16} {'memops':>8} {'cycles':>9} {'instrs':>9} {'bytes':>7}")
+    rows = ranked[:top] + ([("tiledmatmul.S", baseline)] if baseline else [])
+    for s, r in rows:
+        print(f"{str(s):<16} {r['memops']:>8} {r['cycles']:>9} {r['instructions']:>9} {r['size']:>7}")
+
+# one n x k x m element problem on each array dimension, best schedule per dim
+# -> [(dim, schedule, metrics)], to compare instructions and traffic per FLOP
+def sweep(n: int, k: int, m: int, dims, objective: str = "memops", workers: int = None):
+    rows = []
+    for d in dims:
+        assert n % d == 0 and k % d == 0 and m % d == 0, f"{n} x {k} x {m} is not a multiple of {d}"
+        s, r = tune(n // d, k // d, m // d, objective, workers, dim=d)[0]
+        rows.append((d, s, r))
+    return rows
+
+def report_sweep(rows):
+    print(f"{'dim':>4} {'schedule':<16} {'instrs':>9} {'gemms':>7} {'bytes':>9} {'cycles':>9} "
+          f"{'instrs/kflop':>12} {'bytes/flop':>10} {'flops/cycle':>11}")
+    for d, s, r in rows:
+        f = r["flops"]
+        print(f"{d:>4} {str(s):<16} {r['instructions']:>9} {r['gemm']:>7} {r['bytes']:>9} {r['cycles']:>9} "
+              f"{1000 * r['instructions'] / f:>12.3f} {r['bytes'] / f:>10.4f} {f / r['cycles']:>11.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('n', type=int, help="W / Y rows in tiles (elements with --sweep)")
+    parser.add_argument('k', type=int, help="W columns / I rows in tiles (elements with --sweep)")
+    parser.add_argument('m', type=int, help="I / Y columns in tiles (elements with --sweep)")
+    parser.add_argument('-o', '--output', type=str, default=None, help="write the kernel here instead of stdout")
+    parser.add_argument('--name', type=str, default="gemm", help="entry label")
+    parser.add_argument('--order', choices=ORDERS, default="nmk")
+    parser.add_argument('--block', type=str, default="1x1", help="bn x bm accumulator tiles, e.g. 3x3")
+    parser.add_argument('--unroll', type=int, default=1)
+    parser.add_argument('--tune', action='store_true', help="measure every schedule in softsim and emit the best")
+    parser.add_argument('--objective', choices=['memops', 'cycles'], default='memops',
+                        help="tile loads + stores, or cycles from the timing model")
+    parser.add_argument('--workers', type=int, default=None, help="defaults to one per cpu")
+    parser.add_argument('--dim', type=int, default=ARRAY_DIM, help="systolic array dimension the kernel is for")
+    parser.add_argument('--sweep', type=int, nargs='+', default=None, metavar='DIM',
+                        help="tune the n x k x m element problem for each array dimension and compare them")
+    args = parser.parse_args()
+
+    if args.sweep:
+        report_sweep(sweep(args.n, args.k, args.m, args.sweep, args.objective, args.workers))
+        sys.exit(0)
+    if args.tune:
+        ranked = tune(args.n, args.k, args.m, args.objective, args.workers, dim=args.dim)
+        baseline = None
+        if args.dim == 4:
+            with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "kernels", "tiledmatmul.S")) as f:
+                baseline = measure(args.n, args.k, args.m, f.read(), "tiledmatmul")
+        report(ranked, baseline)
+        schedule = ranked[0][0]
+    else:
+        bn, bm = (int(x) for x in args.block.lower().split("x"))
+        schedule = Schedule(args.order, bn, bm, args.unroll)
+    source = generate(args.n, args.k, args.m, schedule, args.name, args.dim)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(source)
+        print(f"{schedule} kernel written to {args.output}.")
+    else:
+        print(source, end="")
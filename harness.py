@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "softsim"))
+import assembler
+import linker
+from main import Core, ControlRegister
+from isa import ARRAY_DIM
+
+# Multi-run harness
+# - a manifest lists jobs: kernel source, input files mapped into memory, control register
+# - every distinct kernel is assembled once (or taken from the assembler cache),
+#   jobs then fan out over a process pool
+# - final registers, matrices and requested memory ranges land in one .npz
+#
+# manifest.json:
+# {"jobs": [{"name": "fib_10", "kernel": "kernels/fib.S", "start": 0, "sp": 32768,
+#            "inputs": [{"file": "n.bin", "addr": "0x1f00"}],
+#            "dump": [{"addr": "0x1f00", "size": 64}], "max_iters": 100000}]}
+# "kernel" may also be a list of sources/objects to link, with an optional "entry" symbol
+# kernels are assembled for their job's start address, label addresses in li are absolute
+# "dim" sets the systolic array dimension (default isa.ARRAY_DIM), without "max_iters"
+# a job runs until it halts
+
+def parse_int(x):
+    return int(x, 0) if isinstance(x, str) else int(x)
+
+def assemble_kernels(jobs, outdir):
+    binaries = {}
+    for job in jobs:
+        key = kernel_key(job)
+        if key in binaries: continue
+        srcs = [job["kernel"]] if isinstance(job["kernel"], str) else job["kernel"]
+        start = parse_int(job.get("start", 0))
+        digest = hashlib.sha1(f"{job.get('entry')} {start:#x}".encode())
+        for src in srcs:
+            with open(src, "rb") as f:
+                digest.update(f.read())
+        out = os.path.join(outdir, f"{os.path.basename(srcs[0])}.{digest.hexdigest()[:16]}.bin")
+        if isinstance(job["kernel"], str): assembler.assemble_file(srcs[0], out, cache=True, base=start, quiet=True)
+        else: linker.link_files(srcs, out, entry=job.get("entry"), base=start, quiet=True)
+        binaries[key] = out
+    return binaries
+
+def kernel_key(job):
+    k = job["kernel"]
+    start = parse_int(job.get("start", 0))
+    return (k, start) if isinstance(k, str) else (tuple(k), job.get("entry"), start)
+
+def run_job(job, binary, mode):
+    cr = ControlRegister(parse_int(job.get("start", 0)), parse_int(job.get("sp", 0)), parse_int(job.get("dim", ARRAY_DIM)))
+    result = {}
+    core = Core(binary, cr)
+    core.verbose = False
+    for inp in job.get("inputs", []):
+        core.map_file(inp["file"], parse_int(inp["addr"]))
+    try:
+        max_iters = job.get("max_iters")
+        core.run(mode, None if max_iters is None else parse_int(max_iters))
+    except AssertionError as e:
+        result["error"] = np.array(str(e))
+    result["halted"] = np.array(core.halted)
+    result["pc"] = np.array(core.pc, dtype=np.int64)
+    result["scalar_regs"] = np.array(core.scalar_regs, dtype=np.uint32)
+    result["matrix_regs"] = core.matrix_regs.copy()
+    for d in job.get("dump", []):
+        addr = parse_int(d["addr"])
+        result[f"mem_{addr:08x}"] = core.memory.read(addr, parse_int(d["size"]))
+    return job["name"], result
+
+def run_manifest(manifest, output, workers=None, mode="block"):
+    jobs = manifest["jobs"]
+    assert len({j["name"] for j in jobs}) == len(jobs), "job names must be unique"
+    with tempfile.TemporaryDirectory() as tmp:
+        binaries = assemble_kernels(jobs, tmp)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_job, j, binaries[kernel_key(j)], mode) for j in jobs]
+            results = {}
+            for fut in futures:
+                name, res = fut.result()
+                for key, value in res.items():
+                    results[f"{name}/{key}"] = value
+    np.savez_compressed(output, **results)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('manifest', type=str)
+    parser.add_argument('output', type=str, help="results .npz")
+    parser.add_argument('--workers', type=int, default=None, help="defaults to one per cpu")
+    parser.add_argument('--mode', choices=['interp', 'block'], default='block')
+    args = parser.parse_args()
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    results = run_manifest(manifest, args.output, args.workers, args.mode)
+    for job in manifest["jobs"]:
+        status = "halted" if results[f"{job['name']}/halted"] else "did not halt"
+        print(f"{job['name']}: {status}")
+    print(f"Results written to {args.output}.")
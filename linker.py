@@ -0,0 +1,103 @@
+import os
+import argparse
+import numpy as np
+import assembler
+
+# Linker
+# - combines relocatable objects (`assembler.py --object`) and/or sources, in order,
+#   into one flat image for softsim/main.py; sources are assembled through the
+#   assembler's object cache, so shared routines are only assembled once
+# - all text sections come first, then every object's data section at its alignment
+# - every label is a symbol, references to labels an object does not define are
+#   relocations patched here with the pc-relative offset to the defining object
+# - label addresses (`li rd, label`) are always relocations, absolute for an image
+#   loaded at `base`
+# - a label defined by more than one object can only be used inside those objects
+# - an entry symbol puts `jal x1, entry; halt` in front, so a routine ending in
+#   ret halts when it returns
+
+# immediate bits of the instruction word per relocation kind, and the offset range
+reloc_fields = {
+    "branch": (0xFE000F80, 1 << 12, lambda imm: assembler.encode_b_type(0, 0, "x0", "x0", imm)),
+    "jal":    (0xFFFFF000, 1 << 20, lambda imm: assembler.encode_uj_type(0, "x0", imm)),
+}
+
+def load(path: str, cache: bool = True) -> assembler.Assembly:
+    if path.endswith(".o"): return assembler.read_object(path)
+    return assembler.assemble_object(path, cache)
+
+def object_name(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+# [(name, Assembly)] -> (image bytes, symbol -> byte address in the image)
+def link(objects, entry: str = None, base: int = 0):
+    texts, size = [], 8 if entry else 0
+    for _, asm in objects:
+        texts.append(size)
+        size += 4 * len(asm.text)
+    text_size, datas = size, []
+    for _, asm in objects:
+        size = assembler.align(size, asm.data_align)
+        datas.append(size)
+        size += len(asm.data)
+
+    # global symbols, names defined twice are kept per object only
+    defined, symbols = {}, {}
+    for (name, asm), text, data in zip(objects, texts, datas):
+        for label, (section, offset) in asm.symbols.items():
+            defined.setdefault(label, []).append(name)
+            symbols[f"{name}.{label}"] = (text if section == "text" else data) + offset
+    for label, owners in defined.items():
+        if len(owners) == 1: symbols[label] = symbols.pop(f"{owners[0]}.{label}")
+
+    image = np.zeros(size, dtype=np.uint8)
+    words = image[:text_size].view('<u4')
+    for (name, asm), text, data in zip(objects, texts, datas):
+        at = text // 4
+        words[at: at + len(asm.text)] = asm.text
+        image[data: data + len(asm.data)] = np.frombuffer(asm.data, dtype=np.uint8)
+        for index, kind, label in asm.relocations:
+            if label in asm.symbols:
+                address = symbols.get(f"{name}.{label}", symbols.get(label))
+            else:
+                owners = defined.get(label, [])
+                assert owners, f"{name}: undefined symbol '{label}'"
+                assert len(owners) == 1, f"{name}: '{label}' is defined in {', '.join(owners)}"
+                address = symbols[label]
+            pc = text + 4 * index
+            if kind == "li":
+                upper, lower = assembler.split_imm(base + address)
+                words[at + index] = (int(words[at + index]) & 0xFFF) | (upper << 12)
+                words[at + index + 1] = (int(words[at + index + 1]) & 0xFFFFF) | ((lower & 0xFFF) << 20)
+                continue
+            mask, span, bits = reloc_fields[kind]
+            offset = address - pc
+            assert -span <= offset < span, f"{name}: '{label}' is out of {kind} range from {pc:#x}"
+            words[at + index] = (int(words[at + index]) & ~mask & 0xFFFFFFFF) | (bits(offset) & mask)
+
+    if entry:
+        assert entry in symbols, f"undefined entry symbol '{entry}'"
+        words[0] = assembler.encode_uj_type(assembler.opcode_map["jal"], "x1", symbols[entry])
+        words[1] = 0xFFFFFFFF
+    return image, symbols
+
+def link_files(inputs, output_file, symbol_file=None, entry=None, cache=True, base=0, quiet=False):
+    objects = [(object_name(path), load(path, cache)) for path in inputs]
+    image, symbols = link(objects, entry, base)
+    image.tofile(output_file)
+    if not quiet: print(f"Linked {len(inputs)} objects into {output_file}.")
+    if symbol_file:
+        assembler.write_symbols(symbol_file, symbols)
+        if not quiet: print(f"Symbols written to {symbol_file}.")
+    return image, symbols
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('inputs', nargs='+', help=".o objects or .S sources, laid out in this order")
+    parser.add_argument('-o', '--output', required=True)
+    parser.add_argument('--symbols', type=str, default=None, help="write the linked symbol table to this file")
+    parser.add_argument('--entry', type=str, default=None, help="call this symbol from a `jal x1; halt` stub at address 0")
+    parser.add_argument('--no-cache', action='store_true', help="always assemble .S inputs")
+    parser.add_argument('--base', type=lambda x: int(x, 0), default=0, help="load address of the image, for label addresses in li / la")
+    args = parser.parse_args()
+    link_files(args.inputs, args.output, args.symbols, args.entry, not args.no_cache, args.base)
@@ -3,7 +3,5 @@ if [ "$#" -ne 1 ]; then
     exit 0
 fi
 
-SOURCE_FILE=$1
-
-python3 assembler.py $SOURCE_FILE ./temp.bin
-python3 softsim/main.py --file ./temp.bin
\ No newline at end of file
+# one interpreter: the kernel is assembled in-process, no binary on disk
+python3 softsim/main.py --source $1
@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import argparse
+import threading
+import socketserver
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "softsim"))
+import assembler
+from main import Core, ControlRegister
+from isa import ARRAY_DIM
+from timing import TimingModel, TimingConfig
+
+# Assemble-and-run service
+# - one long-lived process on a Unix socket, so many small runs share a warm
+#   interpreter: numpy and the simulator are imported once, assembled kernels stay in
+#   memory (keyed like the assembler's binary cache) and translated blocks are
+#   compiled once per distinct block (translate.compiled); nothing touches the disk
+# - one JSON object per line each way, byte strings base64 encoded
+#   request {"op": "run", "source": "...", "start": 0, "sp": 0, "dim": 4, "mode": "block",
+#            "max_iters": 100000000, "wallclock": 10.0, "timing": false,
+#            "inputs": [{"addr": 4096, "data": "<base64>"}], "dump": [{"addr": 4096, "size": 64}]}
+#            ("kernel": "path.S" instead of "source" has the server read the file)
+#   reply   {"ok": true, "stop": "halt", "halted": true, "pc": 0, "retired": 0,
+#            "scalar_regs": [...], "matrix_regs": "<base64 float16>", "dump": ["<base64>"],
+#            "cached": true, "seconds": 0.001}, plus "cycles" with timing
+#           {"ok": false, "error": "..."} when the kernel does not assemble or run
+#   {"op": "ping"}, {"op": "stats"} and {"op": "shutdown"} need no other fields
+# - a run stops after max_iters instructions or wallclock seconds ("stop": "budget" or
+#   "wallclock"), so a kernel that never halts cannot hold the server; null lifts a limit
+# - requests are served one at a time, start a server per host core for parallel runs
+
+SOCKET = os.environ.get("SIM_SOCKET", os.path.join(os.path.expanduser("~"), ".cache", "tc-kernels", "sim.sock"))
+MAX_KERNELS = 1024 # assembled images kept, oldest dropped first
+MAX_ITERS = 10 ** 8 # default per-run instruction budget
+WALLCLOCK = 10.0    # default per-run limit in host seconds
+
+class Service:
+    def __init__(self):
+        self.kernels = {} # cache key -> image
+        self.hits = 0
+        self.runs = 0
+        self.started = time.time()
+
+    # binary image of the request's kernel, and whether it was cached
+    def image(self, req):
+        start = int(req.get("start", 0))
+        if "kernel" in req:
+            with open(req["kernel"]) as f:
+                source = f.read()
+            source_dir = os.path.dirname(os.path.abspath(req["kernel"]))
+        else:
+            source, source_dir = req["source"], req.get("source_dir", ".")
+        instructions = assembler.parse_source(source)
+        key = assembler.source_digest(source.encode(), assembler.included_files(instructions, source_dir), start)
+        image = self.kernels.get(key)
+        if image is not None:
+            self.hits += 1
+            return image, True
+        image = assembler.assemble_lines(instructions, base=start, source_dir=source_dir).image()
+        if len(self.kernels) >= MAX_KERNELS: self.kernels.pop(next(iter(self.kernels)))
+        self.kernels[key] = image
+        return image, False
+
+    def run(self, req) -> dict:
+        t0 = time.perf_counter()
+        image, cached = self.image(req)
+        cr = ControlRegister(int(req.get("start", 0)), int(req.get("sp", 0)), int(req.get("dim", ARRAY_DIM)))
+        core = Core.from_bytes(image, cr)
+        for inp in req.get("inputs", []):
+            core.memory.load(int(inp["addr"]), base64.b64decode(inp["data"]))
+        if req.get("timing"): core.timing = TimingModel(TimingConfig(dim=cr.dim))
+        why = core.run_until(budget=req.get("max_iters", MAX_ITERS), wallclock=req.get("wallclock", WALLCLOCK),
+                             mode=req.get("mode", "block"))
+        self.runs += 1
+        reply = {"ok": True, "stop": why, "halted": core.halted, "pc": core.pc, "retired": core.retired,
+                 "scalar_regs": core.scalar_regs, "matrix_regs": base64.b64encode(core.matrix_regs.tobytes()).decode(),
+                 "dump": [base64.b64encode(core.memory.read(int(d["addr"]), int(d["size"])).tobytes()).decode()
+                          for d in req.get("dump", [])],
+                 "cached": cached}
+        if core.timing is not None: reply["cycles"] = core.timing.total_cycles()
+        reply["seconds"] = time.perf_counter() - t0
+        return reply
+
+    def handle(self, req) -> dict:
+        op = req.get("op", "run")
+        try:
+            if op == "run": return self.run(req)
+            if op == "ping" or op == "shutdown": return {"ok": True}
+            if op == "stats":
+                return {"ok": True, "runs": self.runs, "kernels": len(self.kernels), "hits": self.hits,
+                        "uptime": time.time() - self.started}
+            return {"ok": False, "error": f"unknown op '{op}'"}
+        except Exception as e:
+            # a bad kernel or request fails that request, not the server
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip(): continue
+            try:
+                req = json.loads(line)
+            except ValueError as e:
+                req, reply = {}, {"ok": False, "error": f"bad request: {e}"}
+            else:
+                reply = self.server.service.handle(req)
+            self.wfile.write(json.dumps(reply).encode() + b"\n")
+            self.wfile.flush()
+            if req.get("op") == "shutdown":
+                # shutdown() waits for serve_forever, which is waiting for this handler
+                threading.Thread(target=self.server.shutdown).start()
+                return
+
+def serve(path: str = SOCKET):
+    if os.path.exists(path):
+        with socket.socket(socket.AF_UNIX) as s:
+            if s.connect_ex(path) == 0: raise SystemExit(f"a server is already listening on {path}")
+        os.unlink(path) # left behind by a server that died
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with socketserver.UnixStreamServer(path, Handler) as server:
+        server.service = Service()
+        print(f"Serving on {path}.", flush=True)
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(path)
+
+# connection to a running server, requests go out one at a time
+class Client:
+    def __init__(self, path: str = SOCKET):
+        self.sock = socket.socket(socket.AF_UNIX)
+        self.sock.connect(path)
+        self.file = self.sock.makefile("rwb")
+
+    def request(self, **req) -> dict:
+        self.file.write(json.dumps(req).encode() + b"\n")
+        self.file.flush()
+        line = self.file.readline()
+        if not line: raise ConnectionError("server closed the connection")
+        return json.loads(line)
+
+    # run a kernel; inputs {addr: bytes}, dump [(addr, size)] -> reply with dump as
+    # bytes and matrix_regs as an array
+    def run(self, source: str, inputs: dict = None, dump=(), dim: int = ARRAY_DIM, **options) -> dict:
+        reply = self.request(op="run", source=source, dim=dim, **options,
+                             inputs=[{"addr": a, "data": base64.b64encode(bytes(d)).decode()} for a, d in (inputs or {}).items()],
+                             dump=[{"addr": a, "size": n} for a, n in dump])
+        if reply["ok"]:
+            reply["dump"] = [base64.b64decode(d) for d in reply["dump"]]
+            reply["matrix_regs"] = np.frombuffer(base64.b64decode(reply["matrix_regs"]), dtype=np.float16).reshape(16, dim, dim)
+        return reply
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--socket', type=str, default=SOCKET, help="SIM_SOCKET overrides the default")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("serve", help="listen for run requests until stopped")
+    run = commands.add_parser("run", help="run one kernel on a running server")
+    run.add_argument('kernel', type=str)
+    run.add_argument('--start', type=lambda x: int(x, 0), default=0)
+    run.add_argument('--sp', type=lambda x: int(x, 0), default=0)
+    run.add_argument('--dim', type=int, default=ARRAY_DIM, help="systolic array dimension, tiles are dim x dim")
+    run.add_argument('--input', action='append', default=[], metavar='FILE@ADDR', help="load a raw file at ADDR, may be repeated")
+    run.add_argument('--dump', action='append', default=[], metavar='ADDR:SIZE', help="print SIZE bytes at ADDR in hex, may be repeated")
+    run.add_argument('--mode', choices=['interp', 'block'], default='block')
+    run.add_argument('--max-iters', type=int, default=MAX_ITERS)
+    run.add_argument('--wallclock', type=float, default=WALLCLOCK, help="host seconds before the run is stopped")
+    run.add_argument('--timing', action='store_true')
+    commands.add_parser("stats", help="print the server's counters")
+    commands.add_parser("stop", help="shut the server down")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.socket)
+        sys.exit(0)
+    client = Client(args.socket)
+    try:
+        if args.command == "run":
+            inputs = {}
+            for spec in args.input:
+                path, addr = spec.rsplit('@', 1)
+                with open(path, "rb") as f:
+                    inputs[int(addr, 0)] = f.read()
+            dump = [tuple(int(x, 0) for x in d.split(':')) for d in args.dump]
+            with open(args.kernel) as f:
+                reply = client.run(f.read(), inputs, dump, args.dim, start=args.start, sp=args.sp, mode=args.mode,
+                                   max_iters=args.max_iters, wallclock=args.wallclock, timing=args.timing,
+                                   source_dir=os.path.dirname(os.path.abspath(args.kernel)))
+            if not reply["ok"]: raise SystemExit(reply["error"])
+            print(f"{reply['stop']} at pc {reply['pc']:#x} after {reply['retired']} instructions"
+                  + (f", {reply['cycles']} cycles" if "cycles" in reply else "")
+                  + f" ({'cached' if reply['cached'] else 'assembled'}, {1e3 * reply['seconds']:.1f} ms)")
+            print("x: " + " ".join(f"{v:#x}" for v in reply["scalar_regs"]))
+            for (addr, _), data in zip(dump, reply["dump"]):
+                print(f"{addr:#010x}: {data.hex()}")
+        elif args.command == "stats":
+            print(json.dumps(client.request(op="stats"), indent=1))
+        else:
+            client.request(op="shutdown")
+            print("Server stopped.")
+    finally:
+        client.close()
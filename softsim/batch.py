@@ -0,0 +1,199 @@
+import numpy as np
+from isa import Opcode, M, alu_src, branch_src, lambdas
+from decode import Instruction, decode_program
+
+# Batched lockstep simulation
+# - N copies of the same kernel, each lane with its own registers and memory
+# - every instruction is decoded once and applied to all lanes at that pc with numpy
+# - lanes that diverge on a branch are regrouped by always issuing the lowest pc
+#   among running lanes, so they reconverge when the paths meet again
+# - code is shared: stores into the text segment are not seen by the fetch path
+# - semantics mirror Core._run, except that there is no DMA unit and lanes are
+#   not cores of a multicore.Cluster
+
+unsupported = {Opcode.DMALD, Opcode.DMAST, Opcode.DMAWAIT, Opcode.DMAPOLL,
+               Opcode.BARRIER, Opcode.COREID, Opcode.NCORES}
+PAGE_BITS = 12 # small pages, each one is allocated for every lane at once
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+
+class BatchMemory:
+    def __init__(self, n: int):
+        self.n = n
+        self.pages = {} # page number -> (n, PAGE_SIZE) uint8
+        self.words = {} # page number -> (n, PAGE_SIZE / 4) uint32 view
+        self.halves = {} # page number -> (n, PAGE_SIZE / 2) float16 view
+
+    def page(self, p: int) -> np.ndarray:
+        pg = self.pages.get(p)
+        if pg is None:
+            pg = self.pages[p] = np.zeros((self.n, PAGE_SIZE), dtype=np.uint8)
+            self.words[p] = pg.view('<u4')
+            self.halves[p] = pg.view('<f2')
+        return pg
+
+    # write the same bytes to every lane, or one row per lane for a (n, size) array
+    def write(self, addr: int, data):
+        buf = np.frombuffer(data, dtype=np.uint8) if isinstance(data, (bytes, bytearray)) else np.ascontiguousarray(data).view(np.uint8)
+        size = buf.shape[-1]
+        a, end = addr, addr + size
+        while a < end:
+            p, off = a >> PAGE_BITS, a & PAGE_MASK
+            take = min(PAGE_SIZE - off, end - a)
+            self.page(p)[:, off: off + take] = buf[..., a - addr: a - addr + take]
+            a += take
+
+    def read(self, addr: int, size: int) -> np.ndarray:
+        out = np.zeros((self.n, size), dtype=np.uint8)
+        a, end = addr, addr + size
+        while a < end:
+            p, off = a >> PAGE_BITS, a & PAGE_MASK
+            take = min(PAGE_SIZE - off, end - a)
+            if p in self.pages: out[:, a - addr: a - addr + take] = self.pages[p][:, off: off + take]
+            a += take
+        return out
+
+    # per-lane aligned words at per-lane addresses, only for lanes in `lanes`
+    def read_words(self, addrs: np.ndarray, lanes: np.ndarray) -> np.ndarray:
+        out = np.zeros(len(lanes), dtype=np.int64)
+        pages = addrs >> PAGE_BITS
+        offs = (addrs & PAGE_MASK) >> 2
+        for p in np.unique(pages):
+            w = self.words.get(int(p))
+            if w is None: continue
+            sel = pages == p
+            out[sel] = w[lanes[sel], offs[sel]]
+        return out
+
+    def write_words(self, addrs: np.ndarray, lanes: np.ndarray, values: np.ndarray):
+        pages = addrs >> PAGE_BITS
+        offs = (addrs & PAGE_MASK) >> 2
+        for p in np.unique(pages):
+            self.page(int(p))
+            sel = pages == p
+            self.words[int(p)][lanes[sel], offs[sel]] = values[sel] & M
+
+    # per-lane FP16 elements at per-lane byte addresses, addrs is (len(lanes), ...)
+    def read_halves(self, addrs: np.ndarray, lanes: np.ndarray) -> np.ndarray:
+        out = np.zeros(addrs.shape, dtype=np.float16)
+        lanes = np.broadcast_to(lanes.reshape((-1,) + (1,) * (addrs.ndim - 1)), addrs.shape)
+        pages = addrs >> PAGE_BITS
+        offs = (addrs & PAGE_MASK) >> 1
+        for p in np.unique(pages):
+            h = self.halves.get(int(p))
+            if h is None: continue
+            sel = pages == p
+            out[sel] = h[lanes[sel], offs[sel]]
+        return out
+
+    def write_halves(self, addrs: np.ndarray, lanes: np.ndarray, values: np.ndarray):
+        lanes = np.broadcast_to(lanes.reshape((-1,) + (1,) * (addrs.ndim - 1)), addrs.shape)
+        pages = addrs >> PAGE_BITS
+        offs = (addrs & PAGE_MASK) >> 1
+        for p in np.unique(pages):
+            self.page(int(p))
+            sel = pages == p
+            self.halves[int(p)][lanes[sel], offs[sel]] = values[sel]
+
+class BatchCore:
+    def __init__(self, memfile: str, cr, n: int):
+        self.n = n
+        self.cr = cr
+        self.memory = BatchMemory(n)
+        image = np.fromfile(memfile, dtype=np.uint8)
+        self.memory.write(cr.start_address, image)
+        self.program = decode_program(image, cr.start_address)
+        self.icache = {}
+        self.scalar_regs = np.zeros((n, 32), dtype=np.uint32)
+        self.dim = cr.dim
+        self.matrix_regs = np.zeros((n, 16, self.dim, self.dim), dtype=np.float16)
+        self.pc = np.zeros(n, dtype=np.int64)
+        self.halted = np.zeros(n, dtype=bool)
+
+    def fetch(self, pc: int):
+        i = self.icache.get(pc)
+        if i is None:
+            k = self.program.index(pc)
+            if k is not None: i = self.program.instruction(k)
+            if i is None: i = Instruction.decode_word(int(self.memory.read(pc, 4)[0].view('<u4')[0]))
+            self.icache[pc] = i
+        return i
+
+    # run until every lane halts, or max_iters issue steps (None never gives up)
+    def run(self, max_iters=None):
+        cr = self.cr
+        self.pc[:] = cr.start_address
+        self.scalar_regs[:, 2] = cr.stack_pointer
+        self._run(float('inf') if max_iters is None else max_iters)
+        if not self.halted.all(): print(f"{int((~self.halted).sum())} of {self.n} lanes did not halt.")
+
+    # issue steps are counted once per group of lanes executing an instruction
+    def _run(self, max_iters):
+        iter = 0
+        while iter < max_iters:
+            running = ~self.halted
+            if not running.any(): return
+            pc = int(self.pc[running].min())
+            lanes = np.flatnonzero(running & (self.pc == pc))
+            self.step(self.fetch(pc), pc, lanes)
+            iter += 1
+
+    def step(self, i, pc, lanes):
+        op = i.opcode
+        regs = self.scalar_regs
+        if op is Opcode.HALT:
+            self.halted[lanes] = True
+            return
+        assert op not in unsupported, f"batch mode cannot execute {op}"
+        if op is Opcode.GEMM:
+            mr = self.matrix_regs
+            mr[lanes, i.rd] = np.matmul(mr[lanes, i.ra], mr[lanes, i.rb]) + mr[lanes, i.rc]
+            self.pc[lanes] = pc + 4
+            return
+        # x0 is never written
+        if op is Opcode.LUI:
+            if i.rd: regs[lanes, i.rd] = (i.imm & 0x000FFFFF) << 12
+            self.pc[lanes] = pc + 4
+            return
+        if op is Opcode.JAL:
+            if i.rd: regs[lanes, i.rd] = pc + 4
+            self.pc[lanes] = pc + i.imm
+            return
+
+        a = regs[lanes, i.rs1].astype(np.int64)
+        if op is Opcode.JALR:
+            if i.rd: regs[lanes, i.rd] = pc + 4
+            self.pc[lanes] = (a + i.imm) & M
+            return
+        b = np.int64(i.imm) if i.use_imm else regs[lanes, i.rs2].astype(np.int64)
+        if op is Opcode.BTYPE:
+            taken = branch_vec[i.branch_cond](a, b)
+            self.pc[lanes] = np.where(taken, pc + i.imm, pc + 4)
+            return
+        res = alu_vec[i.aluop](a, b)
+        if op is Opcode.RTYPE or op is Opcode.ITYPE:
+            if i.rd: regs[lanes, i.rd] = res
+        elif op is Opcode.LW:
+            words = self.memory.read_words(res, lanes)
+            if i.rd: regs[lanes, i.rd] = words
+        elif op is Opcode.SW:
+            self.memory.write_words(res, lanes, regs[lanes, i.rs2].astype(np.int64))
+        elif op is Opcode.LDM or op is Opcode.STM:
+            # element addresses of every lane's tile, rows rs2 bytes apart
+            stride = regs[lanes, i.rs2].astype(np.int64)
+            d = np.arange(self.dim)
+            addrs = (res[:, None, None] + stride[:, None, None] * d[:, None] + 2 * d) & M
+            if op is Opcode.LDM: self.matrix_regs[lanes, i.rd] = self.memory.read_halves(addrs, lanes)
+            else: self.memory.write_halves(addrs, lanes, self.matrix_regs[lanes, i.rd])
+        else:
+            assert False, f"batch mode cannot execute {op}"
+        self.pc[lanes] = pc + 4
+
+    # registers and matrices of one lane, e.g. to compare against a scalar Core
+    def lane(self, k: int):
+        return self.scalar_regs[k], self.matrix_regs[k]
+
+# isa.alu_src / branch_src on int64 lanes, int() of a compare becomes an int64 array,
+# products wrap in int64 but keep their low 32 bits
+alu_vec = lambdas(alu_src, {'int': lambda x: x.astype(np.int64)})
+branch_vec = lambdas(branch_src)
@@ -0,0 +1,83 @@
+import os
+import hashlib
+import numpy as np
+from memory import Memory, PAGE_SIZE
+from main import Core, ControlRegister
+from isa import ARRAY_DIM
+
+# Core checkpoints
+# - a snapshot is a small .npz (pc, registers, halt flag, retired count, control
+#   register, mapped files, page table) plus the memory pages in a content
+#   addressed store next to it, one raw PAGE_SIZE file per distinct page
+# - pages are named by their hash, so snapshots taken from the same run (or from
+#   each other) share every page that did not change, and saving only writes new ones
+# - restore reads the pages, or maps them copy-on-write with mmap=True, so many
+#   experiments started from one snapshot share the host page cache
+# - mapped host files are mapped again on restore, only their touched pages are saved
+# - decoded code, translated blocks and attached tracers / counters are not saved
+# - queued DMA transfers are not saved either, snapshots need the queue empty
+
+def default_store(path: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(path)), "pages")
+
+def save(core: Core, path: str, store: str = None):
+    assert not core.dma.pending, "cannot checkpoint with DMA transfers in flight, dma.wait first"
+    store = store or default_store(path)
+    os.makedirs(store, exist_ok=True)
+    numbers, hashes = [], []
+    for n, page in sorted(core.memory.pages.items()):
+        digest = hashlib.sha1(page).hexdigest()
+        name = os.path.join(store, digest + ".page")
+        if not os.path.exists(name):
+            # write then rename, snapshots of parallel runs may share the store
+            tmp = f"{name}.{os.getpid()}"
+            page.tofile(tmp)
+            os.replace(tmp, name)
+        numbers.append(n)
+        hashes.append(digest)
+    files = core.memory.files
+    with open(path, 'wb') as f:
+        np.savez(f,
+                 pc=np.array(core.pc, dtype=np.int64),
+                 scalar_regs=np.array(core.scalar_regs, dtype=np.uint32),
+                 matrix_regs=core.matrix_regs,
+                 halted=np.array(core.halted),
+                 retired=np.array(core.retired, dtype=np.int64),
+                 start_address=np.array(core.cr.start_address, dtype=np.int64),
+                 stack_pointer=np.array(core.cr.stack_pointer, dtype=np.int64),
+                 dim=np.array(core.cr.dim, dtype=np.int64),
+                 core_id=np.array(core.cr.core_id, dtype=np.int64),
+                 cores=np.array(core.cr.cores, dtype=np.int64),
+                 program_size=np.array(4 * len(core.program), dtype=np.int64),
+                 memfile=np.array(core.memfile or ""),
+                 store=np.array(os.path.relpath(store, os.path.dirname(os.path.abspath(path)))),
+                 page_numbers=np.array(numbers, dtype=np.int64),
+                 page_hashes=np.array(hashes, dtype=str),
+                 file_paths=np.array([os.path.abspath(p) for p, _, _ in files], dtype=str),
+                 file_addrs=np.array([a for _, a, _ in files], dtype=np.int64),
+                 file_modes=np.array([m for _, _, m in files], dtype=str))
+
+# a Core in the saved state, run it on with core.run(..., resume=True)
+def restore(path: str, mmap: bool = False, store: str = None) -> Core:
+    with np.load(path) as s:
+        state = {k: s[k] for k in s.files}
+    store = store or os.path.join(os.path.dirname(os.path.abspath(path)), str(state["store"]))
+    memory = Memory()
+    # files first, saved pages then replace whatever the guest had touched
+    for p, a, m in zip(state["file_paths"], state["file_addrs"], state["file_modes"]):
+        memory.map_file(str(p), int(a), str(m))
+    for n, digest in zip(state["page_numbers"], state["page_hashes"]):
+        name = os.path.join(store, f"{digest}.page")
+        buf = np.memmap(name, dtype=np.uint8, mode='c') if mmap else np.fromfile(name, dtype=np.uint8)
+        assert len(buf) == PAGE_SIZE, f"{name} is not a memory page"
+        memory._map(int(n), buf)
+
+    cr = ControlRegister(int(state["start_address"]), int(state["stack_pointer"]), int(state.get("dim", ARRAY_DIM)),
+                         int(state.get("core_id", 0)), int(state.get("cores", 1)))
+    core = Core(str(state["memfile"]), cr, memory, int(state["program_size"]))
+    core.pc = int(state["pc"])
+    core.scalar_regs[:] = [int(v) for v in state["scalar_regs"]]
+    core.matrix_regs[:] = state["matrix_regs"]
+    core.halted = bool(state["halted"])
+    core.retired = int(state["retired"])
+    return core
@@ -0,0 +1,243 @@
+import numpy as np
+from isa import Opcode, AluOp, BranchOp, opcodes, rfunct, ifunct, bfunct, dma_funct, sys_funct
+
+# Instruction decoding
+# - fields are pulled straight out of the 32 bit word with shifts and masks
+# - `formats` drives both the per-word decoder and the bulk numpy decoder
+
+def sext(value: int, bits: int) -> int:
+    sign = 1 << (bits - 1)
+    return (value & (sign - 1)) - (value & sign)
+
+# immediates, laid out as in isa.md, sign extended except for U
+def imm_i(w): return sext((w >> 20) & 0xFFF, 12)
+def imm_s(w): return sext(((w >> 7) & 0x1F) | (((w >> 25) & 0x7F) << 5), 12)
+def imm_b(w): return sext(((w >> 7) & 0x1) << 11 | ((w >> 8) & 0xF) << 1 | ((w >> 25) & 0x3F) << 5 | ((w >> 31) & 0x1) << 12, 13)
+def imm_u(w): return (w >> 12) & 0xFFFFF
+def imm_j(w): return sext(((w >> 21) & 0x3FF) << 1 | ((w >> 20) & 0x1) << 11 | ((w >> 12) & 0xFF) << 12 | ((w >> 31) & 0x1) << 20, 21)
+def imm_m(w): return sext((w >> 7) & 0x7FF, 11)
+def imm_tag(w): return (w >> 14) & 0xF # DMA tag
+
+# opcode -> (fields present, immediate decoder)
+formats = {
+    Opcode.HALT:  ((), None),
+    Opcode.RTYPE: (('rd', 'rs1', 'rs2'), None),
+    Opcode.ITYPE: (('rd', 'rs1', 'imm'), imm_i),
+    Opcode.LW:    (('rd', 'rs1', 'imm'), imm_i),
+    Opcode.JALR:  (('rd', 'rs1', 'imm'), imm_i),
+    Opcode.SW:    (('rs1', 'rs2', 'imm'), imm_s),
+    Opcode.BTYPE: (('rs1', 'rs2', 'imm'), imm_b),
+    Opcode.JAL:   (('rd', 'imm'), imm_j),
+    Opcode.LUI:   (('rd', 'imm'), imm_u),
+    Opcode.GEMM:  (('rd', 'ra', 'rb', 'rc'), None),
+    Opcode.LDM:   (('rd', 'rs1', 'rs2', 'imm'), imm_m), # rs2 holds the row stride
+    Opcode.STM:   (('rd', 'rs1', 'rs2', 'imm'), imm_m),
+    Opcode.DMALD: (('rd', 'rs1', 'rs2', 'imm'), imm_tag), # imm holds the tag
+    Opcode.DMAST: (('rd', 'rs1', 'rs2', 'imm'), imm_tag),
+    Opcode.DMAWAIT: (('imm',), imm_tag),
+    Opcode.DMAPOLL: (('rd', 'imm'), imm_tag),
+    Opcode.BARRIER: ((), None),
+    Opcode.COREID: (('rd',), None),
+    Opcode.NCORES: (('rd',), None),
+}
+
+fields = {
+    'rd':  lambda w: (w >> 7) & 0x1F,
+    'rs1': lambda w: (w >> 15) & 0x1F,
+    'rs2': lambda w: (w >> 20) & 0x1F,
+    'rc':  lambda w: (w >> 16) & 0xF,
+    'rb':  lambda w: (w >> 20) & 0xF,
+    'ra':  lambda w: (w >> 24) & 0xF,
+}
+gemm_fields = dict(fields, rd = lambda w: (w >> 28) & 0xF)
+m_fields = dict(fields,
+    rd  = lambda w: (w >> 28) & 0xF,
+    rs1 = lambda w: (w >> 23) & 0x1F,
+    rs2 = lambda w: (w >> 18) & 0x1F,
+)
+field_sets = {Opcode.GEMM: gemm_fields, Opcode.LDM: m_fields, Opcode.STM: m_fields,
+              Opcode.DMALD: m_fields, Opcode.DMAST: m_fields}
+
+class Instruction:
+    __slots__ = ('opcode', 'aluop', 'rs1', 'rs2', 'ra', 'rb', 'rc', 'rd', 'imm', 'use_imm', 'branch_cond')
+
+    def __init__(self, op: Opcode):
+        self.opcode = op
+        self.aluop = None
+        self.rs1 = None
+        self.rs2 = None
+        self.ra = None
+        self.rb = None
+        self.rc = None
+        self.rd = None
+        self.imm = None
+        self.use_imm = False
+        self.branch_cond = None
+
+    @staticmethod
+    def decode(instruction: bytes):
+        assert len(instruction) == 4, "instructions should be four bytes!"
+        return Instruction.decode_word(int.from_bytes(instruction, 'big'))
+
+    @staticmethod
+    def decode_word(w: int):
+        opcode = opcodes.get(w & 0x7F)
+        if opcode is Opcode.DMA: opcode = dma_funct[(w >> 12) & 0x3]
+        elif opcode is Opcode.SYS: opcode = sys_funct.get((w >> 12) & 0x7)
+        assert opcode in formats, f"malformed instruction: {w:#010x}"
+        present, imm = formats[opcode]
+        instr = Instruction(opcode)
+        get = field_sets.get(opcode, fields)
+        for f in present:
+            if f != 'imm': setattr(instr, f, get[f](w))
+        if imm is not None: instr.imm = imm(w)
+        funct3 = (w >> 12) & 0x7
+        if opcode is Opcode.RTYPE:
+            # funct7 ++ funct3
+            instr.aluop = rfunct[(w >> 25) | (funct3 << 7)]
+        elif opcode is Opcode.ITYPE:
+            instr.use_imm = True
+            instr.aluop = ifunct[funct3]
+            # shifts: imm[4:0] is the amount, imm[10] picks arithmetic for right shifts
+            if (funct3 & 3) == 1:
+                if funct3 == 5 and instr.imm & 0x400: instr.aluop = AluOp.SRA
+                instr.imm &= 0x1F
+        elif opcode is Opcode.LW:
+            instr.use_imm = True
+            instr.aluop = AluOp.ADD # address
+        elif opcode is Opcode.JALR:
+            instr.aluop = AluOp.NOP
+        elif opcode is Opcode.SW or opcode is Opcode.LDM or opcode is Opcode.STM:
+            instr.use_imm = True
+            instr.aluop = AluOp.ADD # address
+        elif opcode is Opcode.BTYPE:
+            instr.aluop = AluOp.SUB # resolve sign extensions in decode
+            instr.branch_cond = bfunct[funct3]
+        elif opcode is Opcode.JAL or opcode is Opcode.LUI:
+            instr.aluop = AluOp.NOP
+        return instr
+
+    def text(self) -> str:
+        st = "- "
+        if self.opcode is Opcode.HALT: return st + "HALT"
+        if self.opcode is Opcode.LDM or self.opcode is Opcode.STM:
+            name = "ld.m" if self.opcode is Opcode.LDM else "st.m"
+            return st + f"{name} m{self.rd}, x{self.rs2}, {self.imm}[x{self.rs1}]"
+        if self.opcode is Opcode.DMALD or self.opcode is Opcode.DMAST:
+            name = "dma.ld" if self.opcode is Opcode.DMALD else "dma.st"
+            return st + f"{name} m{self.rd}, x{self.rs2}, x{self.rs1}, {self.imm}"
+        if self.opcode is Opcode.DMAWAIT: return st + f"dma.wait {self.imm}"
+        if self.opcode is Opcode.DMAPOLL: return st + f"dma.poll x{self.rd}, {self.imm}"
+        if self.opcode is Opcode.BARRIER: return st + "barrier"
+        if self.opcode is Opcode.COREID: return st + f"core.id x{self.rd}"
+        if self.opcode is Opcode.NCORES: return st + f"core.count x{self.rd}"
+        if self.opcode is Opcode.GEMM:
+            return st + f"gemm.m m{self.rd}, m{self.ra}, m{self.rb}, m{self.rc}"
+        if self.aluop:
+            if self.opcode is Opcode.BTYPE:
+                st += str(self.branch_cond)[9:].lower()
+            else:
+                if self.opcode in {Opcode.SW, Opcode.LW, Opcode.LUI}:
+                    st += str(self.opcode)[7:].ljust(4, ' ').lower()
+                else:
+                    st += (str(self.aluop).lower()[6:] + 'i'*self.use_imm).ljust(4, ' ')
+        var = ", x"
+        if self.opcode in {Opcode.STM, Opcode.LDM, Opcode.GEMM}: var = " m"
+        if self.rd is not None:     st += var[1:] + str(self.rd)
+        if self.rs1 is not None:    st += var + str(self.rs1)
+        if self.rs2 is not None:    st += var + str(self.rs2)
+        if self.ra is not None:     st += var + str(self.ra)
+        if self.rb is not None:     st += var + str(self.rb)
+        if self.rc is not None:     st += var + str(self.rc)
+        if self.imm is not None:    st += var[:-1] + str(self.imm)
+        if self.opcode is Opcode.BTYPE: st = st[0:5] + ' ' + st[6:]
+        return st
+
+    def print_instr(self):
+        print(self.text())
+
+# lookup tables for the bulk decoder, enum values with 0 meaning "not decodable"
+_opcode_lut = np.zeros(128, dtype=np.int8)
+for code, op in opcodes.items():
+    if op in formats or op is Opcode.DMA or op is Opcode.SYS: _opcode_lut[code] = op.value
+_rfunct_lut = np.zeros(1 << 10, dtype=np.int8)
+for key, op in rfunct.items(): _rfunct_lut[key] = op.value
+_ifunct_lut = np.zeros(8, dtype=np.int8)
+for key, op in ifunct.items(): _ifunct_lut[key] = op.value
+_bfunct_lut = np.zeros(8, dtype=np.int8)
+for key, op in bfunct.items(): _bfunct_lut[key] = op.value
+_dma_lut = np.zeros(4, dtype=np.int8)
+for key, op in dma_funct.items(): _dma_lut[key] = op.value
+_sys_lut = np.zeros(8, dtype=np.int8)
+for key, op in sys_funct.items(): _sys_lut[key] = op.value
+
+# struct-of-arrays view of a decoded text segment, one row per word
+# - rows whose word does not decode have opcode 0, absent register fields are -1
+class ProgramTable:
+    __slots__ = ('base', 'words', 'opcode', 'aluop', 'cond', 'rd', 'rs1', 'rs2', 'ra', 'rb', 'rc', 'imm', 'use_imm')
+
+    def __len__(self):
+        return len(self.words)
+
+    def index(self, pc: int):
+        k = (pc - self.base) >> 2
+        if pc & 3 or k < 0 or k >= len(self.words): return None
+        return k
+
+    def instruction(self, k: int):
+        op = int(self.opcode[k])
+        if not op: return None
+        instr = Instruction(Opcode(op))
+        for f in ('rd', 'rs1', 'rs2', 'ra', 'rb', 'rc'):
+            v = int(getattr(self, f)[k])
+            if v >= 0: setattr(instr, f, v)
+        if formats[instr.opcode][1] is not None: instr.imm = int(self.imm[k])
+        if self.aluop[k]: instr.aluop = AluOp(int(self.aluop[k]))
+        if self.cond[k]: instr.branch_cond = BranchOp(int(self.cond[k]))
+        instr.use_imm = bool(self.use_imm[k])
+        return instr
+
+# decode a little-endian text segment in one vectorized pass
+def decode_program(data, base: int = 0) -> ProgramTable:
+    w = np.frombuffer(data, dtype='<u4', count=len(data) // 4).astype(np.int64)
+    n = len(w)
+    t = ProgramTable()
+    t.base = base
+    t.words = w
+    op = _opcode_lut[w & 0x7F]
+    funct3 = (w >> 12) & 0x7
+    op = np.where(op == Opcode.DMA.value, _dma_lut[funct3 & 0x3], op)
+    op = np.where(op == Opcode.SYS.value, _sys_lut[funct3], op)
+    for f in ('rd', 'rs1', 'rs2', 'ra', 'rb', 'rc'):
+        setattr(t, f, np.full(n, -1, dtype=np.int8))
+    t.imm = np.zeros(n, dtype=np.int32)
+
+    # the same field extractors as the per-word decoder, applied to every row of a format at once
+    for opcode, (present, imm) in formats.items():
+        rows = op == opcode.value
+        if not rows.any(): continue
+        get = field_sets.get(opcode, fields)
+        for f in present:
+            if f != 'imm': getattr(t, f)[rows] = get[f](w[rows])
+        if imm is not None: t.imm[rows] = imm(w[rows])
+
+    rtype = op == Opcode.RTYPE.value
+    itype = op == Opcode.ITYPE.value
+    stype = np.isin(op, [Opcode.SW.value, Opcode.LDM.value, Opcode.STM.value, Opcode.LW.value])
+    shift = itype & ((funct3 & 3) == 1)
+    sra = shift & (funct3 == 5) & ((t.imm & 0x400) != 0)
+    t.imm[shift] &= 0x1F
+    btype = op == Opcode.BTYPE.value
+    nop = np.isin(op, [Opcode.JAL.value, Opcode.JALR.value, Opcode.LUI.value])
+    t.aluop = np.select(
+        [rtype, itype, stype, btype, nop],
+        [_rfunct_lut[(w >> 25) | (funct3 << 7)], np.where(sra, AluOp.SRA.value, _ifunct_lut[funct3]),
+         AluOp.ADD.value, AluOp.SUB.value, AluOp.NOP.value],
+        0).astype(np.int8)
+    t.cond = np.where(btype, _bfunct_lut[funct3], 0).astype(np.int8)
+    t.use_imm = itype | stype
+
+    # an unknown funct/branch encoding leaves the row for the per-word decoder to reject
+    bad = ((rtype | itype) & (t.aluop == 0)) | (btype & (t.cond == 0))
+    t.opcode = np.where(bad, 0, op).astype(np.int8)
+    return t
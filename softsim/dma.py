@@ -0,0 +1,55 @@
+# Asynchronous tile DMA
+# - dma.ld / dma.st queue a dim x dim tile transfer between memory (rows `stride`
+#   bytes apart) and a matrix register under a 4 bit tag, and return at once
+# - transfers complete in queue order; functionally a transfer only takes effect
+#   when it completes, so a register loaded by dma.ld keeps its old value (and
+#   memory written by dma.st its old contents) until the program syncs on the tag
+# - dma.wait completes every queued transfer up to the last one with the tag
+# - dma.poll does the same when the tag is done by now: always without a timing
+#   model, else once the timing model's transfer for that tag has finished
+# - dma.st captures the register when it is queued, dma.ld reads memory when it
+#   completes, so a load queued after a store sees the stored tile
+# - HALT drains the queue
+# - bandwidth and latency are modelled by timing.TimingModel, on the ld.m / st.m port
+
+class DmaUnit:
+    def __init__(self, core):
+        self.core = core
+        self.queue = [] # (tag, matrix register or None, addr, stride, tile to store or None)
+
+    @property
+    def pending(self) -> bool:
+        return bool(self.queue)
+
+    def load(self, md: int, addr: int, stride: int, tag: int):
+        self.queue.append((tag, md, addr, stride, None))
+
+    def store(self, ms: int, addr: int, stride: int, tag: int):
+        self.queue.append((tag, None, addr, stride, self.core.matrix_regs[ms].copy()))
+
+    # complete the first n queued transfers
+    def complete(self, n: int):
+        core = self.core
+        for tag, md, addr, stride, tile in self.queue[:n]:
+            if tile is None: core.matrix_regs[md] = core.load_tile(addr, stride)
+            else: core.store_tile(addr, stride, tile)
+        del self.queue[:n]
+
+    def wait(self, tag: int):
+        for k in range(len(self.queue) - 1, -1, -1):
+            if self.queue[k][0] == tag:
+                self.complete(k + 1)
+                return
+
+    # 1 once every transfer with the tag is done, 0 while one is in flight
+    def poll(self, tag: int) -> int:
+        timing = self.core.timing
+        if timing is not None and not timing.dma_done(tag): return 0
+        self.wait(tag)
+        return 1
+
+    def drain(self):
+        self.complete(len(self.queue))
+
+    def reset(self):
+        self.queue = []
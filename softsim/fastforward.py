@@ -0,0 +1,137 @@
+import os
+import sys
+import numpy as np
+from isa import Opcode
+from decode import Instruction
+
+# Whole-kernel GEMM fast-forward
+# - kernels/tiledmatmul.S is assembled once and used as a word template; its
+#   entry points are taken from the `tiledmatmul` symbol when a symbol file is
+#   given, else found by scanning the loaded program for the template
+# - on a call into it the whole Y = W x I + Y runs as k blocked fp16 matmuls over
+#   all n x m result tiles, in the same order and precision as the tile loop,
+#   and leaves registers, matrix registers and memory in the exact post-ret state
+# - anything the closed form does not cover (x0 not zero, empty or aliased
+#   matrices, code in the way, not enough iterations left) runs normally
+# - verify re-runs the region on the interpreter and asserts both agree
+# - only used when no tracer or timing model is attached and the run has no
+#   watchpoints, breakpoints or run_until target to stop at
+# - tiledmatmul.S is written for 4x4 tiles, cores with another array dimension
+#   never fast-forward
+
+M = 0xFFFFFFFF
+DIM = 4
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KERNEL = os.path.join(ROOT, "kernels", "tiledmatmul.S")
+
+# (words, label -> instruction index) of an assembled kernel
+def assemble_template(path: str = KERNEL):
+    if ROOT not in sys.path: sys.path.insert(0, ROOT)
+    import assembler
+    asm = assembler.assemble_lines(assembler.parse_file(path))
+    return np.array(asm.text, dtype=np.int64), {label: a // 4 for label, a in asm.labels().items()}
+
+class GemmFastForward:
+    def __init__(self, verify: bool = False, path: str = KERNEL):
+        self.verify = verify
+        self.words, labels = assemble_template(path)
+        self.entries = set() # entry pcs in the current core
+        self.hits = 0
+        self.retired = 0     # instructions skipped over
+        # loop structure: the three backward branches close column, term and row loops
+        decoded = [Instruction.decode_word(int(w)) for w in self.words]
+        branches = [k for k, i in enumerate(decoded) if i.opcode is Opcode.BTYPE]
+        assert len(branches) == 3 and decoded[-1].opcode is Opcode.JALR, f"{path} is not a tiledmatmul loop nest"
+        self.row, self.term, self.col = labels["Loop_row"], labels["Loop_term_idx"], labels["Loop_column"]
+        self.bcol, self.bterm, self.brow = branches
+
+    # entry pcs of the template in core's program, checked against the symbol if given
+    def attach(self, core, symbols: dict = None):
+        prog, t = core.program, self.words
+        if symbols and "tiledmatmul" in symbols:
+            starts = [symbols["tiledmatmul"]]
+        else:
+            starts = [prog.base + 4 * int(k) for k in np.flatnonzero(prog.words == t[0])]
+        self.entries = set()
+        if core.dim != DIM: return self.entries
+        for pc in starts:
+            k = prog.index(pc)
+            if k is not None and np.array_equal(prog.words[k: k + len(t)], t): self.entries.add(pc)
+        return self.entries
+
+    # executions of each template instruction for an n x k x m call
+    def counts(self, n: int, k: int, m: int) -> np.ndarray:
+        c = np.zeros(len(self.words), dtype=np.int64)
+        c[:self.row] = 1
+        c[self.row: self.term] = n
+        c[self.term: self.col] = n * k
+        c[self.col: self.bcol + 1] = n * k * m
+        c[self.bcol + 1: self.bterm + 1] = n * k
+        c[self.bterm + 1: self.brow + 1] = n
+        c[self.brow + 1:] = 1
+        return c
+
+    # run the call at pc on the core's register list r, returns (next pc, retired) or None
+    def run(self, core, r, pc: int, budget: int):
+        # the closed form assumes x0 reads 0, as the template's li.i / mv.i rely on
+        if r[0]: return None
+        W0, I0, Y0 = int(r[10]), int(r[11]), int(r[12])
+        n, k, m = int(r[13]), int(r[14]), int(r[15])
+        if not (n and k and m): return None
+        counts = self.counts(n, k, m)
+        retired = int(counts.sum())
+        if retired > budget: return None
+        ranges = [(W0, 32 * n * k), (I0, 32 * k * m), (Y0, 32 * n * m)]
+        code = (pc, 4 * len(self.words))
+        if any(a + s > M + 1 for a, s in ranges): return None
+        if any(overlaps(Y0, 32 * n * m, a, s) for a, s in ranges[:2] + [code]): return None
+        if not np.array_equal(core.memory.read(pc, code[1]).view('<u4'), self.words): return None
+
+        # tiles as (rows, cols, 4, 4), then one batched gemm per sum term
+        mem = core.memory
+        Wt = tiles(mem.read_tile(W0, 8 * k, 4 * n, 4 * k), n, k)
+        It = tiles(mem.read_tile(I0, 8 * m, 4 * k, 4 * m), k, m)
+        Yt = tiles(mem.read_tile(Y0, 8 * m, 4 * n, 4 * m), n, m).copy()
+        for t in range(k):
+            Yt = np.matmul(Wt[:, t, None], It[None, t]) + Yt
+        Y = Yt.transpose(0, 2, 1, 3).reshape(4 * n, 4 * m)
+
+        regs = {4: n, 5: k, 6: m, 10: W0 + 32 * n * k, 11: I0 + 32 * k * m,
+                12: Y0 + 32 * m * (n - 1) + 8 * m, 18: I0, 19: Y0 + 32 * n * m,
+                21: 24 * k, 22: 24 * m, 23: 32 * m, 24: 8 * k, 25: 8 * m}
+        mats = {1: Wt[n - 1, k - 1], 2: It[k - 1, m - 1], 3: Yt[n - 1, m - 1]}
+        nxt = int(r[1]) & M
+
+        if self.verify:
+            self.check(core, r, pc, retired, nxt, regs, mats, Y0, m, Y)
+        else:
+            mem.write_tile(Y0, 8 * m, Y)
+            for x, v in regs.items(): r[x] = v & M
+            for x, v in mats.items(): core.matrix_regs[x] = v
+        self.hits += 1
+        self.retired += retired
+        if core.perf is not None:
+            for j, c in enumerate(counts): core.perf.hist[pc + 4 * j] += int(c)
+            core.perf.taken[pc + 4 * self.bcol] += n * k * (m - 1)
+            core.perf.taken[pc + 4 * self.bterm] += n * (k - 1)
+            core.perf.taken[pc + 4 * self.brow] += n - 1
+        return nxt, retired
+
+    # step the interpreter through the call and compare with the closed form
+    def check(self, core, r, pc, retired, nxt, regs, mats, Y0, m, Y):
+        core.pc = pc
+        for _ in range(retired): core.execute(core.fetch(core.pc))
+        assert core.pc == nxt, f"fast-forward at {pc:#x}: interpreter left at {core.pc:#x}, expected {nxt:#x}"
+        for x, v in regs.items():
+            assert int(core.scalar_regs[x]) == v & M, f"fast-forward at {pc:#x}: x{x} = {int(core.scalar_regs[x]):#x}, expected {v & M:#x}"
+        for x, v in mats.items():
+            assert np.array_equal(core.matrix_regs[x].view(np.uint16), v.view(np.uint16)), f"fast-forward at {pc:#x}: m{x} differs"
+        got = core.memory.read_tile(Y0, 8 * m, *Y.shape)
+        assert np.array_equal(got.view(np.uint16), Y.view(np.uint16)), f"fast-forward at {pc:#x}: result matrix differs"
+
+def overlaps(a: int, size_a: int, b: int, size_b: int) -> bool:
+    return a < b + size_b and b < a + size_a
+
+# (4 * rows, 4 * cols) matrix -> (rows, cols, 4, 4) tiles
+def tiles(x: np.ndarray, rows: int, cols: int) -> np.ndarray:
+    return x.reshape(rows, 4, cols, 4).transpose(0, 2, 1, 3)
@@ -0,0 +1,190 @@
+from enum import Enum, auto
+
+# default systolic array dimension, see ControlRegister.dim
+ARRAY_DIM = 4
+
+# Opcodes
+# - instruction formats in the RISCV Spec Chapter 34 
+class Opcode(Enum):
+    NOP = auto()
+    # MOV = auto() not in the RISCV Spec
+    
+    # R Type
+    RTYPE = auto()
+
+    # I Type
+    ITYPE = auto()
+    # ADDI = auto()
+    # XORI = auto()
+    # ORI = auto()
+    # ANDI = auto()
+    # SLLI = auto()
+    # SRLI = auto()
+    # SRAI = auto()
+    # SLTI = auto()
+    
+    SLTUI = auto()
+    
+    LW = auto()
+    
+    JALR = auto()
+    
+    # S Type
+    SW = auto()
+    
+    # B Type
+    BTYPE = auto()
+    
+    # U Type
+    LUI = auto()
+    
+    # J Type
+    JAL = auto()
+    
+    # MUL Extension
+    MUL = auto()
+
+    # Matrix Extension
+    STM = auto()
+    LDM = auto()
+    GEMM = auto()
+
+    # DMA Extension, one major opcode, funct2 picks the instruction
+    DMA = auto()
+    DMALD = auto()
+    DMAST = auto()
+    DMAWAIT = auto()
+    DMAPOLL = auto()
+
+    # Multi-core, the SYSTEM opcode, funct3 picks the instruction
+    SYS = auto()
+    BARRIER = auto()
+    COREID = auto()
+    NCORES = auto()
+    
+    # Macros
+    PUSH = auto()
+    POP = auto()
+    HALT = auto()
+    
+class AluOp(Enum):
+    NOP = auto()
+    ADD = auto()
+    SUB = auto()
+    XOR = auto()
+    OR = auto()
+    AND = auto()
+    SLL = auto()
+    SRL = auto()
+    SLT = auto()
+    SRA = auto()
+    SLTU = auto()
+    MUL = auto()
+
+# Scalar semantics as single python integer expressions
+# - registers hold unsigned 32 bit values as plain ints, immediates are sign extended
+#   ints, so {b} may be negative and is masked where the sign would leak
+# - S flips the sign bit, turning signed comparisons into unsigned ones
+# - shift amounts use the low 5 bits like RV32I
+# - the interpreter's alu_funct / branch_funct and the block translator are both
+#   built from these strings
+M = 0xFFFFFFFF
+S = 0x80000000
+
+alu_src = {
+    AluOp.NOP:  "{a}",
+    AluOp.ADD:  "({a} + {b}) & M",
+    AluOp.SUB:  "({a} - {b}) & M",
+    AluOp.XOR:  "({a} ^ {b}) & M",
+    AluOp.OR:   "({a} | {b}) & M",
+    AluOp.AND:  "{a} & {b}",
+    AluOp.SLL:  "({a} << ({b} & 31)) & M",
+    AluOp.SRL:  "{a} >> ({b} & 31)",
+    AluOp.SRA:  "((({a} ^ S) - S) >> ({b} & 31)) & M",
+    AluOp.SLT:  "int(({a} ^ S) < (({b} & M) ^ S))",
+    AluOp.SLTU: "int({a} < ({b} & M))",
+    AluOp.MUL:  "({a} * {b}) & M",
+}
+
+rfunct = {
+    0b0000000000: AluOp.ADD,
+    0b0000100000: AluOp.SUB,
+    0b1000000000: AluOp.XOR,
+    0b1100000000: AluOp.OR,
+    0b1110000000: AluOp.AND,
+    0b0010000000: AluOp.SLL,
+    0b1010000000: AluOp.SRL,
+    0b1010100000: AluOp.SRA,
+    0b0100000000: AluOp.SLT,
+    0b0110000000: AluOp.SLTU,
+    0b0000000001: AluOp.MUL,
+}
+ifunct = {
+    0b000: AluOp.ADD,
+    0b010: AluOp.SLT,
+    0b011: AluOp.SLTU,
+    0b100: AluOp.XOR,
+    0b110: AluOp.OR,
+    0b111: AluOp.AND,
+    0b001: AluOp.SLL, # imm = 0x00
+    0b101: AluOp.SRL, # imm = 0x00, SRA with imm = 0x400 (funct7 0x20), told apart in decode
+}
+
+class BranchOp(Enum):
+    BEQ = auto()
+    BNE = auto()
+    BLT = auto()
+    BGE = auto()
+    
+# on the two register values
+branch_src = {
+    BranchOp.BEQ: "{a} == {b}",
+    BranchOp.BNE: "{a} != {b}",
+    BranchOp.BLT: "({a} ^ S) < ({b} ^ S)",
+    BranchOp.BGE: "({a} ^ S) >= ({b} ^ S)",
+}
+
+# op -> lambda a, b compiled from its source expression, names in env replace the
+# builtins the expression uses (batch.py swaps int() for an array cast)
+def lambdas(src: dict, env: dict = None) -> dict:
+    scope = {'M': M, 'S': S, **(env or {})}
+    return {op: eval(f"lambda a, b: {e.format(a='a', b='b')}", scope) for op, e in src.items()}
+
+alu_funct = lambdas(alu_src)
+branch_funct = lambdas(branch_src)
+    
+bfunct = {
+    0b000: BranchOp.BEQ,
+    0b001: BranchOp.BNE,
+    0b100: BranchOp.BLT,
+    0b101: BranchOp.BGE
+}
+
+opcodes = {
+    0b0110011: Opcode.RTYPE,
+    0b0010011: Opcode.ITYPE,
+    0b0000011: Opcode.LW,
+    0b0100011: Opcode.SW,
+    0b0110111: Opcode.LUI,
+    0b1100011: Opcode.BTYPE,
+    0b1101111: Opcode.JAL,
+    0b1100111: Opcode.JALR,
+    0b1111111: Opcode.HALT,
+    0b1000111: Opcode.LDM,
+    0b1010111: Opcode.STM,
+    0b1110111: Opcode.GEMM,
+    0b0001011: Opcode.DMA,
+    0b1110011: Opcode.SYS,
+}
+
+dma_funct = {
+    0b00: Opcode.DMALD,
+    0b01: Opcode.DMAST,
+    0b10: Opcode.DMAWAIT,
+    0b11: Opcode.DMAPOLL,
+}
+sys_funct = {
+    0b000: Opcode.BARRIER,
+    0b001: Opcode.COREID,
+    0b010: Opcode.NCORES,
+}
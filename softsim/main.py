@@ -1,217 +1,378 @@
+import os
+import sys
+import time
 import numpy as np
 import argparse
-from helpers import tobits, frombits
-from opcode import Opcode, AluOp, opcodes, rfunct, ifunct, bfunct, alu_funct, branch_funct
+from isa import Opcode, alu_funct, branch_funct, M, S, ARRAY_DIM
+from decode import Instruction, decode_program
+from translate import BlockCache
+from memory import Memory, PAGE_BITS
+from tracing import open_trace, writes_rd
+from perf import Counters, load_symbols
+from timing import TimingModel, TimingConfig
+from fastforward import GemmFastForward
+from dma import DmaUnit
+
+# instructions per run_until slice, the wallclock limit is checked between slices
+SLICE = 1 << 16
 
 # classes
 
 class ControlRegister:
-    def __init__(self, start_address: int, stack_pointer: int):
+    def __init__(self, start_address: int, stack_pointer: int, dim: int = ARRAY_DIM, core_id: int = 0, cores: int = 1):
         self.start_address = start_address
         self.stack_pointer = stack_pointer
-        
-class Instruction:
-    
-    def __init__(self, op: Opcode):
-        self.opcode = op
-        self.aluop = None
-        self.rs1 = None
-        self.rs2 = None
-        self.ra = None
-        self.rb = None
-        self.rc = None
-        self.rd = None
-        self.imm = None
-        self.use_imm = False
-    
-    @staticmethod
-    def decode(instruction: bytes):
-        assert len(instruction) == 4, "instructions should be four bytes!"
-        bits = tobits(instruction)
-        # print(bits)
-        def bit_range(a, b = None):
-            if b is None: b = a
-            return bits[a: b + 1]
-
-        # print("Bits: ", bits)
-        opcode = opcodes[frombits(bit_range(0,6))]
-        instr = Instruction(opcode)
-        if opcode is Opcode.HALT:
-            return instr
-        if opcode is Opcode.RTYPE or opcode is Opcode.MUL:
-            instr.rd = frombits(bit_range(7,11))
-            instr.rs1 = frombits(bit_range(15,19))
-            instr.rs2 = frombits(bit_range(20,24))
-            # funct7 ++ funct3
-            instr.aluop = rfunct[frombits(bit_range(25,31) + bit_range(12,14))]
-            return instr
-        if opcode is Opcode.ITYPE or opcode is Opcode.LW:
-            instr.use_imm = True
-            instr.rd = frombits(bit_range(7,11))
-            instr.rs1 = frombits(bit_range(15,19))
-            instr.imm = frombits(bit_range(20,31))
-            instr.aluop = ifunct[frombits(bit_range(12,14))]
-            # if instr.aluop is AluOp.SRL and frombits(imm[5:11]) == 0x20: instr.aluop = AluOp.SRA
-            return instr
-        if opcode is Opcode.SW:
-            instr.use_imm = True
-            instr.imm = frombits(bit_range(7 ,11) + bit_range(25,31))
-            instr.rs1 = frombits(bit_range(15,19))
-            instr.rs2 = frombits(bit_range(20,24))
-            return instr
-        if opcode is Opcode.BTYPE:
-            instr.use_imm = False
-            imm = ([0] + bit_range(8,11) + bit_range(25,30) + [bits[7]] + [bits[31]])
-            instr.imm = frombits(imm, signed = True)
-            instr.rs1 = frombits(bit_range(15,19))
-            instr.rs2 = frombits(bit_range(20,24))
-            instr.aluop = AluOp.SUB # resolve sign extensions in decode
-            instr.branch_cond = bfunct[frombits(bit_range(12,14))]
-            return instr
-        if opcode is Opcode.JAL:
-            instr.aluop = AluOp.NOP
-            instr.rd = frombits(bit_range(7,11))
-            instr.imm = frombits([0] + bit_range(21,30) + [bits[20]] + bit_range(12,19) + [bits[31]])
-            return instr
-        if opcode is Opcode.LUI:
-            instr.aluop = AluOp.NOP
-            instr.rd = frombits(bit_range(7,11))
-            instr.imm = frombits(bit_range(12,31))
-            return instr
-        if opcode is Opcode.GEMM:
-            instr.rc = frombits(bit_range(16,19))
-            instr.rb = frombits(bit_range(20,23))
-            instr.ra = frombits(bit_range(24,27))
-            instr.rd = frombits(bit_range(28,31))
-            return instr
-        if opcode is Opcode.STM:
-            assert False, "we don't have a format for this yet"
-        if opcode is Opcode.LDM:
-            assert False, "we don't have a format for this yet"
-        assert False, f"malformed instruction: f{bits}"
-
-    def print_instr(self):
-        st = "- "
-        if self.opcode is Opcode.HALT: print(st + "HALT"); return
-        if self.aluop: 
-            if self.opcode is Opcode.BTYPE:
-                st += str(self.branch_cond)[9:].lower()
-            else:
-                if self.opcode in {Opcode.SW, Opcode.LW, Opcode.LUI}:
-                    st += str(self.opcode)[7:].ljust(4, ' ').lower()
-                else:
-                    st += (str(self.aluop).lower()[6:] + 'i'*self.use_imm).ljust(4, ' ')
-        var = ", x"
-        if self.opcode in {Opcode.STM, Opcode.LDM, Opcode.GEMM}: var = " m"
-        if self.rd is not None:     st += var[1:] + str(self.rd)
-        if self.rs1 is not None:    st += var + str(self.rs1) 
-        if self.rs2 is not None:    st += var + str(self.rs2) 
-        if self.ra is not None:     st += var + str(self.ra) 
-        if self.rb is not None:     st += var + str(self.rb)
-        if self.rc is not None:     st += var + str(self.rc) 
-        if self.imm is not None:    st += var[:-1] + str(self.imm)
-        if self.opcode is Opcode.BTYPE: st = st[0:5] + ' ' + st[6:]
-        print(st)
-
+        # systolic array size: matrix registers, ld.m / st.m tiles and gemm.m are dim x dim
+        self.dim = dim
+        # this core's number out of `cores`, read by core.id / core.count
+        self.core_id = core_id
+        self.cores = cores
         
 class Core:
-    def __init__(self, memfile: str, cr: ControlRegister):
+    def __init__(self, memfile: str, cr: ControlRegister, memory: Memory = None, program_size: int = None):
         self.memfile = memfile
-        with open(self.memfile, "rb") as f:
-            self.memory = f.read()
-            f.close()
-        self.scalar_regs = np.zeros(32, dtype=np.uint32)
-        self.matrix_regs = np.zeros((16, 4, 4),  dtype=np.float16)
+        # the binary is mapped at the start address, the rest of the address space is sparse
+        # - with `memory` (a restored checkpoint) the program is the program_size bytes
+        #   already at the start address
+        if memory is None:
+            self.memory = Memory()
+            image = self.memory.load_file(self.memfile, cr.start_address)
+        else:
+            self.memory = memory
+            image = memory.read(cr.start_address, program_size)
+        # unsigned 32 bit values as python ints, x0 is never written
+        self.scalar_regs = [0] * 32
+        self.dim = cr.dim
+        self.matrix_regs = np.zeros((16, self.dim, self.dim),  dtype=np.float16)
+        # queued dma.ld / dma.st transfers
+        self.dma = DmaUnit(self)
         self.cr = cr
+        self.pc = cr.start_address
+        self.halted = False
+        # decoded instruction cache: pc -> (word, Instruction)
+        self.icache = {}
+        # whole binary decoded up front, rows are turned into Instructions on first fetch
+        self.program = decode_program(image, cr.start_address)
+        # translated basic blocks, created on the first block-mode run
+        self.blocks = None
+        # tracer from trace.open_trace, None when tracing is off
+        self.trace = None
+        # perf.Counters, None when counting is off
+        self.perf = None
+        # timing.TimingModel, None when cycles are not modelled
+        self.timing = None
+        # fastforward.GemmFastForward, None to always execute tiledmatmul calls
+        self.fastforward = None
+        # label -> address, for run_until(label)
+        self.symbols = {}
+        # pcs to stop in front of
+        self.breakpoints = set()
+        # watched [lo, hi) byte ranges, and the same ranges by page for the store check
+        self.watchpoints = []
+        self.guards = {}
+        # (addr, size) of the store that hit a watchpoint in the current run
+        self.watch_hit = None
+        # multiprocessing Barrier shared by the cores of a multicore.Cluster, None alone
+        # - clock: shared per-core cycle counts, to leave a barrier at the latest arrival
+        self.barrier = None
+        self.clock = None
+        # run() reports how the run ended on stdout, off for cores driven by other tools
+        self.verbose = True
+        self.retired = 0
+        self.reset()
     
-    def run(self):
+    # a core on a binary image held in memory (e.g. assembler.assemble), placed at the
+    # start address of `memory` or of a fresh address space
+    @classmethod
+    def from_bytes(cls, image: bytes, cr: ControlRegister, memory: Memory = None):
+        memory = memory if memory is not None else Memory()
+        memory.load(cr.start_address, image)
+        return cls(None, cr, memory, len(image))
+
+    # run to the halt, in slices, max_iters=None never gives up
+    def run(self, mode: str = "interp", max_iters=None, resume: bool = False):
+        if not resume: self.reset()
+        why = self.run_until(budget=max_iters, mode=mode)
+        if self.verbose: self.report_stop(why)
+        assert why == "halt", f"did not halt gracefully ({why})"
+        if self.verbose: print("exited gracefully.")
+
+    # initialize registers for a run from the start address
+    def reset(self):
+        self.pc = self.cr.start_address
+        self.scalar_regs[2] = self.cr.stack_pointer
+        self.retired = 0
+        self.halted = False
+        self.dma.reset()
+
+    # run up to max_iters instructions without requiring a halt, from the start address
+    # or, with resume, from where the core stopped (e.g. a restored checkpoint)
+    # - stops: pcs to stop in front of, except where the run starts
+    # - also stops after a store into a watchpoint
+    # - limit: instructions a fast-forwarded call may retire, max_iters if None,
+    #   so a slice of a longer run can still skip a whole GEMM
+    def run_for(self, mode: str = "interp", max_iters=None, resume: bool = False, stops: set = None,
+                limit=None) -> bool:
         cr = self.cr
-        self._run(cr)
-        if self.halted: print("exited gracefully.")
-        else:
-            assert False, "did not halt gracefully"
+        if not resume: self.reset()
+        self.halted = False
+        self.watch_hit = None
+        if mode == "block": self._run_blocks(cr, max_iters, stops, limit)
+        else: self._run(cr, max_iters, stops, limit)
+        # outstanding transfers finish before the core stops
+        if self.halted and self.dma.pending: self.dma.drain()
+        return self.halted
+
+    # execute n instructions from the current pc (exact in interp mode, whole blocks in block mode)
+    def step(self, n: int = 1, mode: str = "interp") -> str:
+        return self.run_until(budget=n, mode=mode)
+
+    # resumable run from the current state, registers are never reinitialized
+    # - stops in front of `pc` (an address or a label in `symbols`) or a breakpoint,
+    #   after a store into a watchpoint (the end of its block in block mode), on HALT,
+    #   after `budget` instructions or once `wallclock` host seconds have passed
+    # - runs in slices of at most `slice` instructions, the wallclock is checked between them
+    # - the instruction the run starts on never stops it, so calling again continues
+    # returns why it stopped: "halt", "pc", "breakpoint", "watchpoint", "budget" or "wallclock"
+    def run_until(self, pc=None, budget: int = None, wallclock: float = None,
+                  mode: str = "interp", slice: int = SLICE) -> str:
+        if isinstance(pc, str):
+            assert pc in self.symbols, f"unknown label '{pc}'"
+            pc = self.symbols[pc]
+        if self.halted: return "halt"
+        stops = self.breakpoints | {pc} if pc is not None else self.breakpoints
+        end = None if budget is None else self.retired + budget
+        deadline = None if wallclock is None else time.perf_counter() + wallclock
+        while True:
+            n = slice if end is None else min(slice, end - self.retired)
+            if n <= 0: return "budget"
+            retired = self.retired
+            limit = float('inf') if end is None else end - self.retired
+            self.run_for(mode, n, resume=True, stops=stops or None, limit=limit)
+            if self.halted: return "halt"
+            if self.watch_hit is not None: return "watchpoint"
+            if self.retired > retired and self.pc == pc: return "pc"
+            if self.retired > retired and self.pc in self.breakpoints: return "breakpoint"
+            if deadline is not None and time.perf_counter() >= deadline: return "wallclock"
+
+    def report_stop(self, why: str):
+        if why == "halt": print("Program halted")
+        elif why == "budget": print("reached maximum number of iterations.")
+        elif why == "watchpoint":
+            addr, size = self.watch_hit
+            print(f"watchpoint: {size} byte store to {addr:#x}, stopped at {self.pc:#x}")
+        else: print(f"stopped at {self.pc:#x} ({why})")
+
+    # stop runs after any store overlapping [addr, addr + size)
+    # - stores only look the page up in `guards`, and skip even that while it is empty
+    def watch(self, addr: int, size: int = 4):
+        self.watchpoints.append((addr, addr + size))
+        for n in range(addr >> PAGE_BITS, ((addr + size - 1) >> PAGE_BITS) + 1):
+            self.guards.setdefault(n, []).append((addr, addr + size))
+
+    def unwatch(self):
+        self.watchpoints, self.guards = [], {}
+
+    def check_watch(self, addr: int, size: int):
+        for n in range(addr >> PAGE_BITS, ((addr + size - 1) >> PAGE_BITS) + 1):
+            for lo, hi in self.guards.get(n, ()):
+                if addr < hi and addr + size > lo:
+                    self.watch_hit = (addr, size)
+                    return
     
+    # place a host file (raw blob or .npy) at addr, pages are read only when touched
+    def map_file(self, path: str, addr: int, mode: str = 'c'):
+        return self.memory.map_file(path, addr, mode)
+
     # read & write a word (byte addressed)
-    def memwrite(self, addr: int, data):
+    def memwrite(self, addr: int, data: int):
         assert addr % 4 == 0, "tried to write to a misaligned address"
-        self.memory[addr:addr+4] = data
+        self.memory.write_word(addr, int(data))
+        if self.guards: self.check_watch(addr, 4)
+        # self-modifying code: drop the stale decode for this word
+        self.icache.pop(addr, None)
+        if self.blocks is not None: self.blocks.invalidate(addr)
 
-    def memread(self, addr: int) -> bytes:
+    def memread(self, addr: int) -> int:
         assert addr % 4 == 0, "tried to read from a misaligned address"
-        return self.memory[addr:addr+4]
+        return self.memory.read_word(addr)
+
+    # ld.m / st.m: dim x dim FP16 tile, rows `stride` bytes apart
+    def load_tile(self, addr: int, stride: int) -> np.ndarray:
+        return self.memory.read_tile(addr, stride, self.dim, self.dim)
 
+    def store_tile(self, addr: int, stride: int, value: np.ndarray):
+        self.memory.write_tile(addr, stride, value)
+        rows, cols = value.shape
+        if self.guards:
+            for r in range(rows): self.check_watch((addr + r * stride) & 0xFFFFFFFF, 2 * cols)
+        # only tiles landing on the loaded program can hit decoded code
+        lo, hi = self.program.base, self.program.base + 4 * len(self.program)
+        if addr < hi and addr + (rows - 1) * stride + 2 * cols > lo:
+            for r in range(rows):
+                a = addr + r * stride
+                for w in range(a & ~3, a + 2 * cols, 4):
+                    self.icache.pop(w, None)
+                    if self.blocks is not None: self.blocks.invalidate(w)
+
+    # decode each static instruction once, re-decode only if its word changed
+    def fetch(self, pc: int):
+        word = self.memread(pc)
+        cached = self.icache.get(pc)
+        if cached is not None and cached[0] == word:
+            return cached[1]
+        k = self.program.index(pc)
+        i = None
+        if k is not None and self.program.words[k] == word:
+            i = self.program.instruction(k)
+        if i is None:
+            i = Instruction.decode_word(word)
+        self.icache[pc] = (word, i)
+        return i
     
-    def _run(self, cr: ControlRegister, max_iters=10000):
-        # initialize registers
-        self.pc = cr.start_address
-        self.scalar_regs[2] = cr.stack_pointer
+    def _run(self, cr: ControlRegister, max_iters=None, stops: set = None, limit=None):
+        trace = self.trace
+        perf = self.perf
+        timing = self.timing
+        watching = bool(self.guards)
+        ff = self.fastforward if trace is None and timing is None and not (watching or stops) else None
+        if max_iters is None: max_iters = float('inf')
+        if limit is None: limit = max_iters
         
         iter = 0
         while iter < max_iters:
+            pc = self.pc
+            if stops is not None and pc in stops and iter: break
+            if ff is not None and pc in ff.entries:
+                done = ff.run(self, self.scalar_regs, pc, limit - iter)
+                if done is not None:
+                    self.pc, n = done
+                    iter += n
+                    continue
             iter += 1
 
-            instruction_word = self.memread(self.pc)
-            instruction_word = instruction_word[::-1]
-            i = Instruction.decode(instruction_word)
-
-            i.print_instr()
+            i = self.fetch(pc)
 
             if i.opcode is Opcode.HALT:
+                if trace is not None: trace.record(pc, self.icache[pc][0], 0)
+                if perf is not None: perf.hist[pc] += 1
+                if timing is not None: timing.issue(i)
                 self.halted = True
-                print("Program halted")
-                return
-            res = np.int32(self.scalar_alu(i))
-            
-            # Arithmetic
-            if i.opcode is Opcode.RTYPE or i.opcode is Opcode.ITYPE:
-                self.scalar_regs[i.rd] = res
-                self.pc += 4
-                continue
-            if i.opcode is Opcode.LUI:
-                self.scalar_regs[i.rd] = (i.imm & 0x000FFFFF) << 12
-                self.pc += 4
-            
-            # Memory
-            if i.opcode is Opcode.LW:
-                self.scalar_regs[i.rd] = self.memread(res)
-            if i.opcode is Opcode.SW:
-                self.memwrite(res, self.scalar_regs[i.rs2])
-            
-            # Control Flow
-            if i.opcode is Opcode.BTYPE:
-                if branch_funct[i.branch_cond](res): self.pc += (i.imm << 1) # check sign extension
-                else: self.pc += 4
-                continue
-            
-            if i.opcode is Opcode.JAL:
-                self.scalar_regs[2] = self.pc + 4
-                self.pc += i.imm << 1
-                continue
-        
-            if i.opcode is Opcode.JALR:
-                self.scalar_regs[2] = self.pc + 4
-                self.pc += self.scalar_regs[i.rs1] + i.imm
-                continue
-
-            #Matrix
-            if i.opcode is Opcode.GEMM:
-                W = self.matrix_regs[i.ra]
-                I = self.matrix_regs[i.rb]
-                A = self.matrix_regs[i.rc]
-                self.matrix_regs[i.rd] = np.matmul(W, I) + A
-                self.pc += 4
-        print("reached maximum number of iterations.")
-            
-    def scalar_alu(self, i):
-        op1 = self.scalar_regs[i.rs1]
-        op2 =  i.imm if i.use_imm else self.scalar_regs[i.rs2]
-        out = alu_funct[i.aluop](op1,op2)
-        return out
+                break
+            self.execute(i)
+            if trace is not None:
+                trace.record(pc, self.icache[pc][0], self.scalar_regs[i.rd] if i.opcode in writes_rd else 0)
+            if perf is not None:
+                perf.hist[pc] += 1
+                if i.opcode is Opcode.BTYPE and self.pc != pc + 4: perf.taken[pc] += 1
+            if timing is not None: timing.issue(i, self.pc != pc + 4)
+            if watching and self.watch_hit is not None: break
+        self.retired += iter
 
+    # one instruction on the python int register file, every result wraps to 32 bits
+    def execute(self, i):
+        r = self.scalar_regs
+        op = i.opcode
+        # Arithmetic
+        if op is Opcode.RTYPE or op is Opcode.ITYPE:
+            if i.rd: r[i.rd] = alu_funct[i.aluop](r[i.rs1], i.imm if i.use_imm else r[i.rs2])
+            self.pc += 4
+            return
+        if op is Opcode.LUI:
+            if i.rd: r[i.rd] = (i.imm & 0x000FFFFF) << 12
+            self.pc += 4
+            return
+
+        # Control Flow
+        if op is Opcode.BTYPE:
+            self.pc += i.imm if branch_funct[i.branch_cond](r[i.rs1], r[i.rs2]) else 4
+            return
+        if op is Opcode.JAL:
+            if i.rd: r[i.rd] = self.pc + 4
+            self.pc += i.imm
+            return
+        if op is Opcode.JALR:
+            target = (r[i.rs1] + i.imm) & M
+            if i.rd: r[i.rd] = self.pc + 4
+            self.pc = target
+            return
+
+        # Memory
+        if op is Opcode.LW:
+            value = self.memread((r[i.rs1] + i.imm) & M)
+            if i.rd: r[i.rd] = value
+            self.pc += 4
+            return
+        if op is Opcode.SW:
+            self.memwrite((r[i.rs1] + i.imm) & M, r[i.rs2])
+            self.pc += 4
+            return
+
+        # Matrix
+        if op is Opcode.GEMM:
+            mr = self.matrix_regs
+            mr[i.rd] = np.matmul(mr[i.ra], mr[i.rb]) + mr[i.rc]
+            self.pc += 4
+            return
+        if op is Opcode.LDM:
+            self.matrix_regs[i.rd] = self.load_tile((r[i.rs1] + i.imm) & M, r[i.rs2])
+            self.pc += 4
+            return
+        if op is Opcode.STM:
+            self.store_tile((r[i.rs1] + i.imm) & M, r[i.rs2], self.matrix_regs[i.rd])
+            self.pc += 4
+            return
+
+        # DMA, imm is the tag
+        if op is Opcode.DMALD:
+            self.dma.load(i.rd, r[i.rs1], r[i.rs2], i.imm)
+        elif op is Opcode.DMAST:
+            self.dma.store(i.rd, r[i.rs1], r[i.rs2], i.imm)
+        elif op is Opcode.DMAWAIT:
+            self.dma.wait(i.imm)
+        elif op is Opcode.DMAPOLL:
+            done = self.dma.poll(i.imm)
+            if i.rd: r[i.rd] = done
+
+        # Multi-core
+        elif op is Opcode.BARRIER:
+            self.sync()
+        elif op is Opcode.COREID:
+            if i.rd: r[i.rd] = self.cr.core_id
+        elif op is Opcode.NCORES:
+            if i.rd: r[i.rd] = self.cr.cores
+        self.pc += 4
+
+    # barrier: queued DMA transfers finish, then wait for every other core
+    # - with a timing model, all cores leave at the latest arrival cycle
+    def sync(self):
+        if self.dma.pending: self.dma.drain()
+        if self.barrier is None: return
+        timing = self.timing
+        if timing is not None: self.clock[self.cr.core_id] = timing.now
+        self.barrier.wait()
+        if timing is not None:
+            latest = max(self.clock)
+            # nobody may publish the next barrier's cycle before everyone read this one
+            self.barrier.wait()
+            if latest > timing.now:
+                timing.stalls["barrier"] += latest - timing.now
+                timing.now = latest
+
+    # same contract as _run, but executes whole translated basic blocks at a time
+    def _run_blocks(self, cr: ControlRegister, max_iters=None, stops: set = None, limit=None):
+        # blocks are compiled with or without trace/timing calls, recompile if that changed
+        if self.blocks is None or self.blocks.hooks != (self.trace is not None, self.timing is not None):
+            self.blocks = BlockCache(self)
+
+        if max_iters is None: max_iters = float('inf')
+        self.pc, retired, self.halted = self.blocks.run(self.pc, max_iters, stops, limit)
+        self.retired += retired
+            
     def print_scalar_regs(self):
         s = ""
         for i, n in enumerate(self.scalar_regs):
-            s += f"x{str(i).zfill(2)}| {str(np.int32(n)).ljust(10, ' ')}     "
+            s += f"x{str(i).zfill(2)}| {str((n ^ S) - S).ljust(10, ' ')}     "
             if not (i+1) % 4:
                 print(s)
                 s = ""
@@ -225,13 +386,98 @@ class Core:
         
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument('--file', type=str, required=True)
+    parser.add_argument('--file', type=str, default=None, help="binary to load, not needed with --restore")
+    parser.add_argument('--source', type=str, default=None, help="assemble this kernel in-process instead of loading --file")
+    parser.add_argument('--start', type=lambda x: int(x, 0), default=0, help="load and start address")
+    parser.add_argument('--sp', type=lambda x: int(x, 0), default=0, help="initial stack pointer")
+    parser.add_argument('--dim', type=int, default=ARRAY_DIM, help="systolic array dimension, tiles are dim x dim")
+    parser.add_argument('--map', action='append', default=[], metavar='FILE@ADDR',
+                        help="map a raw or .npy file into memory at ADDR, may be repeated")
+    parser.add_argument('--mode', choices=['interp', 'block'], default='interp',
+                        help="interp: reference interpreter, block: translated basic blocks")
+    parser.add_argument('--trace', choices=['off', 'text', 'binary', 'ring'], default='text',
+                        help="text prints every instruction, binary/ring write (pc, word, rd) records to --trace-file")
+    parser.add_argument('--trace-file', type=str, default=None)
+    parser.add_argument('--perf', action='store_true', help="count instructions, gemms, matrix traffic and branches")
+    parser.add_argument('--timing', action='store_true', help="model cycles for the systolic array and matrix pipeline")
+    parser.add_argument('--symbols', type=str, default=None, help="symbol file from assembler.py --symbols, for per-label counters")
+    parser.add_argument('--trace-ring', type=int, default=1 << 16, help="records kept by --trace ring")
+    parser.add_argument('--max-iters', type=int, default=None, help="instruction budget before giving up, default none")
+    parser.add_argument('--break', dest='breaks', action='append', default=[], metavar='PC|LABEL',
+                        help="stop in front of this address or label (labels need --symbols), may be repeated")
+    parser.add_argument('--watch', action='append', default=[], metavar='ADDR[:SIZE]',
+                        help="stop after a store into SIZE (default 4) bytes at ADDR, may be repeated")
+    parser.add_argument('--wallclock', type=float, default=None, help="stop after this many host seconds")
+    parser.add_argument('--fast-gemm', action='store_true',
+                        help="run calls into kernels/tiledmatmul.S as one blocked matmul (needs --trace off, no --timing)")
+    parser.add_argument('--fast-gemm-verify', action='store_true', help="check every --fast-gemm call against the interpreter")
+    parser.add_argument('--save', type=str, default=None,
+                        help="checkpoint the core to this .npz when the run stops, running out of --max-iters is not an error")
+    parser.add_argument('--restore', type=str, default=None, help="continue from a checkpoint instead of loading --file")
+    parser.add_argument('--sample-period', type=int, default=None,
+                        help="sampled simulation: functional blocks with a detailed window every this many instructions")
+    parser.add_argument('--sample-window', type=int, default=10000, help="detailed instructions per sample")
+    parser.add_argument('--sample-warmup', type=int, default=1000, help="detailed but uncounted instructions before each sample")
+    parser.add_argument('--sample-range', action='append', default=[], metavar='LABEL[:END]',
+                        help="sampled simulation: detailed only inside these labels (needs --symbols), may be repeated")
     args=parser.parse_args()
-    filename = args.file
-    print("Running file", filename)
-    cr = ControlRegister(0, 0)
-    core = Core(filename, cr)
-    core.run()
+    if not args.file and not args.source and not args.restore: parser.error("--file, --source or --restore is required")
+    from checkpoint import save, restore
+    if args.restore:
+        print("Restoring", args.restore)
+        core = restore(args.restore)
+        cr = core.cr
+    elif args.source:
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        import assembler
+        print("Running source", args.source)
+        with open(args.source) as f:
+            image = assembler.assemble(f.read(), args.start, os.path.dirname(os.path.abspath(args.source)))
+        cr = ControlRegister(args.start, args.sp, args.dim)
+        core = Core.from_bytes(image, cr)
+    else:
+        filename = args.file
+        print("Running file", filename)
+        cr = ControlRegister(args.start, args.sp, args.dim)
+        core = Core(filename, cr)
+    for m in args.map:
+        path, addr = m.rsplit('@', 1)
+        core.map_file(path, int(addr, 0))
+    symbols = load_symbols(args.symbols, cr.start_address) if args.symbols else None
+    core.symbols = symbols or {}
+    for b in args.breaks:
+        core.breakpoints.add(core.symbols[b] if b in core.symbols else int(b, 0))
+    for w in args.watch:
+        addr, _, size = w.partition(':')
+        core.watch(int(addr, 0), int(size, 0) if size else 4)
+    debugging = args.breaks or args.watch or args.wallclock is not None
+    core.trace = open_trace(args.trace, args.trace_file, args.trace_ring)
+    if args.perf: core.perf = Counters()
+    if args.timing: core.timing = TimingModel(TimingConfig(dim=cr.dim))
+    if args.fast_gemm or args.fast_gemm_verify:
+        core.fastforward = GemmFastForward(args.fast_gemm_verify)
+        core.fastforward.attach(core, symbols)
+    sampler = None
+    if args.sample_period or args.sample_range:
+        from sampling import Sampler, label_ranges
+        ranges = label_ranges(symbols, args.sample_range) if args.sample_range else None
+        sampler = Sampler(core, args.sample_period or 0, args.sample_window, args.sample_warmup, ranges)
+    try:
+        if sampler is not None:
+            why = sampler.run(args.max_iters, resume=args.restore is not None)
+            if args.save or debugging: core.report_stop(why)
+            else: assert why == "halt", "did not halt gracefully"
+        elif args.save or debugging:
+            core.report_stop(core.run_until(budget=args.max_iters, wallclock=args.wallclock, mode=args.mode))
+        else: core.run(args.mode, args.max_iters, resume=args.restore is not None)
+    finally:
+        if core.trace is not None: core.trace.close()
+    if args.save:
+        save(core, args.save)
+        print(f"Checkpoint written to {args.save} at pc {core.pc:#x} after {core.retired} instructions.")
     core.print_scalar_regs()
-    # core.matrix_regs = np.random.random((16, 4, 4)) * 10
     core.print_matrix_regs()
+    if core.timing is not None: core.timing.report()
+    if sampler is not None: sampler.report()
+    if core.perf is not None:
+        core.perf.report(core, symbols)
@@ -0,0 +1,165 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# Sparse, paged 32 bit address space
+# - pages are numpy uint8 arrays allocated on first write (or first view)
+# - reads of untouched memory return zeros without allocating
+# - every page keeps uint32 and float16 views over the same buffer, so word and
+#   matrix accesses never copy
+# - host files can be mapped at fixed addresses, their pages are faulted in from
+#   the mapping only when the guest first touches them
+
+PAGE_BITS = 16
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+ADDR_MASK = 0xFFFFFFFF
+
+class Memory:
+    def __init__(self):
+        self.pages = {}  # page number -> uint8 array
+        self.words = {}  # page number -> uint32 view
+        self.halves = {} # page number -> float16 view
+        self.regions = [] # (addr, uint8 array) mapped host files, checked on page faults
+        self.files = []   # (path, addr, mode) of the mapped files, for checkpoints
+
+    def _map(self, n: int, buf: np.ndarray):
+        assert buf.dtype == np.uint8 and len(buf) == PAGE_SIZE
+        self.pages[n] = buf
+        self.words[n] = buf.view('<u4')
+        self.halves[n] = buf.view('<f2')
+        return buf
+
+    # page n if it exists or can be faulted in from a mapped file, else None
+    def lookup(self, n: int) -> np.ndarray:
+        p = self.pages.get(n)
+        if p is not None or not self.regions: return p
+        lo, hi = n << PAGE_BITS, (n + 1) << PAGE_BITS
+        for addr, buf in self.regions:
+            if addr >= hi or addr + len(buf) <= lo: continue
+            if addr <= lo and addr + len(buf) >= hi:
+                return self._map(n, buf[lo - addr: hi - addr])
+            p = self.pages.get(n)
+            if p is None: p = self._map(n, np.zeros(PAGE_SIZE, dtype=np.uint8))
+            a, b = max(addr, lo), min(addr + len(buf), hi)
+            p[a - lo: b - lo] = buf[a - addr: b - addr]
+        return self.pages.get(n)
+
+    def page(self, n: int) -> np.ndarray:
+        p = self.lookup(n)
+        if p is None: p = self._map(n, np.zeros(PAGE_SIZE, dtype=np.uint8))
+        return p
+
+    # place a buffer at addr, page-aligned full pages of a numpy buffer are mapped in place
+    def load(self, addr: int, data):
+        buf = data if isinstance(data, np.ndarray) else np.frombuffer(bytearray(data), dtype=np.uint8)
+        buf = buf.reshape(-1).view(np.uint8)
+        end = addr + len(buf)
+        a = addr
+        while a < end:
+            n, off = a >> PAGE_BITS, a & PAGE_MASK
+            take = min(PAGE_SIZE - off, end - a)
+            src = buf[a - addr: a - addr + take]
+            if take == PAGE_SIZE and n not in self.pages and src.flags.writeable:
+                self._map(n, src)
+            else:
+                self.page(n)[off: off + take] = src
+            a += take
+
+    def load_file(self, path: str, addr: int) -> np.ndarray:
+        buf = np.fromfile(path, dtype=np.uint8)
+        self.load(addr, buf)
+        return buf
+
+    # map a host file at addr without reading it
+    # - .npy files are mapped past their header, anything else is a raw blob
+    # - mode 'c' keeps guest stores private, 'r+' writes them through to the file
+    def map_file(self, path: str, addr: int, mode: str = 'c') -> np.ndarray:
+        if path.endswith('.npy'):
+            arr = np.load(path, mmap_mode=mode)
+            assert arr.flags.c_contiguous, f"{path} is not C-contiguous"
+            buf = arr.reshape(-1).view(np.uint8)
+        else:
+            buf = np.memmap(path, dtype=np.uint8, mode=mode)
+        self.map_buffer(buf, addr, path)
+        self.files.append((path, addr, mode))
+        return buf
+
+    # map a host uint8 buffer at addr: pages fully inside it are the buffer itself, so
+    # a buffer shared between processes (multicore.Cluster) is shared guest memory
+    def map_buffer(self, buf: np.ndarray, addr: int, name: str = "buffer"):
+        for other, obuf in self.regions:
+            assert addr + len(buf) <= other or other + len(obuf) <= addr, f"{name} overlaps a mapped file"
+        # pages already touched get the buffer contents now, the rest fault in lazily
+        for n in range(addr >> PAGE_BITS, ((addr + len(buf) - 1) >> PAGE_BITS) + 1):
+            p = self.pages.get(n)
+            if p is None: continue
+            lo = n << PAGE_BITS
+            a, b = max(addr, lo), min(addr + len(buf), lo + PAGE_SIZE)
+            p[a - lo: b - lo] = buf[a - addr: b - addr]
+        self.regions.append((addr, buf))
+
+    # byte ranges, may span pages
+    def read(self, addr: int, size: int) -> np.ndarray:
+        out = np.zeros(size, dtype=np.uint8)
+        a, end = addr, addr + size
+        while a < end:
+            n, off = a >> PAGE_BITS, a & PAGE_MASK
+            take = min(PAGE_SIZE - off, end - a)
+            p = self.lookup(n)
+            if p is not None: out[a - addr: a - addr + take] = p[off: off + take]
+            a += take
+        return out
+
+    def write(self, addr: int, data):
+        buf = np.frombuffer(data, dtype=np.uint8) if isinstance(data, (bytes, bytearray)) else data.reshape(-1).view(np.uint8)
+        a, end = addr, addr + len(buf)
+        while a < end:
+            n, off = a >> PAGE_BITS, a & PAGE_MASK
+            take = min(PAGE_SIZE - off, end - a)
+            self.page(n)[off: off + take] = buf[a - addr: a - addr + take]
+            a += take
+
+    # aligned words
+    def read_word(self, addr: int) -> int:
+        n = addr >> PAGE_BITS
+        w = self.words.get(n)
+        if w is None:
+            if self.lookup(n) is None: return 0
+            w = self.words[n]
+        return int(w[(addr & PAGE_MASK) >> 2])
+
+    def write_word(self, addr: int, value: int):
+        n = addr >> PAGE_BITS
+        if n not in self.words: self.page(n)
+        self.words[n][(addr & PAGE_MASK) >> 2] = value & ADDR_MASK
+
+    # zero-copy view of [addr, addr + size) as dtype, None if the range crosses a page
+    def view(self, addr: int, size: int, dtype=np.uint8) -> np.ndarray:
+        off = addr & PAGE_MASK
+        if off + size > PAGE_SIZE: return None
+        return self.page(addr >> PAGE_BITS)[off: off + size].view(dtype)
+
+    # rows x cols FP16 tile at addr, `stride` bytes between rows
+    # - a strided view straight into the page, None if the footprint crosses a page
+    #   or the rows are not 2 byte aligned
+    def tile(self, addr: int, stride: int, rows: int = 4, cols: int = 4) -> np.ndarray:
+        off = addr & PAGE_MASK
+        if (addr | stride) & 1 or stride < 0 or off + (rows - 1) * stride + cols * 2 > PAGE_SIZE: return None
+        n = addr >> PAGE_BITS
+        if n not in self.halves: self.page(n)
+        return as_strided(self.halves[n][off >> 1:], shape=(rows, cols), strides=(stride, 2))
+
+    # tile reads and writes, row by row through the byte path when there is no view
+    def read_tile(self, addr: int, stride: int, rows: int = 4, cols: int = 4) -> np.ndarray:
+        t = self.tile(addr, stride, rows, cols)
+        if t is not None: return t
+        return np.stack([self.read((addr + r * stride) & ADDR_MASK, cols * 2).view('<f2') for r in range(rows)])
+
+    def write_tile(self, addr: int, stride: int, value: np.ndarray):
+        rows, cols = value.shape
+        t = self.tile(addr, stride, rows, cols)
+        if t is not None:
+            t[...] = value
+            return
+        for r in range(rows):
+            self.write((addr + r * stride) & ADDR_MASK, np.ascontiguousarray(value[r], dtype='<f2'))
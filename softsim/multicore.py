@@ -0,0 +1,148 @@
+import gc
+import os
+import time
+import argparse
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from memory import Memory, PAGE_SIZE, PAGE_MASK
+from main import Core, ControlRegister
+from isa import ARRAY_DIM
+from timing import TimingModel, TimingConfig
+
+# Multi-core simulation
+# - a Cluster runs one Core per host process, all on the same binary, each with its
+#   own ControlRegister (start address, stack pointer, core id and core count)
+# - the shared window is one page aligned [addr, addr + size) range backed by
+#   multiprocessing.shared_memory and mapped in place into every core's Memory, so a
+#   store there is seen by every core at once; the rest of the address space (code,
+#   stacks) is private to each core
+# - core.id / core.count read the core's number and the number of cores, `barrier`
+#   finishes the core's DMA transfers and waits for all cores (Core.sync)
+# - with timing, every core has its own TimingModel and a barrier lets all cores go
+#   at the latest arrival cycle, the cluster takes as long as its slowest core
+# - the parent maps the window too: write inputs into `memory` before run, read
+#   results from it after
+# - a core failing breaks the barrier for the others; a core waiting at a barrier
+#   the others never reach waits forever, as it would in hardware
+
+class Cluster:
+    def __init__(self, memfile: str, crs: list, shared: tuple):
+        addr, size = shared
+        assert addr & PAGE_MASK == 0, "the shared window must start on a page boundary"
+        size = -(-size // PAGE_SIZE) * PAGE_SIZE
+        program = os.path.getsize(memfile)
+        for k, cr in enumerate(crs):
+            assert cr.start_address + program <= addr or addr + size <= cr.start_address, \
+                "the shared window must not overlap the program"
+            cr.core_id, cr.cores = k, len(crs)
+        self.memfile = memfile
+        self.crs = crs
+        self.addr, self.size = addr, size
+        self.segment = shared_memory.SharedMemory(create=True, size=size)
+        self.memory = Memory()
+        self.memory.map_buffer(np.ndarray(size, dtype=np.uint8, buffer=self.segment.buf), addr, "shared window")
+        self.results = []
+
+    # run every core to its halt (or max_iters), returns the per-core results
+    def run(self, mode: str = "interp", timing: bool = False, max_iters: int = None) -> list:
+        n = len(self.crs)
+        ctx = mp.get_context()
+        barrier = ctx.Barrier(n)
+        clock = ctx.Array('q', n, lock=False)
+        queue = ctx.Queue()
+        procs = [ctx.Process(target=run_core, args=(self.memfile, cr, self.segment.name, self.addr, self.size,
+                                                    mode, timing, max_iters, barrier, clock, queue))
+                 for cr in self.crs]
+        t0 = time.perf_counter()
+        for p in procs: p.start()
+        results = [queue.get() for _ in procs]
+        for p in procs: p.join()
+        self.seconds = time.perf_counter() - t0
+        self.results = sorted(results, key=lambda r: r["core"])
+        errors = [f"core {r['core']}: {r['error']}" for r in self.results if "error" in r]
+        assert not errors, "; ".join(errors)
+        return self.results
+
+    def summary(self) -> dict:
+        rs = self.results
+        s = {"cores": len(rs), "seconds": self.seconds, "halted": all(r["halted"] for r in rs),
+             "retired": sum(r["retired"] for r in rs), "max_retired": max(r["retired"] for r in rs)}
+        if all("cycles" in r for r in rs): s["cycles"] = max(r["cycles"] for r in rs)
+        return s
+
+    def report(self):
+        for r in self.results:
+            line = f"core {r['core']}: {'halted' if r['halted'] else 'stopped'} at pc {r['pc']:#x}  retired {r['retired']}"
+            if "cycles" in r:
+                line += f"  cycles {r['cycles']}  stalls " + "  ".join(f"{k} {v}" for k, v in sorted(r["stalls"].items()))
+            print(line)
+        s = self.summary()
+        print(f"{s['cores']} cores  retired {s['retired']} (slowest core {s['max_retired']})"
+              + (f"  cycles {s['cycles']}" if "cycles" in s else "") + f"  host {s['seconds']:.3f} s")
+
+    def close(self):
+        # the pages are views into the segment, they must go before it can be closed
+        self.memory = None
+        gc.collect()
+        self.segment.close()
+        self.segment.unlink()
+
+# one core, in its own process
+# - whatever goes wrong, the core reports back and breaks the barrier, so neither the
+#   parent nor the other cores wait for it
+def run_core(memfile, cr, name, addr, size, mode, timed, max_iters, barrier, clock, queue):
+    segment = shared_memory.SharedMemory(name=name)
+    result = {"core": cr.core_id}
+    memory = core = None
+    try:
+        memory = Memory()
+        memory.map_buffer(np.ndarray(size, dtype=np.uint8, buffer=segment.buf), addr, "shared window")
+        image = memory.load_file(memfile, cr.start_address)
+        core = Core(memfile, cr, memory, len(image))
+        core.barrier, core.clock = barrier, clock
+        if timed: core.timing = TimingModel(TimingConfig(dim=cr.dim))
+        core.run_until(budget=max_iters, mode=mode)
+        result.update(halted=core.halted, pc=core.pc, retired=core.retired, scalar_regs=list(core.scalar_regs))
+        if timed: result.update(cycles=core.timing.total_cycles(), stalls=dict(core.timing.stalls))
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+        barrier.abort()
+    finally:
+        queue.put(result)
+        memory = core = None
+        gc.collect()
+        segment.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--file', type=str, required=True, help="binary, run by every core")
+    parser.add_argument('--cores', type=int, default=2)
+    parser.add_argument('--start', type=lambda x: int(x, 0), default=0)
+    parser.add_argument('--sp', type=lambda x: int(x, 0), default=0x80000, help="stack pointer of core 0")
+    parser.add_argument('--stack-size', type=lambda x: int(x, 0), default=0x1000, help="core c starts at sp - c x this")
+    parser.add_argument('--dim', type=int, default=ARRAY_DIM, help="systolic array dimension, tiles are dim x dim")
+    parser.add_argument('--shared', type=str, required=True, metavar='ADDR:SIZE', help="shared window, ADDR page aligned")
+    parser.add_argument('--load', action='append', default=[], metavar='PATH@ADDR',
+                        help="copy a raw or .npy file into the shared window at ADDR, may be repeated")
+    parser.add_argument('--dump', action='append', default=[], metavar='ADDR:SIZE:PATH',
+                        help="write SIZE bytes of the shared window at ADDR to PATH after the run, may be repeated")
+    parser.add_argument('--mode', choices=['interp', 'block'], default='block')
+    parser.add_argument('--timing', action='store_true', help="model cycles per core, barriers wait for the slowest")
+    parser.add_argument('--max-iters', type=int, default=None, help="instruction budget per core")
+    args = parser.parse_args()
+    addr, size = (int(x, 0) for x in args.shared.split(':'))
+    crs = [ControlRegister(args.start, args.sp - c * args.stack_size, args.dim) for c in range(args.cores)]
+    cluster = Cluster(args.file, crs, (addr, size))
+    try:
+        for spec in args.load:
+            path, at = spec.rsplit('@', 1)
+            data = np.load(path) if path.endswith('.npy') else np.fromfile(path, dtype=np.uint8)
+            cluster.memory.write(int(at, 0), np.ascontiguousarray(data))
+        cluster.run(args.mode, args.timing, args.max_iters)
+        cluster.report()
+        for spec in args.dump:
+            at, n, path = spec.split(':', 2)
+            cluster.memory.read(int(at, 0), int(n, 0)).tofile(path)
+    finally:
+        cluster.close()
@@ -0,0 +1,82 @@
+import bisect
+from collections import Counter
+from isa import Opcode
+
+# Guest performance counters
+# - Core.perf is None when counting is off
+# - the run loops only count executions per pc (per block in block mode) and taken
+#   branches, everything else is derived from the decoded program when reporting
+# - a symbol file from `assembler.py --symbols` rolls the counts up per label
+
+# opcode that executed at pc: the cached decode, else the loaded program (the word
+# may have been overwritten since), else whatever decodes there now
+def opcode_at(core, pc: int):
+    cached = core.icache.get(pc)
+    if cached is not None: return cached[1].opcode
+    k = core.program.index(pc)
+    if k is not None and core.program.opcode[k]: return Opcode(int(core.program.opcode[k]))
+    try: return core.fetch(pc).opcode
+    except (AssertionError, KeyError): return Opcode.NOP
+
+class Counters:
+    def __init__(self):
+        self.hist = Counter()   # pc -> executions (interpreter)
+        self.blocks = Counter() # (start pc, end pc) -> executions (block mode)
+        self.taken = Counter()  # branch pc -> times taken
+
+    # per-pc execution histogram, merging interpreted and translated runs
+    def histogram(self) -> Counter:
+        h = Counter(self.hist)
+        for (start, end), n in self.blocks.items():
+            for pc in range(start, end, 4):
+                h[pc] += n
+        return h
+
+    def summary(self, core, pcs=None) -> dict:
+        h = self.histogram()
+        tile = core.matrix_regs[0].nbytes
+        s = {"retired": 0, "by_opcode": Counter(), "gemm": 0, "ldm_bytes": 0, "stm_bytes": 0, "dma_bytes": 0,
+             "branches_taken": 0, "branches_not_taken": 0}
+        for pc, n in h.items():
+            if pcs is not None and pc not in pcs: continue
+            op = opcode_at(core, pc)
+            s["retired"] += n
+            s["by_opcode"][op.name] += n
+            if op is Opcode.GEMM: s["gemm"] += n
+            elif op is Opcode.LDM: s["ldm_bytes"] += n * tile
+            elif op is Opcode.STM: s["stm_bytes"] += n * tile
+            elif op is Opcode.DMALD or op is Opcode.DMAST: s["dma_bytes"] += n * tile
+            elif op is Opcode.BTYPE:
+                s["branches_taken"] += self.taken[pc]
+                s["branches_not_taken"] += n - self.taken[pc]
+        return s
+
+    # counters per label, each pc belongs to the closest label at or below it
+    def by_label(self, core, symbols: dict) -> dict:
+        labels = sorted((addr, name) for name, addr in symbols.items())
+        starts = [a for a, _ in labels]
+        owned = {}
+        for pc in self.histogram():
+            k = bisect.bisect_right(starts, pc) - 1
+            name = labels[k][1] if k >= 0 else "<none>"
+            owned.setdefault(name, set()).add(pc)
+        return {name: self.summary(core, pcs) for name, pcs in owned.items()}
+
+    def report(self, core, symbols: dict = None):
+        rows = [("total", self.summary(core))]
+        if symbols: rows += sorted(self.by_label(core, symbols).items(), key=lambda kv: symbols.get(kv[0], -1))
+        for name, s in rows:
+            print(f"{name}:")
+            print(f"  retired {s['retired']}  gemm {s['gemm']}  ld.m bytes {s['ldm_bytes']}  st.m bytes {s['stm_bytes']}"
+                  f"  dma bytes {s['dma_bytes']}  branches taken {s['branches_taken']} / not taken {s['branches_not_taken']}")
+            print("  " + "  ".join(f"{op.lower()} {n}" for op, n in s["by_opcode"].most_common()))
+
+# `address label` per line, addresses in hex bytes relative to the load address
+def load_symbols(path: str, base: int = 0) -> dict:
+    symbols = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip(): continue
+            addr, name = line.split()
+            symbols[name] = base + int(addr, 16)
+    return symbols
@@ -0,0 +1,137 @@
+from collections import Counter
+from perf import Counters
+from timing import TimingModel, TimingConfig
+
+# Sampled simulation
+# - most of the run is functional: translated blocks without hooks (and the
+#   tiledmatmul fast-forward when one is attached), only instructions are counted
+# - detailed windows run the interpreter (Core.run_for) with perf counters and a
+#   fresh timing model, either periodically (`warmup` + `window` instructions out of
+#   every `period`) or for as long as the pc is inside selected ranges
+# - both modes stop at breakpoints and after stores into watchpoints, like run_until
+# - warmup instructions only fill the timing model's scoreboard, they are not counted
+# - whole-run statistics are the window statistics scaled by retired / sampled,
+#   cycles by the sampled cycles per instruction
+
+class Sampler:
+    def __init__(self, core, period: int = 100000, window: int = 10000, warmup: int = 1000,
+                 ranges=None, config: TimingConfig = None):
+        assert ranges or warmup + window <= period, "warmup + window must fit in the period"
+        self.core = core
+        self.period, self.window, self.warmup = period, window, warmup
+        self.ranges = list(ranges or [])  # [(lo, hi)) pcs run in detail
+        self.config = config
+        self.perf = Counters()            # counts of the sampled instructions
+        self.cycles = 0                   # sampled cycles, issue to issue
+        self.sampled = 0
+        self.windows = 0
+        self.stalls = Counter()
+
+    def inside(self, pc: int) -> bool:
+        return any(lo <= pc < hi for lo, hi in self.ranges)
+
+    # functional mode, at most n instructions or up to the next range entry
+    def functional(self, n: int):
+        core = self.core
+        saved = core.perf, core.timing, core.trace
+        core.perf = core.timing = core.trace = None
+        try:
+            core.run_for("block", n, resume=True, stops={lo for lo, _ in self.ranges} | core.breakpoints or None)
+        finally:
+            core.perf, core.timing, core.trace = saved
+
+    # interpreter run feeding `perf` (when counting) and `timing`, stops outside the
+    # ranges in range mode; returns instructions retired
+    def detailed(self, n: int, timing: TimingModel, perf: Counters = None) -> int:
+        core = self.core
+        retired = core.retired
+        saved = core.perf, core.timing, core.trace
+        core.perf, core.timing, core.trace = perf, timing, None
+        try:
+            core.run_for("interp", n, resume=True, stops=Outside(self) if self.ranges else core.breakpoints or None)
+        finally:
+            core.perf, core.timing, core.trace = saved
+        return core.retired - retired
+
+    # a store into a watchpoint or a breakpoint reached since `retired`
+    def stopped(self, retired: int) -> bool:
+        core = self.core
+        return core.watch_hit is not None or (core.retired > retired and core.pc in core.breakpoints)
+
+    def sample(self, budget: int):
+        core = self.core
+        retired = core.retired
+        timing = TimingModel(self.config or TimingConfig(dim=core.dim))
+        if not self.ranges:
+            self.detailed(min(self.warmup, budget), timing)
+            if core.halted or self.stopped(retired): return
+            budget -= core.retired - retired
+        now, stalls = timing.now, Counter(timing.stalls)
+        self.sampled += self.detailed(budget if self.ranges else min(self.window, budget), timing, self.perf)
+        self.cycles += timing.now - now
+        self.stalls += timing.stalls - stalls
+        self.windows += 1
+
+    # run until halt or max_iters (None never gives up), resuming from the core's current state
+    # returns why it stopped: "halt", "breakpoint", "watchpoint" or "budget"
+    def run(self, max_iters: int = None, resume: bool = False) -> str:
+        core = self.core
+        if not resume: core.reset()
+        end = float('inf') if max_iters is None else core.retired + max_iters
+        detail = False
+        while not core.halted and core.retired < end:
+            retired = core.retired
+            left = end - retired
+            if self.ranges: detail = self.inside(core.pc)
+            if detail: self.sample(left)
+            else: self.functional(left if self.ranges else min(self.period - self.warmup - self.window, left))
+            detail = not detail
+            if core.watch_hit is not None: return "watchpoint"
+            if self.stopped(retired): return "breakpoint"
+        return "halt" if core.halted else "budget"
+
+    def summary(self) -> dict:
+        core = self.core
+        s = self.perf.summary(core)
+        scale = core.retired / self.sampled if self.sampled else 0.0
+        estimate = {k: round(v * scale) for k, v in s.items() if isinstance(v, int)}
+        estimate["by_opcode"] = {op: round(n * scale) for op, n in s["by_opcode"].items()}
+        cpi = self.cycles / self.sampled if self.sampled else 0.0
+        estimate["cycles"] = round(cpi * core.retired)
+        return {"retired": core.retired, "sampled": self.sampled, "windows": self.windows,
+                "coverage": self.sampled / core.retired if core.retired else 0.0,
+                "cpi": cpi, "stalls": dict(self.stalls), "sample": s, "estimate": estimate}
+
+    def report(self):
+        s = self.summary()
+        e = s["estimate"]
+        print(f"retired {s['retired']}  sampled {s['sampled']} in {s['windows']} windows ({100 * s['coverage']:.1f}%)")
+        print(f"estimated: cycles {e['cycles']}  cpi {s['cpi']:.3f}  gemm {e['gemm']}  ld.m bytes {e['ldm_bytes']}"
+              f"  st.m bytes {e['stm_bytes']}  branches taken {e['branches_taken']} / not taken {e['branches_not_taken']}")
+        print("  " + "  ".join(f"{op.lower()} {n}" for op, n in sorted(e["by_opcode"].items(), key=lambda kv: -kv[1])))
+        if s["stalls"]: print("sampled stalls: " + "  ".join(f"{k} {v}" for k, v in sorted(s["stalls"].items())))
+
+# run_for stops in range mode: every pc outside the ranges, and the breakpoints
+class Outside:
+    def __init__(self, sampler: Sampler):
+        self.sampler = sampler
+
+    def __contains__(self, pc: int) -> bool:
+        return not self.sampler.inside(pc) or pc in self.sampler.core.breakpoints
+
+# [lo, hi) pc ranges for `label` (up to the next symbol) or `label:end` specs
+def label_ranges(symbols: dict, specs) -> list:
+    starts = sorted(set(symbols.values()))
+    ranges = []
+    for spec in specs:
+        first, _, last = spec.partition(":")
+        assert first in symbols, f"unknown label '{first}'"
+        lo = symbols[first]
+        if last:
+            assert last in symbols, f"unknown label '{last}'"
+            hi = symbols[last]
+        else:
+            later = [a for a in starts if a > lo]
+            hi = later[0] if later else 1 << 32
+        ranges.append((lo, hi))
+    return ranges
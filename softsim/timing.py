@@ -0,0 +1,136 @@
+from collections import Counter
+from isa import Opcode, ARRAY_DIM
+
+# Cycle-level timing model
+# - in-order, single issue front end fed with every retired instruction
+# - scoreboard of ready cycles for scalar and matrix registers
+# - the systolic array takes a new gemm every `dim` cycles and produces its result
+#   after fill + stream + drain = 3 * dim - 2 cycles, so only gemms that depend
+#   on each other's accumulators wait for the drain
+# - ld.m / st.m share one memory port with a fixed latency and bandwidth
+# - dma.ld / dma.st use the same port but issue without waiting for it: transfers
+#   queue behind each other (up to `dma_depth` in flight) and finish in order
+#   latency + transfer cycles after they get the port; dma.wait stalls until the
+#   tag's last transfer is done, registers filled by dma.ld are not scoreboarded
+# - stall cycles are charged to whatever issue was last waiting on
+
+class TimingConfig:
+    def __init__(self, dim=ARRAY_DIM, alu=1, load=2, store=1, branch_taken=2, jump=2,
+                 mem_latency=10, mem_bandwidth=8, elem_bytes=2, dma_depth=8):
+        self.dim = dim                     # systolic array is dim x dim
+        self.alu = alu                     # scalar result latency
+        self.load = load                   # lw result latency
+        self.store = store                 # sw occupancy
+        self.branch_taken = branch_taken   # refetch bubble after a taken branch
+        self.jump = jump                   # refetch bubble after jal/jalr
+        self.mem_latency = mem_latency     # ld.m first byte latency
+        self.mem_bandwidth = mem_bandwidth # matrix port bytes per cycle
+        self.elem_bytes = elem_bytes       # bytes per matrix element
+        self.dma_depth = dma_depth         # dma transfers in flight before dma.ld / dma.st stall
+
+    @property
+    def gemm_latency(self):
+        return 3 * self.dim - 2
+
+    @property
+    def tile_cycles(self):
+        return -(-self.dim * self.dim * self.elem_bytes // self.mem_bandwidth)
+
+class TimingModel:
+    def __init__(self, config: TimingConfig = None):
+        self.config = config or TimingConfig()
+        self.now = 0                # next issue cycle
+        self.xready = [0] * 32      # scalar register ready cycles
+        self.mready = [0] * 16      # matrix register ready cycles
+        self.array_free = 0         # next cycle the array accepts a gemm
+        self.port_free = 0          # next cycle the matrix memory port is free
+        self.array_busy = 0         # cycles the array spent streaming
+        self.port_busy = 0          # cycles the port spent transferring
+        self.dma_inflight = []      # done cycles of queued dma transfers, in order
+        self.dma_tags = {}          # tag -> done cycle of its last transfer
+        self.instructions = 0
+        self.stalls = Counter()     # reason -> cycles
+
+    # issue at the earliest cycle all (ready cycle, reason) constraints allow
+    def _issue(self, *waits):
+        t, why = self.now, None
+        for ready, reason in waits:
+            if ready > t: t, why = ready, reason
+        if why is not None: self.stalls[why] += t - self.now
+        return t
+
+    def issue(self, i, taken=False):
+        c = self.config
+        op = i.opcode
+        self.instructions += 1
+        x, m = self.xready, self.mready
+
+        if op is Opcode.GEMM:
+            t = self._issue((m[i.ra], "matrix dependency"), (m[i.rb], "matrix dependency"),
+                            (m[i.rc], "matrix dependency"), (self.array_free, "array busy"))
+            self.array_free = t + c.dim
+            self.array_busy += c.dim
+            m[i.rd] = t + c.gemm_latency
+        elif op is Opcode.LDM or op is Opcode.STM:
+            waits = [(x[i.rs1], "scalar dependency"), (x[i.rs2], "scalar dependency"), (self.port_free, "memory port")]
+            if op is Opcode.STM: waits.append((m[i.rd], "matrix dependency"))
+            t = self._issue(*waits)
+            self.port_free = t + c.tile_cycles
+            self.port_busy += c.tile_cycles
+            if op is Opcode.LDM: m[i.rd] = t + c.mem_latency + c.tile_cycles
+        elif op is Opcode.DMALD or op is Opcode.DMAST:
+            waits = [(x[i.rs1], "scalar dependency"), (x[i.rs2], "scalar dependency")]
+            if op is Opcode.DMAST: waits.append((m[i.rd], "matrix dependency"))
+            inflight = self.dma_inflight = [d for d in self.dma_inflight if d > self.now]
+            if len(inflight) >= c.dma_depth: waits.append((inflight[len(inflight) - c.dma_depth], "dma queue full"))
+            t = self._issue(*waits)
+            start = max(t, self.port_free)
+            self.port_free = start + c.tile_cycles
+            self.port_busy += c.tile_cycles
+            done = start + c.mem_latency + c.tile_cycles
+            inflight.append(done)
+            self.dma_tags[i.imm] = done
+        elif op is Opcode.DMAWAIT:
+            t = self._issue((self.dma_tags.get(i.imm, 0), "dma wait"))
+        else:
+            waits = []
+            if i.rs1 is not None: waits.append((x[i.rs1], "scalar dependency"))
+            if i.rs2 is not None and not i.use_imm: waits.append((x[i.rs2], "scalar dependency"))
+            if op is Opcode.SW: waits.append((x[i.rs2], "scalar dependency"))
+            t = self._issue(*waits)
+            if op is Opcode.LW: x[i.rd] = t + c.load
+            elif op is Opcode.SW: t += c.store - 1
+            elif i.rd is not None: x[i.rd] = t + c.alu
+            if op is Opcode.BTYPE and taken:
+                t += c.branch_taken
+                self.stalls["control"] += c.branch_taken
+            elif op is Opcode.JAL or op is Opcode.JALR:
+                t += c.jump
+                self.stalls["control"] += c.jump
+        self.now = t + 1
+
+    # whether every transfer with the tag has finished by the next issue cycle (dma.poll)
+    def dma_done(self, tag: int) -> bool:
+        return self.dma_tags.get(tag, 0) <= self.now
+
+    # cycle the last result is visible, i.e. the run length with everything drained
+    def total_cycles(self) -> int:
+        return max([self.now, self.array_free, self.port_free] + self.xready + self.mready + list(self.dma_tags.values()))
+
+    def summary(self) -> dict:
+        total = self.total_cycles()
+        return {
+            "cycles": total,
+            "instructions": self.instructions,
+            "ipc": self.instructions / total if total else 0.0,
+            "array_utilization": self.array_busy / total if total else 0.0,
+            "port_utilization": self.port_busy / total if total else 0.0,
+            "stalls": dict(self.stalls),
+            "drain": total - self.now,
+        }
+
+    def report(self):
+        s = self.summary()
+        print(f"cycles {s['cycles']}  instructions {s['instructions']}  ipc {s['ipc']:.3f}")
+        print(f"array utilization {100 * s['array_utilization']:.1f}%  matrix port utilization {100 * s['port_utilization']:.1f}%")
+        print("stalls: " + "  ".join(f"{k} {v}" for k, v in sorted(s["stalls"].items())) + f"  drain {s['drain']}")
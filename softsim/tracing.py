@@ -0,0 +1,99 @@
+import sys
+import argparse
+from array import array
+from collections import deque
+import numpy as np
+from isa import Opcode
+from decode import Instruction
+
+# Execution tracing
+# - Core.trace is None when tracing is off, the run loops only test that once per instruction
+# - every tracer takes record(pc, word, rd value) after an instruction retires
+# - binary traces are flat little-endian (pc, word, rd) uint32 records, rendered offline
+
+TRACE_DTYPE = np.dtype([('pc', '<u4'), ('word', '<u4'), ('rd', '<u4')])
+
+# opcodes whose rd is a scalar register written by the instruction
+writes_rd = {Opcode.RTYPE, Opcode.ITYPE, Opcode.LUI, Opcode.LW, Opcode.JAL, Opcode.JALR, Opcode.DMAPOLL,
+             Opcode.COREID, Opcode.NCORES}
+
+def render_record(pc: int, word: int, value: int, decoded: dict) -> str:
+    text = decoded.get(word)
+    if text is None:
+        try:
+            i = Instruction.decode_word(word)
+            text = i.text()
+            if i.opcode in writes_rd: text = text.ljust(28) + " -> {}"
+        except (AssertionError, KeyError):
+            text = f"- .word {word:#010x}"
+        decoded[word] = text
+    return f"{pc:08x}: " + text.format(np.int32(np.uint32(value)))
+
+# live text, the old print-every-instruction behaviour, to stdout or to a file at path
+class TextTrace:
+    def __init__(self, path: str = None):
+        self.f = open(path, "w") if path else None
+        self.out = self.f or sys.stdout
+        self.decoded = {}
+
+    def record(self, pc, word, value):
+        print(render_record(pc, word, value, self.decoded), file=self.out)
+
+    def close(self):
+        if self.f is not None: self.f.close()
+
+# records are packed into an array('I') and written out a chunk at a time
+class BinaryTrace:
+    def __init__(self, path: str, chunk: int = 1 << 16):
+        self.f = open(path, "wb")
+        self.buf = array('I')
+        self.limit = 3 * chunk
+
+    def record(self, pc, word, value):
+        buf = self.buf
+        buf.append(pc); buf.append(word); buf.append(value)
+        if len(buf) >= self.limit: self.flush()
+
+    def flush(self):
+        self.buf.tofile(self.f)
+        del self.buf[:]
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+# keeps only the last n records in memory, dumped on close (or on demand)
+class RingTrace:
+    def __init__(self, n: int, path: str = None):
+        self.ring = deque(maxlen=n)
+        self.path = path
+
+    def record(self, pc, word, value):
+        self.ring.append((pc, word, value))
+
+    def records(self) -> np.ndarray:
+        return np.array(list(self.ring), dtype=np.uint32).reshape(-1, 3).view(TRACE_DTYPE).reshape(-1)
+
+    def close(self):
+        if self.path is not None: self.records().tofile(self.path)
+
+def open_trace(level: str, path: str = None, ring: int = 1 << 16):
+    if level == "off": return None
+    if level == "text": return TextTrace(path)
+    if level == "binary":
+        assert path is not None, "binary traces need a file"
+        return BinaryTrace(path)
+    if level == "ring": return RingTrace(ring, path)
+    assert False, f"unknown trace level {level}"
+
+def render(path: str, out=None):
+    out = out or sys.stdout
+    decoded = {}
+    for pc, word, value in np.fromfile(path, dtype=TRACE_DTYPE).tolist():
+        print(render_record(pc, word, value, decoded), file=out)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="render a binary trace as text")
+    parser.add_argument('trace', type=str)
+    args = parser.parse_args()
+    render(args.trace)
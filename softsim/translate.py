@@ -0,0 +1,219 @@
+import numpy as np
+from isa import Opcode, alu_src, branch_src, M, S
+from tracing import writes_rd
+
+# Basic-block translation
+# - a block is a run of instructions ending in a BTYPE, JAL, JALR or HALT
+# - each block is compiled once into a python function `block(r) -> next pc`
+#   working directly on the core's scalar register list, with the same integer
+#   expressions as the interpreter (isa.alu_src / branch_src)
+# - writes to x0 are dropped at translation time
+# - semantics mirror Core._run, which stays the reference
+# - with a tracer or timing model attached, blocks are compiled with a call per
+#   instruction, without one they carry no hook code at all
+# - run stops in front of given pcs, blocks end before such a pc so falling
+#   through into it stops as well
+# - a store into a watchpoint stops the run after the block doing it
+# - a store into the running block itself leaves it right after the store, the
+#   rest of the block is re-translated from the patched words
+# - compiled code is shared by every core in the process, keyed by the block source,
+#   so running the same kernel again (server.py) only re-binds it to the new core
+
+MAX_BLOCK = 256 # cap on straight-line code per block
+MAX_COMPILED = 1 << 16 # code objects kept, dropped all at once past this
+compiled = {} # block source -> code object
+terminators = {Opcode.BTYPE, Opcode.JAL, Opcode.JALR, Opcode.HALT}
+matrix_ops = {Opcode.GEMM, Opcode.LDM, Opcode.STM}
+stores = {Opcode.SW, Opcode.STM}
+
+class Block:
+    __slots__ = ('pc', 'end', 'size', 'fn', 'source', 'branch', 'target')
+
+def operands(i):
+    a = f"r[{i.rs1}]"
+    b = str(i.imm) if i.use_imm else f"r[{i.rs2}]"
+    return a, b
+
+def branch_cond(i):
+    return branch_src[i.branch_cond].format(a=f"r[{i.rs1}]", b=f"r[{i.rs2}]")
+
+def translate_instr(i, pc):
+    op = i.opcode
+    if op is Opcode.RTYPE or op is Opcode.ITYPE:
+        if not i.rd: return []
+        a, b = operands(i)
+        return [f"r[{i.rd}] = " + alu_src[i.aluop].format(a=a, b=b)]
+    if op is Opcode.LUI:
+        return [f"r[{i.rd}] = {(i.imm & 0x000FFFFF) << 12}"] if i.rd else []
+    if op is Opcode.LW:
+        return [f"{f'r[{i.rd}]' if i.rd else '_'} = load((r[{i.rs1}] + {i.imm}) & M)"]
+    if op is Opcode.SW:
+        return [f"store((r[{i.rs1}] + {i.imm}) & M, r[{i.rs2}])"]
+    if op is Opcode.GEMM:
+        return [f"mr[{i.rd}] = matmul(mr[{i.ra}], mr[{i.rb}]) + mr[{i.rc}]"]
+    if op is Opcode.LDM:
+        return [f"mr[{i.rd}] = load_tile((r[{i.rs1}] + {i.imm}) & M, r[{i.rs2}])"]
+    if op is Opcode.STM:
+        return [f"store_tile((r[{i.rs1}] + {i.imm}) & M, r[{i.rs2}], mr[{i.rd}])"]
+    if op is Opcode.DMALD:
+        return [f"dma.load({i.rd}, r[{i.rs1}], r[{i.rs2}], {i.imm})"]
+    if op is Opcode.DMAST:
+        return [f"dma.store({i.rd}, r[{i.rs1}], r[{i.rs2}], {i.imm})"]
+    if op is Opcode.DMAWAIT:
+        return [f"dma.wait({i.imm})"]
+    if op is Opcode.DMAPOLL:
+        return [f"{f'r[{i.rd}]' if i.rd else '_'} = dma.poll({i.imm})"]
+    if op is Opcode.BARRIER:
+        return ["sync()"]
+    if op is Opcode.COREID:
+        return [f"r[{i.rd}] = core.cr.core_id"] if i.rd else []
+    if op is Opcode.NCORES:
+        return [f"r[{i.rd}] = core.cr.cores"] if i.rd else []
+    # terminators return the next pc, None means halted
+    if op is Opcode.HALT:
+        return ["return None"]
+    link = [f"r[{i.rd}] = {pc + 4}"] if i.rd else []
+    if op is Opcode.BTYPE:
+        return [f"return {pc + i.imm} if {branch_cond(i)} else {pc + 4}"]
+    if op is Opcode.JAL:
+        return link + [f"return {pc + i.imm}"]
+    if op is Opcode.JALR:
+        return [f"t = (r[{i.rs1}] + {i.imm}) & M"] + link + ["return t"]
+    assert False, f"cannot translate {op}"
+
+class BlockCache:
+    def __init__(self, core):
+        self.core = core
+        self.blocks = {}  # start pc -> Block
+        self.owners = {}  # instruction address -> start pcs of blocks containing it
+        self.splits = set() # addresses blocks must not run through
+        self.running = None # start pc of the block being executed
+        self.smc = [False] # set when a store hits the running block, checked after each store
+        self.traced = core.trace is not None
+        self.timed = core.timing is not None
+        self.hooks = (self.traced, self.timed)
+
+    def env(self):
+        core = self.core
+        return {
+            'M': M,
+            'S': S,
+            'matmul': np.matmul,
+            'load': core.memread,
+            'store': core.memwrite,
+            'load_tile': core.load_tile,
+            'store_tile': core.store_tile,
+            'dma': core.dma,
+            'sync': core.sync,
+            'smc': self.smc,
+            'rec': core.trace.record if self.traced else None,
+            'tm': core.timing.issue if self.timed else None,
+        }
+
+    def translate(self, pc: int) -> Block:
+        body, addr, uses_mr, instrs = [], pc, False, {}
+        while True:
+            i = self.core.fetch(addr)
+            uses_mr |= i.opcode in matrix_ops
+            lines = translate_instr(i, addr)
+            if self.traced:
+                rd = f"r[{i.rd}]" if i.opcode in writes_rd else "0"
+                rec = f"rec({addr}, {self.core.icache[addr][0]}, {rd})"
+                # terminators record before their return
+                if i.opcode in terminators: lines.insert(len(lines) - 1, rec)
+                else: lines.append(rec)
+            if self.timed:
+                name = f"I{len(instrs)}"
+                instrs[name] = i
+                taken = branch_cond(i) if i.opcode is Opcode.BTYPE else "False"
+                if i.opcode in terminators: lines.insert(len(lines) - 1, f"tm({name}, {taken})")
+                else: lines.append(f"tm({name})")
+            if i.opcode in stores: lines.append(f"if smc[0]: return {addr + 4}")
+            body += lines
+            addr += 4
+            if i.opcode in terminators: break
+            if (addr - pc) // 4 >= MAX_BLOCK or addr in self.splits:
+                body.append(f"return {addr}")
+                break
+        head = ["mr = core.matrix_regs"] if uses_mr else []
+        src = f"def block_{pc:x}(r):\n" + "".join(f"    {line}\n" for line in head + body)
+        env = self.env()
+        env['core'] = self.core
+        env.update(instrs)
+        code = compiled.get(src)
+        if code is None:
+            if len(compiled) >= MAX_COMPILED: compiled.clear()
+            code = compiled[src] = compile(src, f"<block {pc:#x}>", "exec")
+        exec(code, env)
+        b = Block()
+        b.pc, b.end, b.size = pc, addr, (addr - pc) // 4
+        b.fn, b.source = env[f"block_{pc:x}"], src
+        # taken-branch target, for the perf counters
+        b.branch = b.target = None
+        if i.opcode is Opcode.BTYPE: b.branch, b.target = addr - 4, addr - 4 + i.imm
+        self.blocks[pc] = b
+        for a in range(pc, addr, 4):
+            self.owners.setdefault(a, []).append(pc)
+        return b
+
+    # a store into translated code drops every block covering that word
+    def invalidate(self, addr: int):
+        for start in self.owners.pop(addr, ()):
+            if start == self.running: self.smc[0] = True
+            b = self.blocks.pop(start, None)
+            if b is None: continue
+            for a in range(b.pc, b.end, 4):
+                if a != addr and a in self.owners:
+                    self.owners[a] = [s for s in self.owners[a] if s != start]
+
+    # end blocks in front of these addresses, dropping translations that run through them
+    def split(self, addrs):
+        for addr in set(addrs) - self.splits:
+            self.splits.add(addr)
+            if any(start != addr for start in self.owners.get(addr, ())): self.invalidate(addr)
+
+    # run from pc until HALT, a pc in stops (not the first), a watchpoint hit or
+    # until at least max_iters instructions retired, a fast-forwarded call may retire up
+    # to limit (default max_iters)
+    # returns (pc, instructions retired, halted)
+    def run(self, pc: int, max_iters: int, stops: set = None, limit=None):
+        if stops: self.split(stops)
+        core = self.core
+        r = core.scalar_regs
+        blocks = self.blocks
+        perf = core.perf
+        watching = bool(core.guards)
+        ff = core.fastforward if not (self.traced or self.timed or watching or stops) else None
+        if limit is None: limit = max_iters
+        n = 0
+        halted = False
+        while n < max_iters:
+            if stops is not None and pc in stops and n: break
+            if ff is not None and pc in ff.entries:
+                done = ff.run(core, r, pc, limit - n)
+                if done is not None:
+                    pc, k = done
+                    n += k
+                    continue
+            b = blocks.get(pc)
+            if b is None: b = self.translate(pc)
+            self.running = b.pc
+            nxt = b.fn(r)
+            end = b.end
+            if self.smc[0]:
+                # left early after patching itself
+                self.smc[0] = False
+                end = nxt
+            n += (end - b.pc) // 4
+            if perf is not None:
+                perf.blocks[b.pc, end] += 1
+                if b.branch is not None and nxt == b.target and end == b.end: perf.taken[b.branch] += 1
+            if nxt is None:
+                # stop on the halt like the interpreter, so a resumed run halts again
+                pc = b.end - 4
+                halted = True
+                break
+            pc = nxt
+            if watching and core.watch_hit is not None: break
+        self.running = None
+        return pc, n, halted
@@ -0,0 +1,38 @@
+import os
+import sys
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "softsim"))
+sys.path.insert(0, ROOT)
+import assembler
+from main import Core, ControlRegister
+
+# a core running `source`, assembled at `start`, with its labels as symbols
+def build(source: str, start: int = 0, sp: int = 0x8000, dim: int = 4, **cr) -> Core:
+    asm = assembler.assemble_lines(assembler.parse_source(source), base=start, source_dir=os.path.join(ROOT, "kernels"))
+    core = Core.from_bytes(asm.image(), ControlRegister(start, sp, dim, **cr))
+    core.symbols = asm.labels()
+    return core
+
+def kernel(name: str) -> str:
+    with open(os.path.join(ROOT, "kernels", name)) as f:
+        return f.read()
+
+# driver calling tiledmatmul on n x k x m tiles at W, I, Y, then the kernel itself
+W, I, Y = 0x100000, 0x200000, 0x300000
+
+def gemm_program(n: int, k: int, m: int, name: str = "tiledmatmul.S") -> str:
+    return (f"li.i x10, {W}\nli.i x11, {I}\nli.i x12, {Y}\n"
+            f"li.i x13, {n}\nli.i x14, {k}\nli.i x15, {m}\n"
+            f"jal x1, {name[:-2]}\nhalt\n" + kernel(name))
+
+# random fp16 W, I and B loaded into core, returns them
+def gemm_inputs(core: Core, n: int, k: int, m: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    w, i, b = (rng.standard_normal(s).astype(np.float16) for s in ((4 * n, 4 * k), (4 * k, 4 * m), (4 * n, 4 * m)))
+    for addr, a in ((W, w), (I, i), (Y, b)): core.memory.write(addr, a)
+    return w, i, b
+
+def gemm_result(core: Core, n: int, m: int) -> np.ndarray:
+    return core.memory.read(Y, 32 * n * m).view(np.float16).reshape(4 * n, 4 * m)
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+import assembler
+from conftest import build
+
+def words(source: str) -> list:
+    return np.frombuffer(assembler.assemble(source), dtype='<u4').tolist()
+
+# encodings as given by the RISC-V spec (and GNU as) for the same instructions
+@pytest.mark.parametrize("source, expected", [
+    ("beq x5, x6, 8", [0x00628463]),
+    ("beq x5, x6, -8", [0xFE628CE3]),
+    ("bne x10, x0, -4096", [0x80051063]),
+    ("blt x1, x2, 4094", [0x7E20CFE3]),
+    ("bge x7, x8, -2", [0xFE83DFE3]),
+    ("jal x1, 2048", [0x001000EF]),
+    ("jal x0, -4", [0xFFDFF06F]),
+    ("jal x1, -1048576", [0x800000EF]),
+    ("jalr x0, x1, 0", [0x00008067]),
+    ("addi.i x5, x6, -2048", [0x80030293]),
+    ("srai.i x5, x6, 31", [0x41F35293]),
+    ("lw.i x5, -4(x2)", [0xFFC12283]),
+    ("sw.i x5, -4(x2)", [0xFE512E23]),
+])
+def test_encoding(source, expected):
+    assert words(source) == expected
+
+def test_label_offsets():
+    source = "start:\naddi.i x5, x5, 1\nnop\nbne x5, x6, start\njal x0, end\nnop\nend:\nhalt\n"
+    w = words(source)
+    assert w[2] == words("bne x5, x6, -8")[0]
+    assert w[3] == words("jal x0, 8")[0]
+
+@pytest.mark.parametrize("value, expected", [
+    (0, [0x00000293]),
+    (2047, [0x7FF00293]),
+    (-1, [0xFFF00293]),
+    (-2048, [0x80000293]),
+    (2048, [0x000012B7, 0x80028293]),
+    (0x12345FFF, [0x123462B7, 0xFFF28293]),
+    (-4096, [0xFFFFF2B7]),
+    (0x80000000, [0x800002B7]),
+    (0x7FFFFFFF, [0x800002B7, 0xFFF28293]),
+    (-0x12345678, [0xEDCBB2B7, 0x98828293]),
+])
+def test_li(value, expected):
+    assert words(f"li x5, {value}") == expected
+    assert words(f"li.i x5, {value:#x}" if value >= 0 else f"li.i x5, {value}") == expected
+    core = build(f"li.i x5, {value}\nhalt\n")
+    core.run_until()
+    assert core.scalar_regs[5] == value & 0xFFFFFFFF
+
+def test_li_label():
+    # label addresses always take lui + addi, they are only known at the end
+    w = words("li.i x5, data\nhalt\n.data\ndata:\n.word 1\n")
+    assert len(w) == 4 and w[0] & 0x7F == 0x37 and w[1] & 0x7F == 0x13
+
+@pytest.mark.parametrize("source, expected", [
+    ("mv x5, x6", ["addi.i x5, x6, 0"]),
+    ("mv.i x5, x6", ["addi.i x5, x6, 0"]),
+    ("ret", ["jalr x0, x1, 0"]),
+    ("nop", ["addi.i x0, x0, 0"]),
+    ("bge x5, x6, loop", ["bge.i x5, x6, loop"]),
+    ("push x1", ["addi.i x2, x2, -4", "sw.i x1, 0(x2)"]),
+    ("pop x1", ["lw.i x1, 0(x2)", "addi.i x2, x2, 4"]),
+    ("add.i x5, x6, x7", ["add.i x5, x6, x7"]),
+])
+def test_pseudo(source, expected):
+    assert assembler.handle_pseudo_instruction(source) == expected
+
+@pytest.mark.parametrize("source", ["addi.i x5, x6, 2048", "addi.i x5, x6, -2049", "slli.i x5, x6, 32",
+                                    "lw.i x5, 4096(x2)", "add.i x5, x6", "frob x1", "lw.i x5, x2"])
+def test_errors(source):
+    with pytest.raises(ValueError):
+        assembler.assemble(source)
+
+# ld.m / st.m carry an 11 bit signed offset, lui a 20 bit upper immediate
+@pytest.mark.parametrize("source", ["ld.m m1, x5, 1024[x6]", "st.m m1, x5, -1025[x6]",
+                                    "lui.i x5, 0x100000", "lui.i x5, -1"])
+def test_tile_and_upper_range(source):
+    with pytest.raises(ValueError):
+        assembler.assemble(source)
+
+def test_tile_offsets():
+    for imm in (-1024, -4, 0, 1023):
+        w = words(f"ld.m m1, x5, {imm}[x6]")[0]
+        assert ((w >> 7) & 0x7FF) == imm & 0x7FF
+    assert words("lui.i x5, 0xFFFFF") == [0xFFFFF2B7]
+
+# branches reach +-4 KiB and jal +-1 MiB, a label further away is an error rather than a wrapped offset
+@pytest.mark.parametrize("source", ["beq x5, x6, 4096", "bne x5, x6, -4098", "jal x0, 1048576", "jal x1, -1048578",
+                                    "beq x5, x6, far\n" + "nop\n" * 1024 + "far:\nhalt\n"])
+def test_offset_range(source):
+    with pytest.raises(ValueError):
+        assembler.assemble(source)
@@ -0,0 +1,87 @@
+import numpy as np
+import assembler
+from main import Core, ControlRegister
+from batch import BatchCore
+
+DATA = 0x2000
+
+# data dependent control flow: each lane takes its own path through the loops
+SOURCE = f"""li.i x20, {DATA}
+lw.i x5, 0(x20)         // per-lane value
+li.i x6, 0
+li.i x7, 1
+collatz:
+beq x5, x7, done
+addi.i x6, x6, 1
+andi.i x8, x5, 1
+bne x8, x0, odd
+srai.i x5, x5, 1
+beq x0, x0, collatz
+odd:
+slli.i x9, x5, 1
+add.i x5, x5, x9
+addi.i x5, x5, 1
+beq x0, x0, collatz
+done:
+lw.i x10, 4(x20)        // second per-lane value, may be negative
+sra.i x11, x10, x7
+slt.i x12, x10, x0
+sltu.i x13, x10, x0
+slti.i x14, x10, -5
+li.i x15, 0x7fffffff
+mul.i x16, x15, x10     // wraps
+sub.i x17, x0, x10
+blt x10, x0, negative
+sw.i x10, 8(x20)
+beq x0, x0, tiles
+negative:
+sw.i x17, 12(x20)
+tiles:
+li.i x18, 8
+ld.m m1, x18, 16[x20]
+gemm.m m2, m1, m1, m1
+st.m m2, x18, 48[x20]
+sw.i x6, 16(x20)
+halt
+"""
+
+def test_lanes_match_core(tmp_path):
+    path = tmp_path / "prog.bin"
+    path.write_bytes(assembler.assemble(SOURCE))
+    cr = ControlRegister(0, 0x8000)
+    rng = np.random.default_rng(0)
+    first = np.array([1, 2, 3, 7, 27, 97, 6, 1], dtype=np.uint32)
+    second = np.array([5, -1, -7, 0, -2 ** 31, 2 ** 31 - 1, 12, -100], dtype=np.int64).astype(np.uint32)
+    tiles = rng.standard_normal((8, 4, 4)).astype(np.float16)
+    n = len(first)
+    batch = BatchCore(str(path), cr, n)
+    batch.memory.write(DATA, np.stack([first, second], axis=1))
+    batch.memory.write(DATA + 16, tiles.reshape(n, -1))
+    batch.run()
+    assert batch.halted.all()
+    for k in range(n):
+        core = Core(str(path), cr)
+        core.memory.write(DATA, np.array([first[k], second[k]], dtype=np.uint32))
+        core.memory.write(DATA + 16, tiles[k])
+        core.run_until()
+        regs, mats = batch.lane(k)
+        assert list(regs) == core.scalar_regs, f"lane {k}"
+        assert np.array_equal(mats.view(np.uint16), core.matrix_regs.view(np.uint16)), f"lane {k}"
+        assert np.array_equal(batch.memory.read(DATA, 80)[k], core.memory.read(DATA, 80)), f"lane {k}"
+
+def test_budget(tmp_path):
+    path = tmp_path / "prog.bin"
+    path.write_bytes(assembler.assemble("loop:\njal x0, loop\n"))
+    batch = BatchCore(str(path), ControlRegister(0, 0x8000), 2)
+    batch.run(50)
+    assert not batch.halted.any()
+
+# the vector ALU is built from the same isa expressions as the scalar one
+def test_alu_cases(tmp_path):
+    from test_execute import CASES
+    path = tmp_path / "prog.bin"
+    for instr, a, b, expected in CASES:
+        path.write_bytes(assembler.assemble(f"li.i x6, {a}\nli.i x7, {b}\n{instr}\nhalt\n"))
+        batch = BatchCore(str(path), ControlRegister(0, 0x8000), 2)
+        batch.run()
+        assert [int(batch.lane(k)[0][5]) for k in range(2)] == [expected] * 2, instr
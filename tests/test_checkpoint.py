@@ -0,0 +1,80 @@
+import os
+import numpy as np
+import pytest
+import checkpoint
+from isa import ARRAY_DIM
+from conftest import build, gemm_program, gemm_inputs, gemm_result
+
+def fresh():
+    core = build(gemm_program(2, 2, 2), start=0x3000, sp=0x80000, core_id=1, cores=2)
+    gemm_inputs(core, 2, 2, 2)
+    return core
+
+@pytest.fixture(scope="module")
+def reference():
+    core = fresh()
+    assert core.run_until() == "halt"
+    return core
+
+@pytest.mark.parametrize("mode", ["interp", "block"])
+@pytest.mark.parametrize("mmap", [False, True])
+def test_restore_and_resume(tmp_path, reference, mode, mmap):
+    core = fresh()
+    core.run_until(budget=50, mode=mode)
+    path = str(tmp_path / "a.npz")
+    checkpoint.save(core, path)
+    r = checkpoint.restore(path, mmap=mmap)
+    assert (r.pc, r.retired, r.halted) == (core.pc, core.retired, False)
+    assert r.scalar_regs == core.scalar_regs
+    assert (r.cr.start_address, r.cr.stack_pointer, r.cr.dim, r.cr.core_id, r.cr.cores) == (0x3000, 0x80000, 4, 1, 2)
+    assert r.run_until(mode=mode) == "halt"
+    assert r.retired == reference.retired and r.scalar_regs == reference.scalar_regs
+    assert np.array_equal(r.matrix_regs.view(np.uint16), reference.matrix_regs.view(np.uint16))
+    assert np.array_equal(gemm_result(r, 2, 2).view(np.uint16), gemm_result(reference, 2, 2).view(np.uint16))
+    # the snapshot itself is untouched by running the restored core
+    again = checkpoint.restore(path)
+    assert again.retired == core.retired and np.array_equal(again.memory.read(0x300000, 64), core.memory.read(0x300000, 64))
+
+def test_pages_are_shared(tmp_path):
+    core = fresh()
+    core.run_until(budget=20)
+    checkpoint.save(core, str(tmp_path / "a.npz"))
+    store = tmp_path / "pages"
+    first = set(os.listdir(store))
+    core.run_until(budget=200)
+    checkpoint.save(core, str(tmp_path / "b.npz"))
+    second = set(os.listdir(store)) - first
+    # only the result page and the stack changed
+    assert 0 < len(second) < len(first)
+
+def test_mapped_file(tmp_path):
+    data = tmp_path / "data.bin"
+    data.write_bytes(np.arange(1024, dtype=np.uint32).tobytes())
+    core = build("li.i x7, 0x10000\nlw.i x5, 8(x7)\nsw.i x5, 0(x7)\nlw.i x6, 0(x7)\nhalt\n")
+    core.map_file(str(data), 0x10000)
+    core.run_until(budget=3)
+    checkpoint.save(core, str(tmp_path / "a.npz"))
+    r = checkpoint.restore(str(tmp_path / "a.npz"))
+    assert r.run_until() == "halt"
+    assert r.scalar_regs[6] == 2 and r.memory.read_word(0x10004) == 1
+    assert np.frombuffer(data.read_bytes(), dtype=np.uint32)[0] == 0 # copy-on-write
+
+def test_dma_in_flight(tmp_path):
+    core = build("li.i x5, 0x1000\ndma.ld m1, x0, x5, 0\ndma.wait 0\nhalt\n")
+    core.run_until(budget=2)
+    assert core.dma.pending
+    with pytest.raises(AssertionError):
+        checkpoint.save(core, str(tmp_path / "a.npz"))
+
+# the array dimension is saved, snapshots from before it was default to ARRAY_DIM
+def test_dim(tmp_path):
+    core = build("ld.m m1, x0, 0[x0]\nhalt\n", dim=8)
+    core.run_until(budget=1)
+    path = str(tmp_path / "a.npz")
+    checkpoint.save(core, path)
+    r = checkpoint.restore(path)
+    assert r.cr.dim == 8 and r.matrix_regs.shape == (16, 8, 8)
+    checkpoint.save(build("halt\n"), path)
+    with np.load(path) as s:
+        np.savez(path, **{k: s[k] for k in s.files if k != "dim"})
+    assert checkpoint.restore(path).cr.dim == ARRAY_DIM
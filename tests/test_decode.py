@@ -0,0 +1,86 @@
+import glob
+import os
+import numpy as np
+import pytest
+import assembler
+from isa import Opcode, AluOp, BranchOp
+from decode import Instruction, decode_program
+from conftest import ROOT, kernel
+
+def word(source: str) -> int:
+    return int(np.frombuffer(assembler.assemble(source), dtype='<u4')[0])
+
+# assembler line -> fields the decoder must give back
+@pytest.mark.parametrize("source, opcode, expected", [
+    ("add.i x1, x2, x3", Opcode.RTYPE, dict(rd=1, rs1=2, rs2=3, aluop=AluOp.ADD)),
+    ("sub.i x31, x30, x29", Opcode.RTYPE, dict(rd=31, rs1=30, rs2=29, aluop=AluOp.SUB)),
+    ("sra.i x5, x6, x7", Opcode.RTYPE, dict(rd=5, rs1=6, rs2=7, aluop=AluOp.SRA)),
+    ("sltu.i x5, x6, x7", Opcode.RTYPE, dict(aluop=AluOp.SLTU)),
+    ("mul.i x5, x6, x7", Opcode.RTYPE, dict(aluop=AluOp.MUL)),
+    ("addi.i x5, x6, -2048", Opcode.ITYPE, dict(rd=5, rs1=6, imm=-2048, aluop=AluOp.ADD, use_imm=True)),
+    ("xori.i x5, x6, -1", Opcode.ITYPE, dict(imm=-1, aluop=AluOp.XOR)),
+    ("slli.i x5, x6, 31", Opcode.ITYPE, dict(imm=31, aluop=AluOp.SLL)),
+    ("srli.i x5, x6, 7", Opcode.ITYPE, dict(imm=7, aluop=AluOp.SRL)),
+    ("srai.i x5, x6, 7", Opcode.ITYPE, dict(imm=7, aluop=AluOp.SRA)),
+    ("slti.i x5, x6, -3", Opcode.ITYPE, dict(imm=-3, aluop=AluOp.SLT)),
+    ("lw.i x5, -4(x2)", Opcode.LW, dict(rd=5, rs1=2, imm=-4)),
+    ("sw.i x5, 2047(x2)", Opcode.SW, dict(rs1=2, rs2=5, imm=2047)),
+    ("beq x5, x6, -4096", Opcode.BTYPE, dict(rs1=5, rs2=6, imm=-4096, branch_cond=BranchOp.BEQ)),
+    ("bge x5, x6, 4094", Opcode.BTYPE, dict(imm=4094, branch_cond=BranchOp.BGE)),
+    ("blt x5, x6, 8", Opcode.BTYPE, dict(branch_cond=BranchOp.BLT)),
+    ("jal x1, -1048576", Opcode.JAL, dict(rd=1, imm=-1048576)),
+    ("jal x0, 1048574", Opcode.JAL, dict(rd=0, imm=1048574)),
+    ("jalr x0, x1, -8", Opcode.JALR, dict(rd=0, rs1=1, imm=-8)),
+    ("lui.i x5, 0xFFFFF", Opcode.LUI, dict(rd=5, imm=0xFFFFF)),
+    ("ld.m m15, x24, -1024[x10]", Opcode.LDM, dict(rd=15, rs1=10, rs2=24, imm=-1024)),
+    ("st.m m3, x25, 1023[x12]", Opcode.STM, dict(rd=3, rs1=12, rs2=25, imm=1023)),
+    ("gemm.m m3, m1, m2, m3", Opcode.GEMM, dict(rd=3, ra=1, rb=2, rc=3)),
+    ("dma.ld m2, x25, x11, 15", Opcode.DMALD, dict(rd=2, rs1=11, rs2=25, imm=15)),
+    ("dma.st m5, x25, x12, 2", Opcode.DMAST, dict(rd=5, rs1=12, rs2=25, imm=2)),
+    ("dma.wait 7", Opcode.DMAWAIT, dict(imm=7)),
+    ("dma.poll x5, 1", Opcode.DMAPOLL, dict(rd=5, imm=1)),
+    ("barrier", Opcode.BARRIER, dict()),
+    ("core.id x5", Opcode.COREID, dict(rd=5)),
+    ("core.count x6", Opcode.NCORES, dict(rd=6)),
+    ("halt", Opcode.HALT, dict()),
+])
+def test_round_trip(source, opcode, expected):
+    i = Instruction.decode_word(word(source))
+    assert i.opcode is opcode
+    for field, value in expected.items():
+        assert getattr(i, field) == value, field
+    assert i.text().startswith("- ")
+
+def same(a: Instruction, b: Instruction) -> bool:
+    return all(getattr(a, f) == getattr(b, f) for f in Instruction.__slots__)
+
+# the vectorized decoder agrees with the per-word one on every shipped kernel
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(ROOT, "kernels", "*.S"))))
+def test_bulk_decoder(path):
+    source = kernel(os.path.basename(path))
+    if "jal x1, tiledmatmul" in source and not source.startswith("tiledmatmul:"): source += kernel("tiledmatmul.S")
+    image = assembler.assemble(source, source_dir=os.path.dirname(path))
+    table = decode_program(image, 0x1000)
+    for k, w in enumerate(table.words.tolist()):
+        try:
+            ref = Instruction.decode_word(w)
+        except (AssertionError, KeyError):
+            assert table.instruction(k) is None
+            continue
+        assert same(table.instruction(k), ref), f"{path}:{k} {ref.text()}"
+    assert table.index(0x1000) == 0 and table.index(0x1002) is None and table.index(0xFFC) is None
+
+# imm[10] only makes a right shift arithmetic, a left shift with it set stays sll
+def test_shift_bit_10():
+    for source, op in (("slli.i x5, x6, 3", AluOp.SLL), ("srli.i x5, x6, 3", AluOp.SRA)):
+        w = word(source) | (0x400 << 20)
+        ref = Instruction.decode_word(w)
+        assert ref.aluop is op and ref.imm == 3
+        assert same(decode_program(np.array([w], dtype='<u4').tobytes()).instruction(0), ref)
+
+@pytest.mark.parametrize("w", [0x0000007B, 0x80000033, 0x00002063])
+def test_undecodable(w):
+    table = decode_program(np.array([w, word("halt")], dtype='<u4').tobytes())
+    assert table.instruction(0) is None and table.instruction(1).opcode is Opcode.HALT
+    with pytest.raises((AssertionError, KeyError)):
+        Instruction.decode_word(w)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+import assembler
+from conftest import build
+
+def sections(source: str, source_dir: str = "."):
+    asm = assembler.assemble_lines(assembler.parse_source(source), source_dir=source_dir)
+    return asm, asm.image()
+
+def test_data_layout():
+    asm, image = sections("""nop
+halt
+.data
+a:
+.word 1, -1
+b:
+.half 0x1234, 5
+c:
+.fp16 1.5, -2
+.align 4
+d:
+.word 7
+""")
+    labels = asm.labels()
+    # data follows the text at its strictest alignment
+    assert asm.data_align == 16 and labels["a"] == 16
+    assert np.frombuffer(image[16:24], dtype='<u4').tolist() == [1, 0xFFFFFFFF]
+    assert np.frombuffer(image[24:28], dtype='<u2').tolist() == [0x1234, 5]
+    assert np.frombuffer(image[28:32], dtype='<f2').tolist() == [1.5, -2.0]
+    assert labels["d"] % 16 == 0 and np.frombuffer(image[labels["d"]:labels["d"] + 4], dtype='<u4')[0] == 7
+
+def test_text_word_and_align():
+    asm, image = sections("nop\n.align 4\nhere:\n.word 0xFFFFFFFF\n")
+    words = np.frombuffer(image, dtype='<u4').tolist()
+    assert asm.labels()["here"] == 16 and words[1:4] == [words[0]] * 3 and words[4] == 0xFFFFFFFF
+
+def test_incbin(tmp_path):
+    (tmp_path / "raw.bin").write_bytes(b"\x01\x02\x03")
+    np.save(tmp_path / "tile.npy", np.arange(4, dtype='>u2'))
+    asm, image = sections('halt\n.data\nraw:\n.incbin "raw.bin"\n.align 2\ntile:\n.incbin tile.npy\n', str(tmp_path))
+    labels = asm.labels()
+    assert image[labels["raw"]:labels["raw"] + 3] == b"\x01\x02\x03"
+    # .npy arrays are stored little endian whatever their file byte order
+    assert np.frombuffer(image[labels["tile"]:labels["tile"] + 8], dtype='<u2').tolist() == [0, 1, 2, 3]
+
+def test_program_reads_data():
+    core = build("li.i x7, value\nlw.i x5, 0(x7)\nhalt\n.data\nvalue:\n.word 0x12345678\n")
+    assert core.run_until() == "halt" and core.scalar_regs[5] == 0x12345678
+
+@pytest.mark.parametrize("source", [".half 1\n", ".fp16 1.0\n", ".data\n.frob 1\n"])
+def test_errors(source):
+    with pytest.raises(ValueError):
+        assembler.assemble(source)
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+from conftest import build
+from timing import TimingModel, TimingConfig
+
+MODES = ["interp", "block"]
+A, B, C = 0x10000, 0x10100, 0x10200
+
+def tile(v):
+    return np.full((4, 4), v, dtype=np.float16)
+
+def core_with_tiles(source: str):
+    core = build("li.i x10, %d\nli.i x11, %d\nli.i x12, %d\nli.i x20, 8\n" % (A, B, C) + source)
+    for addr, v in ((A, 1), (B, 2), (C, 3)): core.memory.write(addr, tile(v))
+    return core
+
+def value(core, m):
+    return float(core.matrix_regs[m][0, 0])
+
+def mem(core, addr):
+    return float(core.memory.read(addr, 2).view(np.float16)[0])
+
+@pytest.mark.parametrize("mode", MODES)
+def test_load_lands_on_wait(mode):
+    core = core_with_tiles("dma.ld m1, x20, x10, 0\nbeq x0, x0, check\ncheck:\ndma.wait 0\nhalt\n")
+    core.breakpoints.add(core.symbols["check"])
+    assert core.run_until(mode=mode) == "breakpoint"
+    assert value(core, 1) == 0 and core.dma.pending
+    assert core.run_until(mode=mode) == "halt"
+    assert value(core, 1) == 1 and not core.dma.pending
+
+# wait(t) completes everything queued up to the last transfer with tag t, in order,
+# and nothing queued after it
+@pytest.mark.parametrize("mode", MODES)
+def test_wait_order(mode):
+    core = core_with_tiles("""dma.ld m1, x20, x10, 0
+dma.ld m2, x20, x11, 1
+dma.ld m3, x20, x10, 0
+dma.ld m4, x20, x12, 2
+dma.wait 0
+beq x0, x0, check
+check:
+halt
+""")
+    core.breakpoints.add(core.symbols["check"])
+    assert core.run_until(mode=mode) == "breakpoint"
+    assert [value(core, m) for m in (1, 2, 3, 4)] == [1, 2, 1, 0]
+    assert [t for t, *_ in core.dma.queue] == [2]
+    # HALT drains the rest
+    assert core.run_until(mode=mode) == "halt"
+    assert value(core, 4) == 3 and not core.dma.pending
+
+# a store captures the register when queued; a load queued after it sees the stored tile
+@pytest.mark.parametrize("mode", MODES)
+def test_store_then_load(mode):
+    core = core_with_tiles("""ld.m m1, x20, 0[x11]
+dma.st m1, x20, x10, 3
+ld.m m1, x20, 0[x12]
+dma.ld m5, x20, x10, 4
+beq x0, x0, check
+check:
+dma.wait 4
+halt
+""")
+    core.breakpoints.add(core.symbols["check"])
+    assert core.run_until(mode=mode) == "breakpoint"
+    assert mem(core, A) == 1 and value(core, 1) == 3
+    assert core.run_until(mode=mode) == "halt"
+    assert mem(core, A) == 2 and value(core, 5) == 2 and value(core, 1) == 3
+
+@pytest.mark.parametrize("mode", MODES)
+def test_poll_without_timing(mode):
+    core = core_with_tiles("dma.ld m1, x20, x10, 5\ndma.poll x5, 5\ndma.poll x6, 6\nhalt\n")
+    assert core.run_until(mode=mode) == "halt"
+    assert core.scalar_regs[5] == 1 and core.scalar_regs[6] == 1 and value(core, 1) == 1
+
+# with timing, a transfer is in flight for some cycles: poll reads 0 until then, wait
+# stalls until it is done
+@pytest.mark.parametrize("mode", MODES)
+def test_poll_with_timing(mode):
+    core = core_with_tiles("""dma.ld m1, x20, x10, 5
+dma.poll x5, 5
+li.i x7, 0
+spin:
+addi.i x7, x7, 1
+dma.poll x6, 5
+beq x6, x0, spin
+halt
+""")
+    core.timing = TimingModel(TimingConfig())
+    assert core.run_until(mode=mode) == "halt"
+    assert core.scalar_regs[5] == 0 and core.scalar_regs[6] == 1 and core.scalar_regs[7] > 1
+    assert value(core, 1) == 1
+
+def test_wait_stalls():
+    core = core_with_tiles("dma.ld m1, x20, x10, 0\ndma.ld m2, x20, x11, 1\ndma.wait 1\nhalt\n")
+    core.timing = TimingModel(TimingConfig())
+    core.run_until()
+    assert core.timing.stalls["dma wait"] > 0
+    assert core.timing.total_cycles() >= max(core.timing.dma_tags.values())
+
+# a store never waited on still reaches memory by the halt
+@pytest.mark.parametrize("mode", MODES)
+def test_halt_drains_store(mode):
+    core = core_with_tiles("ld.m m1, x20, 0[x11]\ndma.st m1, x20, x12, 7\nhalt\n")
+    assert core.run_until(mode=mode) == "halt"
+    assert mem(core, C) == 2 and not core.dma.pending
@@ -0,0 +1,74 @@
+import pytest
+from conftest import build
+
+M = 0xFFFFFFFF
+MODES = ["interp", "block"]
+
+def run(source: str, mode: str):
+    core = build(source)
+    assert core.run_until(mode=mode) == "halt"
+    return core
+
+# (instruction on x6 = a, x7 = b, result in x5, expected) with RV32IM semantics
+CASES = [
+    ("add.i x5, x6, x7", 0x7FFFFFFF, 1, 0x80000000),
+    ("add.i x5, x6, x7", M, 1, 0),
+    ("sub.i x5, x6, x7", 0, 1, M),
+    ("sub.i x5, x6, x7", 0x80000000, 1, 0x7FFFFFFF),
+    ("sra.i x5, x6, x7", 0x80000000, 31, M),
+    ("sra.i x5, x6, x7", -16 & M, 2, -4 & M),
+    ("sra.i x5, x6, x7", -16 & M, 34, -4 & M),      # shift amount is rs2[4:0]
+    ("srl.i x5, x6, x7", 0x80000000, 31, 1),
+    ("sll.i x5, x6, x7", 1, 31, 0x80000000),
+    ("sll.i x5, x6, x7", 3, 32, 3),
+    ("srai.i x5, x6, 4", 0xF0000000, 0, 0xFF000000),
+    ("srli.i x5, x6, 4", 0xF0000000, 0, 0x0F000000),
+    ("slt.i x5, x6, x7", -1 & M, 0, 1),
+    ("slt.i x5, x6, x7", 0, -1 & M, 0),
+    ("slt.i x5, x6, x7", 0x80000000, 0x7FFFFFFF, 1),
+    ("sltu.i x5, x6, x7", -1 & M, 0, 0),
+    ("sltu.i x5, x6, x7", 0, -1 & M, 1),
+    ("slti.i x5, x6, -1", -2 & M, 0, 1),
+    ("slti.i x5, x6, -1", 0, 0, 0),
+    ("sltui.i x5, x6, -1", 5, 0, 1),               # the immediate is sign extended, then compared unsigned
+    ("mul.i x5, x6, x7", 0x7FFFFFFF, 2, 0xFFFFFFFE),
+    ("mul.i x5, x6, x7", 0x10000, 0x10000, 0),
+    ("mul.i x5, x6, x7", -1 & M, -1 & M, 1),
+    ("mul.i x5, x6, x7", 0x80000000, -1 & M, 0x80000000),
+    ("mul.i x5, x6, x7", 123456789, 987654321, (123456789 * 987654321) & M),
+    ("xori.i x5, x6, -1", 0x0F0F0F0F, 0, 0xF0F0F0F0),
+    ("andi.i x5, x6, -16", M, 0, 0xFFFFFFF0),
+    ("ori.i x5, x6, -2048", 0, 0, 0xFFFFF800),
+    ("addi.i x0, x6, 1", 5, 0, 0),                 # x0 stays zero, x5 untouched
+]
+
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("instr, a, b, expected", CASES)
+def test_alu(mode, instr, a, b, expected):
+    core = run(f"li.i x6, {a}\nli.i x7, {b}\n{instr}\nhalt\n", mode)
+    assert core.scalar_regs[5] == expected and core.scalar_regs[0] == 0
+
+# signed and unsigned compares in branches
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("branch, a, b, taken", [
+    ("blt", -1, 0, True), ("blt", 0, -1, False), ("blt", -2 ** 31, 2 ** 31 - 1, True),
+    ("bge", -1, -1, True), ("bge", -1, 0, False), ("bge", 2 ** 31 - 1, -2 ** 31, True),
+    ("beq", -1, 2 ** 32 - 1, True), ("bne", 0, -1, True),
+])
+def test_branch(mode, branch, a, b, taken):
+    core = run(f"li.i x6, {a}\nli.i x7, {b}\n{branch} x6, x7, yes\nli.i x5, 1\nhalt\nyes:\nli.i x5, 2\nhalt\n", mode)
+    assert core.scalar_regs[5] == (2 if taken else 1)
+
+@pytest.mark.parametrize("mode", MODES)
+def test_jal_jalr(mode):
+    core = run("jal x1, f\nli.i x6, 7\nhalt\nf:\nli.i x5, 3\njalr x9, x1, 0\n", mode)
+    assert core.scalar_regs[1] == 4 and core.scalar_regs[5] == 3 and core.scalar_regs[6] == 7
+    assert core.scalar_regs[9] == 20
+
+# registers hold plain ints in [0, 2^32), through memory and lui as well
+@pytest.mark.parametrize("mode", MODES)
+def test_load_store_lui(mode):
+    core = run("li.i x7, 0x1000\nli.i x6, -5\nsw.i x6, 4(x7)\nlw.i x5, 4(x7)\nlui.i x8, 0xFFFFF\nlw.i x0, 4(x7)\nhalt\n", mode)
+    r = core.scalar_regs
+    assert r[5] == -5 & M and r[8] == 0xFFFFF000 and r[0] == 0
+    assert all(type(v) is int and 0 <= v <= M for v in r)
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from conftest import build, gemm_program, gemm_inputs, gemm_result
+from fastforward import GemmFastForward
+
+def fast_core(n, k, m):
+    core = build(gemm_program(n, k, m))
+    core.fastforward = GemmFastForward()
+    assert core.fastforward.attach(core, core.symbols)
+    gemm_inputs(core, n, k, m)
+    return core
+
+@pytest.mark.parametrize("mode", ["interp", "block"])
+def test_matches_execution(mode):
+    ref = build(gemm_program(2, 3, 2))
+    gemm_inputs(ref, 2, 3, 2)
+    assert ref.run_until(mode=mode) == "halt"
+    core = fast_core(2, 3, 2)
+    assert core.run_until(mode=mode) == "halt"
+    assert core.fastforward.hits == 1
+    assert core.retired == ref.retired
+    assert core.scalar_regs == ref.scalar_regs
+    assert np.array_equal(gemm_result(core, 2, 2).view(np.uint16), gemm_result(ref, 2, 2).view(np.uint16))
+
+@pytest.mark.parametrize("mode", ["interp", "block"])
+def test_breakpoint_inside_kernel(mode):
+    core = fast_core(2, 3, 2)
+    core.breakpoints.add(core.symbols["Loop_row"])
+    assert core.run_until(mode=mode) == "breakpoint"
+    assert core.pc == core.symbols["Loop_row"]
+    assert core.fastforward.hits == 0
+    core.breakpoints.clear()
+    assert core.run_until(mode=mode) == "halt"
+
+@pytest.mark.parametrize("mode", ["interp", "block"])
+def test_run_until_label_inside_kernel(mode):
+    core = fast_core(2, 3, 2)
+    assert core.run_until("Loop_column", mode=mode) == "pc"
+    assert core.pc == core.symbols["Loop_column"]
+    assert core.fastforward.hits == 0
+
+def test_declines_nonzero_x0():
+    core = fast_core(1, 1, 1)
+    assert core.run_until("tiledmatmul") == "pc"
+    core.scalar_regs[0] = 1
+    assert core.run_until(budget=1) == "budget"
+    assert core.fastforward.hits == 0 and core.pc == core.symbols["tiledmatmul"] + 4
+
+# a GEMM longer than a run_until slice is still skipped in one go, within the overall budget
+@pytest.mark.parametrize("mode", ["interp", "block"])
+def test_longer_than_slice(mode):
+    ref = build(gemm_program(2, 3, 2))
+    gemm_inputs(ref, 2, 3, 2)
+    assert ref.run_until(mode=mode) == "halt"
+    core = fast_core(2, 3, 2)
+    assert core.run_until(mode=mode, slice=16) == "halt"
+    assert core.fastforward.hits == 1 and core.retired == ref.retired
+    # one instruction short of the call is not enough
+    core = fast_core(2, 3, 2)
+    assert core.run_until("tiledmatmul", mode=mode) == "pc"
+    need = int(core.fastforward.counts(2, 3, 2).sum())
+    assert core.run_until(budget=need - 1, mode=mode, slice=16) == "budget"
+    assert core.fastforward.hits == 0
+
+def test_run_fast_forwards_past_slice():
+    core = fast_core(24, 24, 24)
+    core.run()
+    assert core.fastforward.hits == 1 and core.retired > 1 << 16
@@ -0,0 +1,33 @@
+import numpy as np
+import harness
+
+# counts x5 to 20000, past any small default budget
+LOOP = "li.i x6, 20000\nloop:\naddi.i x5, x5, 1\nbne x5, x6, loop\nsw.i x5, 0x100(x0)\nhalt\n"
+
+def test_manifest(tmp_path):
+    kernel = tmp_path / "loop.S"
+    kernel.write_text(LOOP)
+    data = tmp_path / "in.bin"
+    data.write_bytes(np.arange(4, dtype=np.uint32).tobytes())
+    jobs = [{"name": "long", "kernel": str(kernel), "dump": [{"addr": "0x100", "size": 4}]},
+            {"name": "short", "kernel": str(kernel), "max_iters": 100},
+            {"name": "input", "kernel": str(kernel), "inputs": [{"file": str(data), "addr": "0x2000"}],
+             "dump": [{"addr": "0x2000", "size": 16}]}]
+    results = harness.run_manifest({"jobs": jobs}, str(tmp_path / "out.npz"), workers=1)
+    assert results["long/halted"] and "long/error" not in results
+    assert results["long/mem_00000100"].view(np.uint32)[0] == 20000
+    assert results["long/matrix_regs"].shape == (16, 4, 4)
+    assert not results["short/halted"] and "short/error" in results
+    assert np.array_equal(results["input/mem_00002000"].view(np.uint32), np.arange(4))
+    saved = np.load(tmp_path / "out.npz")
+    assert saved["long/scalar_regs"][5] == 20000
+
+# assembling, linking and running jobs print nothing, whatever the outcome
+def test_quiet(tmp_path, capsys):
+    kernel = tmp_path / "loop.S"
+    kernel.write_text(LOOP)
+    jobs = [{"name": "file", "kernel": str(kernel)}, {"name": "linked", "kernel": [str(kernel)], "max_iters": 10}]
+    binaries = harness.assemble_kernels(jobs, str(tmp_path))
+    results = [harness.run_job(job, binaries[harness.kernel_key(job)], "block")[1] for job in jobs]
+    assert results[0]["halted"] and "error" in results[1]
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,27 @@
+import numpy as np
+from conftest import build, kernel
+
+W1, I0, A1, W2, A2 = 0x100000, 0x110000, 0x120000, 0x130000, 0x140000
+
+# Y = W x I + B the way tiledmatmul does it: fp16 4x4 tile products added term by term
+def tiled(w, i, b):
+    y = b.copy()
+    for t in range(w.shape[1] // 4):
+        y = np.matmul(w[:, 4 * t: 4 * t + 4], i[4 * t: 4 * t + 4]) + y
+    return y
+
+def test_mnist():
+    source = (f"li.i x10, {W1}\nli.i x11, {I0}\nli.i x12, {A1}\nli.i x16, {W2}\nli.i x17, {A2}\n"
+              "jal x1, mnist\nhalt\n" + kernel("mnist.S") + kernel("tiledmatmul.S"))
+    core = build(source)
+    rng = np.random.default_rng(1)
+    def fp16(*shape, scale=0.1): return (scale * rng.standard_normal(shape)).astype(np.float16)
+    # the input column and the biases are padded to 4 columns, W2 to 12 rows
+    w1, i, b1, w2, b2 = fp16(16, 768), fp16(768, 4), fp16(16, 4), fp16(12, 16), fp16(12, 4)
+    for addr, a in ((W1, w1), (I0, i), (A1, b1), (W2, w2), (A2, b2)): core.memory.write(addr, a)
+    assert core.run_until(mode="block") == "halt"
+    x1 = np.maximum(tiled(w1, i, b1), np.float16(0))
+    assert np.array_equal(core.memory.read(A1, x1.nbytes).view(np.float16).reshape(16, 4), x1)
+    a2 = core.memory.read(A2, b2.nbytes).view(np.float16).reshape(12, 4)
+    assert np.array_equal(a2, tiled(w2, x1, b2))
+    assert core.scalar_regs[2] == 0x8000
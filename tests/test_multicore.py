@@ -0,0 +1,96 @@
+import os
+import sys
+import subprocess
+import numpy as np
+import pytest
+import assembler
+import bench
+from main import Core, ControlRegister
+from multicore import Cluster
+from conftest import ROOT
+
+SHARED = 0x100000
+
+def cluster(tmp_path, source: str, cores: int) -> Cluster:
+    path = tmp_path / "prog.bin"
+    path.write_bytes(assembler.assemble(source))
+    return Cluster(str(path), [ControlRegister(0, 0x80000 - c * 0x1000) for c in range(cores)], (SHARED, 4096))
+
+# a core failing with any exception reports it and releases the cores at the barrier
+def test_core_failure(tmp_path, monkeypatch):
+    sync = Core.sync
+    def failing(core):
+        if core.cr.core_id == 1: raise RuntimeError("boom")
+        sync(core)
+    monkeypatch.setattr(Core, "sync", failing)
+    c = cluster(tmp_path, "barrier\nhalt\n", 3)
+    try:
+        with pytest.raises(AssertionError, match="core 1: RuntimeError: boom"):
+            c.run()
+        assert all("error" in r for r in c.results)
+    finally:
+        c.close()
+
+# every core publishes its id, meets the others at a barrier, then reads its neighbour's
+EXCHANGE = f"""core.id x5
+core.count x6
+li.i x10, {SHARED}
+slli.i x7, x5, 2
+add.i x7, x7, x10
+lw.i x8, 512(x10)       // written by the parent
+add.i x8, x8, x5
+sw.i x8, 0(x7)
+barrier
+addi.i x9, x5, 1
+bne x9, x6, read
+li.i x9, 0
+read:
+slli.i x9, x9, 2
+add.i x9, x9, x10
+lw.i x11, 0(x9)
+sw.i x11, 256(x7)
+halt
+"""
+
+@pytest.mark.parametrize("mode", ["interp", "block"])
+def test_barrier_and_shared_window(tmp_path, mode):
+    c = cluster(tmp_path, EXCHANGE, 4)
+    try:
+        c.memory.write_word(SHARED + 512, 100)
+        results = c.run(mode)
+        assert all(r["halted"] for r in results)
+        assert [r["scalar_regs"][5] for r in results] == [0, 1, 2, 3]
+        assert [r["scalar_regs"][2] for r in results] == [0x80000 - k * 0x1000 for k in range(4)]
+        assert [c.memory.read_word(SHARED + 4 * k) for k in range(4)] == [100, 101, 102, 103]
+        assert [c.memory.read_word(SHARED + 256 + 4 * k) for k in range(4)] == [101, 102, 103, 100]
+    finally:
+        c.close()
+
+# with timing the cores leave a barrier together, at the latest arrival
+def test_barrier_timing(tmp_path):
+    source = "core.id x5\nloop:\nbeq x5, x0, done\naddi.i x5, x5, -1\nbeq x0, x0, loop\ndone:\nbarrier\nhalt\n"
+    c = cluster(tmp_path, source, 3)
+    try:
+        results = c.run(timing=True)
+        assert len({r["cycles"] for r in results}) == 1
+        assert results[0]["stalls"].get("barrier", 0) > results[2]["stalls"].get("barrier", 0)
+        assert c.summary()["cycles"] == results[0]["cycles"]
+    finally:
+        c.close()
+
+# tiledmatmul_mc splits the result rows over the cores, including more cores than rows
+@pytest.mark.parametrize("n, cores", [(5, 3), (2, 4), (4, 1)])
+def test_tiledmatmul_mc(tmp_path, n, cores):
+    summary, correct = bench.multicore(n, 2, 3, cores, str(tmp_path), timing=False)
+    assert correct and summary["halted"] and summary["cores"] == cores
+
+# the command line: every core stores its id + 1 into the shared window, dumped after the run
+def test_cli(tmp_path):
+    path = tmp_path / "prog.bin"
+    path.write_bytes(assembler.assemble(f"core.id x5\nli.i x10, {SHARED}\nslli.i x7, x5, 2\nadd.i x7, x7, x10\n"
+                                        "addi.i x8, x5, 1\nsw.i x8, 0(x7)\nhalt\n"))
+    out = tmp_path / "out.bin"
+    subprocess.run([sys.executable, os.path.join(ROOT, "softsim", "multicore.py"), "--file", str(path), "--cores", "3",
+                    "--shared", f"{SHARED:#x}:4096", "--dump", f"{SHARED:#x}:12:{out}"],
+                   check=True, capture_output=True)
+    assert np.fromfile(out, dtype=np.uint32).tolist() == [1, 2, 3]
@@ -0,0 +1,96 @@
+import pytest
+from conftest import build
+
+MODES = ["interp", "block"]
+
+# x5 counts to 100 in a loop, storing it to 0x1000 every pass
+SOURCE = """li.i x6, 100
+li.i x7, 0x1000
+loop:
+addi.i x5, x5, 1
+sw.i x5, 0(x7)
+inner:
+bne x5, x6, loop
+after:
+sw.i x5, 4(x7)
+jal x0, end
+end:
+halt
+"""
+
+@pytest.mark.parametrize("mode", MODES)
+def test_halt(mode):
+    core = build(SOURCE)
+    assert core.run_until(mode=mode) == "halt"
+    assert core.halted and core.scalar_regs[5] == 100
+    assert core.run_until(mode=mode) == "halt"
+
+@pytest.mark.parametrize("mode", MODES)
+def test_pc(mode):
+    core = build(SOURCE)
+    assert core.run_until("after", mode=mode) == "pc"
+    assert core.pc == core.symbols["after"] and core.scalar_regs[5] == 100
+    assert core.run_until(core.symbols["loop"], mode=mode) == "halt"
+    with pytest.raises(AssertionError):
+        core.run_until("nowhere")
+
+@pytest.mark.parametrize("mode", MODES)
+def test_breakpoint(mode):
+    core = build(SOURCE)
+    core.breakpoints.add(core.symbols["inner"])
+    for k in range(1, 4):
+        # the instruction a run starts on never stops it, so each call is one more pass
+        assert core.run_until(mode=mode) == "breakpoint"
+        assert core.pc == core.symbols["inner"] and core.scalar_regs[5] == k
+
+def test_budget():
+    core = build(SOURCE)
+    assert core.run_until(budget=10) == "budget" and core.retired == 10
+    assert core.step() == "budget" and core.retired == 11
+    assert core.run_until(budget=10, slice=3) == "budget" and core.retired == 21
+    # block mode runs whole blocks, so it may go past the budget but never stops short
+    core = build(SOURCE)
+    assert core.run_until(budget=10, mode="block") == "budget" and core.retired >= 10
+
+@pytest.mark.parametrize("mode", MODES)
+def test_watchpoint(mode):
+    core = build(SOURCE)
+    core.watch(0x1004, 4)
+    assert core.run_until(mode=mode) == "watchpoint"
+    # block mode stops at the end of the block doing the store
+    assert core.watch_hit == (0x1004, 4) and core.scalar_regs[5] == 100 and not core.halted
+    core.unwatch()
+    core.watch(0x1000, 1)
+    assert core.run_until(mode=mode) == "halt"
+
+@pytest.mark.parametrize("mode", MODES)
+def test_watchpoint_every_store(mode):
+    core = build(SOURCE)
+    core.watch(0x1000, 4)
+    for k in range(1, 4):
+        assert core.run_until(mode=mode) == "watchpoint"
+        assert core.scalar_regs[5] == k
+
+def test_wallclock():
+    core = build("loop:\njal x0, loop\n")
+    assert core.run_until(wallclock=0.01, slice=1000) == "wallclock"
+    assert not core.halted and core.retired > 0
+
+# stopping and resuming ends in the same state as one run
+@pytest.mark.parametrize("mode", MODES)
+def test_resume(mode):
+    ref = build(SOURCE)
+    ref.run_until(mode=mode)
+    core = build(SOURCE)
+    while core.run_until(budget=7, mode=mode) != "halt": pass
+    assert core.retired == ref.retired and core.scalar_regs == ref.scalar_regs
+
+# Core.run is run_until to the halt, giving up after max_iters
+def test_run(capsys):
+    core = build(SOURCE)
+    with pytest.raises(AssertionError):
+        core.run(max_iters=10)
+    assert core.retired == 10
+    core.run(resume=True)
+    assert core.halted and core.scalar_regs[5] == 100
+    assert "exited gracefully" in capsys.readouterr().out
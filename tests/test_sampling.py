@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from conftest import build, gemm_program, gemm_inputs, gemm_result, Y
+from sampling import Sampler, label_ranges
+from perf import Counters
+
+def reference(n, k, m, name):
+    core = build(gemm_program(n, k, m, name))
+    gemm_inputs(core, n, k, m)
+    core.perf = Counters()
+    assert core.run_until() == "halt"
+    return core
+
+def sampled(n, k, m, name, **options):
+    core = build(gemm_program(n, k, m, name))
+    gemm_inputs(core, n, k, m)
+    if "ranges" in options: options["ranges"] = label_ranges(core.symbols, options["ranges"])
+    return core, Sampler(core, **options)
+
+@pytest.mark.parametrize("name", ["tiledmatmul.S", "tiledmatmul_db.S"])
+@pytest.mark.parametrize("options", [dict(period=100, window=30, warmup=10), dict(ranges=["Loop_column"])])
+def test_same_result(name, options):
+    if name == "tiledmatmul_db.S" and "ranges" in options: options = dict(ranges=["Db_column_a:Db_term_done"])
+    ref = reference(3, 3, 3, name)
+    core, sampler = sampled(3, 3, 3, name, **options)
+    assert sampler.run() == "halt"
+    assert core.retired == ref.retired and core.scalar_regs == ref.scalar_regs
+    assert np.array_equal(gemm_result(core, 3, 3).view(np.uint16), gemm_result(ref, 3, 3).view(np.uint16))
+    s = sampler.summary()
+    assert 0 < s["sampled"] <= core.retired and s["windows"] > 0 and s["estimate"]["cycles"] > 0
+
+# every instruction from Loop_column to the end of the kernel runs in detail
+def test_ranges_count_every_instruction():
+    ref = reference(2, 2, 2, "tiledmatmul.S")
+    core, sampler = sampled(2, 2, 2, "tiledmatmul.S", ranges=["Loop_column"])
+    sampler.run()
+    lo = core.symbols["Loop_column"]
+    assert {pc: n for pc, n in sampler.perf.hist.items() if n} == {pc: n for pc, n in ref.perf.hist.items() if pc >= lo and n}
+
+@pytest.mark.parametrize("options", [dict(period=400, window=400, warmup=0), dict(ranges=["Loop_column"])])
+def test_breakpoint_in_window(options):
+    core, sampler = sampled(2, 2, 2, "tiledmatmul.S", **options)
+    core.breakpoints.add(core.symbols["Loop_column"] + 8)
+    assert sampler.run() == "breakpoint"
+    assert core.pc == core.symbols["Loop_column"] + 8
+    assert sampler.sampled > 0
+
+def test_breakpoint_in_functional_stretch():
+    core, sampler = sampled(2, 2, 2, "tiledmatmul.S", period=10000, window=10, warmup=0)
+    core.breakpoints.add(core.symbols["Loop_row"])
+    assert sampler.run() == "breakpoint" and core.pc == core.symbols["Loop_row"]
+
+@pytest.mark.parametrize("options", [dict(period=100, window=100, warmup=0), dict(period=10000, window=1, warmup=0)])
+def test_watchpoint(options):
+    core, sampler = sampled(2, 2, 2, "tiledmatmul.S", **options)
+    core.watch(Y, 4)
+    assert sampler.run() == "watchpoint"
+    assert core.watch_hit[0] == Y
+
+def test_budget():
+    core, sampler = sampled(2, 2, 2, "tiledmatmul.S", period=50, window=10, warmup=5)
+    assert sampler.run(100) == "budget" and core.retired == 100
@@ -0,0 +1,73 @@
+import os
+import time
+import threading
+import pytest
+import server
+from isa import ARRAY_DIM
+
+LOOP = "loop:\naddi.i x5, x5, 1\njal x0, loop\n"
+
+@pytest.fixture
+def client(tmp_path):
+    path = str(tmp_path / "sim.sock")
+    thread = threading.Thread(target=server.serve, args=(path,), daemon=True)
+    thread.start()
+    for _ in range(500):
+        if os.path.exists(path): break
+        time.sleep(0.01)
+    c = server.Client(path)
+    yield c
+    c.request(op="shutdown")
+    c.close()
+    thread.join(5)
+
+def test_run(client):
+    source = "li.i x5, 0x1000\nlw.i x6, 0(x5)\naddi.i x6, x6, -3\nsw.i x6, 4(x5)\nhalt\n"
+    reply = client.run(source, {0x1000: (10).to_bytes(4, "little")}, [(0x1004, 4)], sp=0x8000)
+    assert reply["ok"] and reply["stop"] == "halt" and reply["halted"]
+    assert reply["scalar_regs"][6] == 7 and reply["scalar_regs"][2] == 0x8000
+    assert reply["dump"] == [(7).to_bytes(4, "little")]
+    assert reply["matrix_regs"].shape == (16, ARRAY_DIM, ARRAY_DIM)
+    assert not reply["cached"]
+    assert client.run(source)["cached"]
+    timed = client.run(source, timing=True, mode="interp")
+    assert timed["cycles"] > 0 and timed["retired"] == reply["retired"]
+
+# the array dimension goes with the request, the reply's matrices have its shape
+def test_dim(client):
+    reply = client.run("li.i x5, 0x1000\nli.i x6, 16\nld.m m1, x6, 0[x5]\nhalt\n",
+                       {0x1000: bytes(range(128))}, dim=8)
+    assert reply["ok"] and reply["matrix_regs"].shape == (16, 8, 8)
+    assert reply["matrix_regs"][1].tobytes() == bytes(range(128))
+
+def test_requests(client):
+    assert client.request(op="ping") == {"ok": True}
+    assert not client.request(op="nope")["ok"]
+    bad = client.run("frobnicate x1\n")
+    assert not bad["ok"] and "error" in bad
+    stats = client.request(op="stats")
+    assert stats["ok"] and stats["runs"] == 0
+    # a line that is not JSON fails that request only
+    client.file.write(b"{not json\n")
+    client.file.flush()
+    assert not server.json.loads(client.file.readline())["ok"]
+    assert client.request(op="ping")["ok"]
+
+def test_budget(client):
+    reply = client.run(LOOP, max_iters=1000)
+    assert reply["ok"] and reply["stop"] == "budget" and not reply["halted"]
+    assert reply["retired"] == 1000
+
+def test_wallclock(client):
+    reply = client.run(LOOP, max_iters=None, wallclock=0.05, mode="interp")
+    assert reply["ok"] and reply["stop"] == "wallclock"
+
+# without limits in the request a kernel that never halts still returns
+def test_default_limits(monkeypatch):
+    service = server.Service()
+    monkeypatch.setattr(server, "MAX_ITERS", 5000)
+    reply = service.handle({"op": "run", "source": LOOP})
+    assert reply["stop"] == "budget" and reply["retired"] == 5000
+    monkeypatch.setattr(server, "MAX_ITERS", None)
+    monkeypatch.setattr(server, "WALLCLOCK", 0.05)
+    assert service.handle({"op": "run", "source": LOOP})["stop"] == "wallclock"
@@ -0,0 +1,33 @@
+import numpy as np
+from conftest import build
+from tracing import open_trace, render
+
+SOURCE = "li.i x5, 7\naddi.i x6, x5, -9\nhalt\n"
+
+def test_text_file(tmp_path):
+    path = tmp_path / "trace.txt"
+    core = build(SOURCE)
+    core.trace = open_trace("text", str(path))
+    assert core.run_until() == "halt"
+    core.trace.close()
+    assert core.trace.f.closed
+    lines = path.read_text().splitlines()
+    assert len(lines) == core.retired
+    assert lines[1].endswith("-> -2")
+
+def test_binary_matches_text(tmp_path):
+    text, binary = tmp_path / "trace.txt", tmp_path / "trace.bin"
+    for level, path in (("text", text), ("binary", binary)):
+        core = build(SOURCE)
+        core.trace = open_trace(level, str(path))
+        core.run_until(mode="block")
+        core.trace.close()
+    with open(tmp_path / "rendered.txt", "w") as f:
+        render(str(binary), f)
+    assert (tmp_path / "rendered.txt").read_text() == text.read_text()
+
+def test_ring_keeps_last(tmp_path):
+    core = build(SOURCE)
+    core.trace = open_trace("ring", ring=2)
+    core.run_until()
+    assert np.array_equal(core.trace.records()["pc"], [4, 8])
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+import assembler
+from conftest import build, gemm_program, gemm_inputs, gemm_result
+
+MODES = ["interp", "block"]
+
+def run(source: str, mode: str):
+    core = build(source)
+    assert core.run_until(mode=mode) == "halt"
+    return core
+
+def word(line: str) -> int:
+    return int(np.frombuffer(assembler.assemble(line), dtype='<u4')[0])
+
+def state(core):
+    return core.retired, core.pc, list(core.scalar_regs), core.matrix_regs.view(np.uint16).copy()
+
+# translated blocks agree with the interpreter on whole kernels
+@pytest.mark.parametrize("name", ["tiledmatmul.S", "tiledmatmul_db.S"])
+@pytest.mark.parametrize("n, k, m", [(1, 1, 1), (2, 3, 1), (3, 2, 4)])
+def test_block_matches_interp(name, n, k, m):
+    cores = {}
+    for mode in MODES:
+        core = cores[mode] = build(gemm_program(n, k, m, name))
+        gemm_inputs(core, n, k, m)
+        assert core.run_until(mode=mode) == "halt"
+    a, b = cores.values()
+    ra, rb = state(a), state(b)
+    assert ra[:3] == rb[:3] and np.array_equal(ra[3], rb[3])
+    assert np.array_equal(gemm_result(a, n, m).view(np.uint16), gemm_result(b, n, m).view(np.uint16))
+
+# the loop rewrites its own first instruction after running it once, so the second
+# pass must see the new word whether it was decoded, translated or both
+SMC = """li.i x7, target
+li.i x6, {new}
+li.i x9, 2
+loop:
+target:
+addi.i x5, x5, 1
+addi.i x8, x8, 1
+sw.i x6, 0(x7)
+bne x8, x9, loop
+halt
+"""
+
+@pytest.mark.parametrize("mode", MODES)
+def test_self_modifying_code(mode):
+    new = word("addi.i x5, x5, 100")
+    core = run(SMC.format(new=new), mode)
+    assert core.scalar_regs[5] == 101
+
+# a store patching code further on, in a block that was translated on an earlier pass
+@pytest.mark.parametrize("mode", MODES)
+def test_patch_later_block(mode):
+    new = word("addi.i x5, x5, 100")
+    source = f"""li.i x7, patched
+li.i x6, {new}
+li.i x9, 2
+loop:
+addi.i x8, x8, 1
+jal x1, sub
+sw.i x6, 0(x7)
+bne x8, x9, loop
+halt
+sub:
+patched:
+addi.i x5, x5, 1
+jalr x0, x1, 0
+"""
+    core = run(source, mode)
+    assert core.scalar_regs[5] == 101
+
+# st.m copying a tile of instruction words over 8 instructions of the loop
+@pytest.mark.parametrize("mode", MODES)
+def test_st_m_over_code(mode):
+    tile = np.frombuffer(assembler.assemble("addi.i x5, x5, 100\n" + "nop\n" * 7), dtype='<u4')
+    source = "\n".join(["li.i x7, target", "li.i x10, data", "li.i x11, 8", "li.i x9, 2",
+                        "loop:", "target:", "addi.i x5, x5, 1"] + ["nop"] * 7 +
+                       ["addi.i x8, x8, 1", "ld.m m1, x11, 0[x10]", "st.m m1, x11, 0[x7]", "bne x8, x9, loop", "halt",
+                        ".data", "data:", ".word " + ", ".join(hex(w) for w in tile.tolist())]) + "\n"
+    core = run(source, mode)
+    assert core.scalar_regs[5] == 101
+
+# a store patching an instruction further on in the block that is running, on the first pass
+@pytest.mark.parametrize("mode", MODES)
+def test_patch_same_block(mode):
+    source = f"""li.i x7, target
+li.i x6, {word("addi.i x5, x5, 100")}
+sw.i x6, 0(x7)
+target:
+addi.i x5, x5, 1
+addi.i x8, x8, 1
+halt
+"""
+    core = run(source, mode)
+    assert core.scalar_regs[5] == 100 and core.scalar_regs[8] == 1
+    assert core.retired == run(source, "interp").retired
+
+# st.m patching the rest of the running block
+@pytest.mark.parametrize("mode", MODES)
+def test_st_m_same_block(mode):
+    tile = np.frombuffer(assembler.assemble("addi.i x5, x5, 100\n" + "nop\n" * 7), dtype='<u4')
+    source = "\n".join(["li.i x7, target", "li.i x10, data", "li.i x11, 8",
+                        "ld.m m1, x11, 0[x10]", "st.m m1, x11, 0[x7]",
+                        "target:", "addi.i x5, x5, 1"] + ["nop"] * 7 + ["halt",
+                        ".data", "data:", ".word " + ", ".join(hex(w) for w in tile.tolist())]) + "\n"
+    core = run(source, mode)
+    assert core.scalar_regs[5] == 100